@@ -0,0 +1,327 @@
+"""
+Benchmarks the learners on a set of target grammars, sweeping k and
+the number of sentences observed. Each case runs in a fresh process, so
+that the interned symbols and the peak memory use of one case do not
+affect the others.
+
+Results are saved as JSON and can be compared against a saved
+baseline:
+
+    python benchmarks.py --save baseline.json
+    python benchmarks.py --compare baseline.json
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+from collections import OrderedDict
+from copy import deepcopy
+from multiprocessing import Pool
+from time import time
+
+from nltk.grammar import CFG
+
+import learners
+from imp0 import IMP_GRAMMAR
+from oracles import GrammarText, GrammarOracle, grammar_fingerprint
+
+GRAMMARS = OrderedDict([
+    ("anbn", CFG.fromstring("""
+        S -> 'a' S 'b' | 'a' 'b'
+    """)),
+    ("dyck1", CFG.fromstring("""
+        S -> S S | '(' S ')' | '(' ')'
+    """)),
+    ("dyck2", CFG.fromstring("""
+        S -> S S | '(' S ')' | '(' ')' | '[' S ']' | '[' ']'
+    """)),
+    ("arith", CFG.fromstring("""
+        E -> E '+' E | E '*' E | '(' E ')' | 'x'
+    """)),
+    ("arith_prec", CFG.fromstring("""
+        E -> E '+' T | T
+        T -> T '*' F | F
+        F -> '(' E ')' | 'x' | 'y'
+    """)),
+    ("imp", IMP_GRAMMAR),
+])
+
+LEARNERS = OrderedDict([
+    ("primal", learners.PrimalLearner),
+    ("dual", learners.DualLearner),
+])
+
+DEFAULT_KS = [1, 2]
+DEFAULT_SIZES = [10, 20, 40]
+DEFAULT_MAX_SECONDS = 60.
+
+
+def _peak_memory():
+    """
+    Finds the peak resident memory of this process.
+
+    :rtype: int
+    :return: The peak resident set size, in kilobytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak // 1024
+    return peak
+
+
+def _summarize(grammar_name, learner_name, k, size, status, learner, oracle, latencies,
+               phases, base_memory):
+    last = learner.get_metrics().get_last()
+    counts = last.get_counts() if last is not None else dict()
+    guess = learner.get_curr_guess()
+    cache = oracle.get_cache()
+
+    result = OrderedDict()
+    result["grammar"] = grammar_name
+    result["learner"] = learner_name
+    result["k"] = k
+    result["size"] = size
+    result["status"] = status
+    result["steps"] = len(latencies)
+    result["total_seconds"] = sum(latencies)
+    result["mean_guess_seconds"] = sum(latencies) / max(len(latencies), 1)
+    result["max_guess_seconds"] = max(latencies) if len(latencies) > 0 else 0.
+    result["queries"] = cache.get_hits() + cache.get_misses()
+    result["cache_hits"] = cache.get_hits()
+    result["computed"] = oracle.get_num_computed()
+    result["base_memory_kb"] = base_memory
+    result["peak_memory_kb"] = _peak_memory()
+    result["nonterminals"] = counts.get("nonterminals", 0)
+    result["rules"] = sum(counts.get(name, 0)
+                          for name in ("lexical_rules", "binary_rules", "start_rules"))
+    result["hypothesis"] = grammar_fingerprint(guess) if guess is not None else None
+    result["phases"] = deepcopy(phases)
+    return result
+
+
+def run_case(grammar_name, learner_name, k, sizes, max_seconds=DEFAULT_MAX_SECONDS):
+    """
+    Runs one benchmark case in this process: a learner observes the
+    shortest sentences of a grammar, guessing after each one. Since
+    the sentences always come in the same order, the results for each
+    corpus size are measured along the way.
+
+    :type grammar_name: str
+    :param grammar_name: A key of GRAMMARS
+
+    :type learner_name: str
+    :param learner_name: A key of LEARNERS
+
+    :type k: int
+    :param k: The k of the learner
+
+    :type sizes: list
+    :param sizes: The numbers of sentences after which to measure
+
+    :type max_seconds: float
+    :param max_seconds: If the case has taken this long after a guess,
+        it is stopped and the remaining sizes are marked as timed out
+
+    :rtype: list
+    :return: The measurements for each size
+    """
+    grammar = GRAMMARS[grammar_name]
+    oracle = GrammarOracle(grammar)
+    learner = LEARNERS[learner_name](GrammarText(grammar), oracle, k)
+
+    phases = OrderedDict()
+
+    def add_phases(metrics):
+        for phase, totals in metrics.get_phases().iteritems():
+            phase_totals = phases.setdefault(phase, OrderedDict((n, 0) for n in totals))
+            for name, value in totals.iteritems():
+                phase_totals[name] += value
+
+    learner.get_metrics().add_hook(add_phases)
+
+    base_memory = _peak_memory()
+    latencies = []
+    results = []
+    status = "done"
+    start_time = time()
+    for size in sorted(sizes):
+        while status == "done" and len(latencies) < size:
+            try:
+                guess_start = time()
+                learner.guess()
+                latencies.append(time() - guess_start)
+            except StopIteration:
+                status = "exhausted"
+            if time() - start_time > max_seconds:
+                status = "timed_out"
+
+        results.append(_summarize(grammar_name, learner_name, k, size,
+                                  "done" if len(latencies) == size else status,
+                                  learner, oracle, latencies, phases, base_memory))
+
+    return results
+
+
+def _run_case_star(args):
+    return run_case(*args)
+
+
+def run_benchmarks(grammars=None, learner_names=None, ks=None, sizes=None,
+                   max_seconds=DEFAULT_MAX_SECONDS, verbose=False):
+    """
+    Runs a benchmark case for every combination of grammar, learner
+    and k, each in a fresh process, measuring each size.
+
+    :type grammars: list
+    :param grammars: Keys of GRAMMARS. By default, all of them.
+
+    :type learner_names: list
+    :param learner_names: Keys of LEARNERS. By default, all of them.
+
+    :type ks: list
+    :param ks: Values of k. By default, DEFAULT_KS.
+
+    :type sizes: list
+    :param sizes: Numbers of sentences. By default, DEFAULT_SIZES.
+
+    :type max_seconds: float
+    :param max_seconds: The time limit of each case
+
+    :type verbose: bool
+    :param verbose: If true, a line is printed for each case
+
+    :rtype: OrderedDict
+    :return: A description of the environment and the results of
+        each case
+    """
+    grammars = list(GRAMMARS) if grammars is None else grammars
+    learner_names = list(LEARNERS) if learner_names is None else learner_names
+    ks = DEFAULT_KS if ks is None else ks
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+
+    results = []
+    for grammar_name in grammars:
+        for learner_name in learner_names:
+            for k in ks:
+                pool = Pool(1)
+                try:
+                    args = (grammar_name, learner_name, k, sizes, max_seconds)
+                    case_results = pool.apply(_run_case_star, (args,))
+                finally:
+                    pool.close()
+                    pool.join()
+
+                results.extend(case_results)
+                if verbose:
+                    for result in case_results:
+                        print "{grammar:>10} {learner:>6} k={k} n={size:<4} {status:<9} " \
+                              "{total_seconds:8.2f}s {queries:>8} queries " \
+                              "{peak_memory_kb:>8} KB {rules:>5} rules".format(**result)
+
+    baseline = OrderedDict()
+    baseline["python"] = platform.python_version()
+    baseline["platform"] = platform.platform()
+    baseline["max_seconds"] = max_seconds
+    baseline["results"] = results
+    return baseline
+
+
+def _case_key(result):
+    return result["grammar"], result["learner"], result["k"], result["size"]
+
+
+def compare(baseline, current, tolerance=0.25, min_seconds=0.5):
+    """
+    Compares benchmark results against a baseline. Hypotheses and
+    query counts are deterministic, so any change to them is reported;
+    times and memory are reported when they grow by more than
+    tolerance. Cases that no longer finish are reported, but not cases
+    that now finish where they used to time out.
+
+    :type baseline: dict
+    :param baseline: Results returned by run_benchmarks
+
+    :type current: dict
+    :param current: Results returned by run_benchmarks
+
+    :type tolerance: float
+    :param tolerance: The fraction by which times and memory may grow
+
+    :type min_seconds: float
+    :param min_seconds: Times may also grow by this many seconds, so
+        that noise in short cases is not reported
+
+    :rtype: list
+    :return: A message describing each regression
+    """
+    old_results = dict((_case_key(r), r) for r in baseline["results"])
+    messages = []
+    for result in current["results"]:
+        key = _case_key(result)
+        old = old_results.get(key)
+        if old is None:
+            continue
+
+        name = "{} {} k={} n={}".format(*key)
+        # A case that used to time out and now finishes is not a regression
+        if result["status"] != "done" or old["status"] != "done":
+            if old["status"] == "done":
+                messages.append("{}: status {} -> {}".format(name, old["status"],
+                                                              result["status"]))
+            continue
+
+        if result["hypothesis"] != old["hypothesis"]:
+            messages.append("{}: hypothesis changed ({} -> {} rules)".format(
+                name, old["rules"], result["rules"]))
+        if result["queries"] > old["queries"]:
+            messages.append("{}: queries {} -> {}".format(name, old["queries"], result["queries"]))
+        if result["computed"] > old["computed"]:
+            messages.append("{}: computed queries {} -> {}".format(
+                name, old["computed"], result["computed"]))
+        if result["total_seconds"] > max(old["total_seconds"] * (1 + tolerance),
+                                         old["total_seconds"] + min_seconds):
+            messages.append("{}: time {:.2f}s -> {:.2f}s".format(
+                name, old["total_seconds"], result["total_seconds"]))
+        old_growth = old["peak_memory_kb"] - old["base_memory_kb"]
+        growth = result["peak_memory_kb"] - result["base_memory_kb"]
+        if growth > old_growth * (1 + tolerance) and growth - old_growth > 1024:
+            messages.append("{}: memory growth {} KB -> {} KB".format(name, old_growth, growth))
+
+    return messages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the learners.")
+    parser.add_argument("--grammars", nargs="+", choices=list(GRAMMARS))
+    parser.add_argument("--learners", nargs="+", choices=list(LEARNERS))
+    parser.add_argument("--ks", nargs="+", type=int)
+    parser.add_argument("--sizes", nargs="+", type=int)
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS)
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results to a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.grammars, args.learners, args.ks, args.sizes,
+                             args.max_seconds, verbose=True)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, separators=(",", ": "))
+            f.write("\n")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        messages = compare(baseline, results, args.tolerance, args.min_seconds)
+        for message in messages:
+            print "REGRESSION " + message
+        return 1 if len(messages) > 0 else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
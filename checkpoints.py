@@ -0,0 +1,454 @@
+import cPickle as pickle
+import json
+import mmap
+import os
+import shutil
+import struct
+from array import array
+
+import numpy as np
+
+import learners
+from scl import SYMBOLS
+
+_MANIFEST = "snapshots.jsonl"
+_OFFSET_TYPE = np.dtype("<u8")
+
+
+def encode_objects(objects):
+    """
+    Pickles each of a collection of objects.
+
+    :type objects: iterable
+    :param objects: Picklable objects, such as Productions
+
+    :rtype: list
+    :return: A byte string for each object
+    """
+    return [pickle.dumps(o, pickle.HIGHEST_PROTOCOL) for o in objects]
+
+
+def decode_objects(items):
+    """
+    Unpickles byte strings produced by encode_objects.
+
+    :type items: list
+    :param items: Byte strings
+
+    :rtype: list
+    :return: The objects
+    """
+    return [pickle.loads(item) for item in items]
+
+
+def _encode_context(context):
+    left, right = context
+    return struct.pack("<I", len(left)) + left + right
+
+
+def _decode_context(item):
+    split = 4 + struct.unpack("<I", item[:4])[0]
+    return item[4:split], item[split:]
+
+
+def _common_prefix(saved, items):
+    """
+    Finds how many of the byte strings in a file are the same as the
+    first ones of a list.
+
+    :type saved: list
+    :param saved: The byte strings in a file
+
+    :type items: list
+    :param items: Byte strings
+
+    :rtype: int
+    :return: The length of the longest common prefix of the lists
+    """
+    n = min(len(saved), len(items))
+    if saved[:n] == items[:n]:
+        return n
+
+    i = 0
+    while saved[i] == items[i]:
+        i += 1
+    return i
+
+
+def _write_strings(path, name, items, start=0, append=False):
+    """
+    Writes byte strings to a data file holding their concatenation and
+    an index file holding the offset at which each one ends.
+
+    :type path: str
+    :param path: A directory
+
+    :type name: str
+    :param name: The name of the files, without extension
+
+    :type items: list
+    :param items: Byte strings
+
+    :type start: int
+    :param start: If append is true, the number of byte strings to
+        keep from the files. Anything after them is overwritten.
+
+    :type append: bool
+    :param append: If true, items are added to the files; otherwise
+        the files are replaced
+
+    :rtype: NoneType
+    :return: None
+    """
+    data_name = os.path.join(path, name + ".bin")
+    index_name = os.path.join(path, name + ".idx")
+
+    end = 0
+    if append and start > 0:
+        offsets = np.fromfile(index_name, dtype=_OFFSET_TYPE, count=start)
+        end = int(offsets[-1])
+    else:
+        start = 0
+
+    mode = "r+b" if append and os.path.exists(data_name) else "wb"
+    with open(data_name, mode) as data_file, open(index_name, mode) as index_file:
+        data_file.seek(end)
+        data_file.truncate()
+        index_file.seek(start * _OFFSET_TYPE.itemsize)
+        index_file.truncate()
+
+        offsets = np.empty(len(items), dtype=_OFFSET_TYPE)
+        for i, item in enumerate(items):
+            data_file.write(item)
+            end += len(item)
+            offsets[i] = end
+        offsets.tofile(index_file)
+
+
+def _read_strings(path, name, count=None, use_mmap=True):
+    """
+    Reads byte strings written by _write_strings.
+
+    :type path: str
+    :param path: A directory
+
+    :type name: str
+    :param name: The name of the files, without extension
+
+    :type count: int
+    :param count: If given, the number of byte strings to read
+
+    :type use_mmap: bool
+    :param use_mmap: If true, the files are memory-mapped rather than
+        read
+
+    :rtype: list
+    :return: The byte strings
+    """
+    data_name = os.path.join(path, name + ".bin")
+    index_name = os.path.join(path, name + ".idx")
+
+    offsets = np.fromfile(index_name, dtype=_OFFSET_TYPE,
+                          count=-1 if count is None else count)
+    if len(offsets) == 0:
+        return []
+    if offsets[-1] == 0:
+        return [""] * len(offsets)
+
+    with open(data_name, "rb") as data_file:
+        if use_mmap:
+            data = mmap.mmap(data_file.fileno(), int(offsets[-1]), access=mmap.ACCESS_READ)
+        else:
+            data = data_file.read(int(offsets[-1]))
+
+        ends = offsets.tolist()
+        items = [data[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+        if use_mmap:
+            data.close()
+        return items
+
+
+class Checkpoint(object):
+    """
+    A directory of snapshots of a learner's state, written in a compact
+    binary format that loads without unpickling the learner.
+
+    Interned symbols, the learner's Contexts, the rows of the
+    ObservationTable and the kernels of the learner only ever grow, so
+    they are kept in append-only files shared by all snapshots; each
+    snapshot only writes the entries added since the last one. The
+    rest of the state is written to a directory for each snapshot, with
+    the observation table as .npy files that are memory-mapped when
+    loading.
+
+    A manifest file records each snapshot once it is complete, so a
+    snapshot interrupted while being written is never loaded. Since
+    each snapshot rewrites the observation table, old snapshots should
+    be pruned as new ones are saved.
+
+    Symbols keep the IDs they were first saved with, whatever IDs they
+    have in the process saving a snapshot. The saved IDs are translated
+    to the ones of SYMBOLS when a snapshot is loaded, so it can be
+    loaded, and saved again, in any process.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize with the directory holding the snapshots, which is
+        created if necessary.
+
+        :type path: str
+        :param path: A directory
+        """
+        self._path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def get_path(self):
+        """
+        Public accessor for self._path.
+
+        :rtype: str
+        :return: self._path
+        """
+        return self._path
+
+    def get_snapshots(self):
+        """
+        Reads the manifest.
+
+        :rtype: list
+        :return: A dict describing each complete snapshot, oldest first
+        """
+        manifest_name = os.path.join(self._path, _MANIFEST)
+        if not os.path.exists(manifest_name):
+            return []
+
+        snapshots = []
+        with open(manifest_name, "rb") as manifest:
+            for line in manifest:
+                if line.endswith("\n"):
+                    snapshots.append(json.loads(line))
+        return snapshots
+
+    def _symbol_ids(self, words):
+        """
+        Finds the IDs the symbols of SYMBOLS are saved with. Symbols
+        already in the symbols file keep their saved IDs, and the
+        others are given the next IDs, in order of their IDs in SYMBOLS.
+
+        :type words: list
+        :param words: The symbols in the symbols file, in order of
+            their saved IDs. The new symbols are added to it.
+
+        :rtype: array
+        :return: The saved ID of each symbol in SYMBOLS, or None if
+            every symbol is saved with its ID in SYMBOLS
+        """
+        saved = dict((w, i) for i, w in enumerate(words))
+        ids = array("I")
+        for i in xrange(len(SYMBOLS)):
+            word = SYMBOLS.lookup(i)
+            if word not in saved:
+                saved[word] = len(words)
+                words.append(word)
+            ids.append(saved[word])
+
+        if ids == array("I", xrange(len(ids))):
+            return None
+        return ids
+
+    def save(self, learner):
+        """
+        Writes a new snapshot of a learner.
+
+        The learner may have been loaded from any snapshot, in any
+        process. Its state is written with the IDs its symbols have in
+        the symbols file, and its append-only entries are checked
+        against the ones in the files. If they differ, as they may when
+        an older snapshot was loaded, the files are rewritten from the
+        first difference, and the snapshots that referred to the
+        entries rewritten are deleted.
+
+        :type learner: learners.Learner
+        :param learner: A learner
+
+        :rtype: int
+        :return: The number of the new snapshot
+        """
+        snapshots = self.get_snapshots()
+        counts = snapshots[-1]["counts"] if len(snapshots) > 0 else dict()
+        number = snapshots[-1]["snapshot"] + 1 if len(snapshots) > 0 else 0
+
+        words = decode_objects(self._read_log("symbols", counts, False))
+        num_saved_symbols = len(words)
+        state = learner.get_checkpoint(self._symbol_ids(words))
+        rows, values, known = state.pop("table")
+
+        logs = state.pop("logs")
+        logs["contexts"] = [_encode_context(c) for c in state.pop("contexts")]
+        logs["rows"] = rows
+        sizes = dict((name, len(items)) for name, items in logs.iteritems())
+        sizes["symbols"] = len(words)
+
+        # Only the entries after the ones already in the files are
+        # written. Snapshots referring to entries that are overwritten
+        # are removed from the manifest before the files are changed.
+        starts = dict()
+        for name, items in logs.iteritems():
+            saved = self._read_log(name, counts, True)
+            starts[name] = _common_prefix(saved, items)
+            if starts[name] < len(saved) and starts[name] < len(items):
+                snapshots = [e for e in snapshots if e["counts"].get(name, 0) <= starts[name]]
+        self._replace_snapshots(snapshots)
+
+        # Symbols are never rewritten, since the state was translated
+        # to the IDs they are saved with
+        logs["symbols"] = encode_objects(words)
+        starts["symbols"] = num_saved_symbols
+        for name, items in logs.iteritems():
+            if starts[name] < len(items):
+                _write_strings(self._path, name, items[starts[name]:], start=starts[name],
+                               append=True)
+
+        directory = os.path.join(self._path, "snapshot-{}".format(number))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        strings = state.pop("strings")
+        strings["text"] = encode_objects([learner.get_text()])
+        for name, items in strings.iteritems():
+            _write_strings(directory, name, items)
+
+        arrays = state.pop("arrays")
+        arrays["values"] = values
+        arrays["known"] = known
+        for name, array in arrays.iteritems():
+            np.save(os.path.join(directory, name + ".npy"), np.asarray(array))
+
+        entry = dict(snapshot=number,
+                     attrs=state.pop("attrs"),
+                     counts=sizes,
+                     arrays=sorted(arrays),
+                     strings=sorted(os.path.splitext(f)[0] for f in os.listdir(directory)
+                                    if f.endswith(".idx")))
+
+        with open(os.path.join(self._path, _MANIFEST), "ab") as manifest:
+            manifest.write(json.dumps(entry) + "\n")
+
+        return number
+
+    def _replace_snapshots(self, snapshots):
+        """
+        Replaces the manifest with one listing some of the snapshots,
+        and deletes the others. The manifest is replaced before any
+        directory is deleted, so it never lists a deleted snapshot.
+
+        :type snapshots: list
+        :param snapshots: The entries of the snapshots to keep, as
+            returned by get_snapshots
+
+        :rtype: list
+        :return: The numbers of the deleted snapshots
+        """
+        kept = set(entry["snapshot"] for entry in snapshots)
+        deleted = [entry["snapshot"] for entry in self.get_snapshots()
+                   if entry["snapshot"] not in kept]
+        if len(deleted) == 0:
+            return []
+
+        manifest_name = os.path.join(self._path, _MANIFEST)
+        with open(manifest_name + ".tmp", "wb") as manifest:
+            for entry in snapshots:
+                manifest.write(json.dumps(entry) + "\n")
+        os.rename(manifest_name + ".tmp", manifest_name)
+
+        for number in deleted:
+            shutil.rmtree(os.path.join(self._path, "snapshot-{}".format(number)),
+                          ignore_errors=True)
+        return deleted
+
+    def prune(self, keep):
+        """
+        Deletes all but the latest snapshots. The append-only files
+        are kept, since every snapshot refers to them.
+
+        :type keep: int
+        :param keep: The number of snapshots to keep, at least 1
+
+        :rtype: list
+        :return: The numbers of the deleted snapshots
+        """
+        if keep < 1:
+            raise ValueError("At least one snapshot must be kept")
+
+        snapshots = self.get_snapshots()
+        if len(snapshots) <= keep:
+            return []
+        return self._replace_snapshots(snapshots[-keep:])
+
+    def load(self, text, oracle, snapshot=None, use_mmap=True):
+        """
+        Restores a learner from a snapshot.
+
+        :type text: oracles.Text
+        :param text: The text to continue learning from. If None, the
+            text saved in the snapshot is restored, so learning resumes
+            where it stopped.
+
+        :type oracle: oracles.Oracle
+        :param oracle: An oracle
+
+        :type snapshot: int
+        :param snapshot: The number of the snapshot to load, as returned
+            by save. By default, the latest one is loaded.
+
+        :type use_mmap: bool
+        :param use_mmap: If true, files are memory-mapped rather than
+            read. The observation table is mapped copy-on-write.
+
+        :rtype: learners.Learner
+        :return: The learner
+        """
+        snapshots = self.get_snapshots()
+        if len(snapshots) == 0:
+            raise IOError("No snapshots in {}".format(self._path))
+        if snapshot is None:
+            entry = snapshots[-1]
+        else:
+            entries = [e for e in snapshots if e["snapshot"] == snapshot]
+            if len(entries) == 0:
+                raise IOError("No snapshot {} in {}".format(snapshot, self._path))
+            entry = entries[0]
+        counts = entry["counts"]
+
+        directory = os.path.join(self._path, "snapshot-{}".format(entry["snapshot"]))
+        mmap_mode = "c" if use_mmap else None
+        arrays = dict((name, np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode))
+                      for name in entry["arrays"])
+
+        state = dict(attrs=entry["attrs"],
+                     logs=dict((name, self._read_log(name, counts, use_mmap))
+                               for name in counts),
+                     strings=dict((name, _read_strings(directory, name, use_mmap=use_mmap))
+                                  for name in entry["strings"]),
+                     arrays=arrays)
+        state["table"] = (state["logs"].pop("rows"), arrays.pop("values"), arrays.pop("known"))
+        state["contexts"] = [_decode_context(item) for item in state["logs"].pop("contexts")]
+        state["symbols"] = decode_objects(state["logs"].pop("symbols"))
+
+        if text is None:
+            if "text" not in state["strings"]:
+                raise ValueError("Snapshot {} has no saved text".format(entry["snapshot"]))
+            text = decode_objects(state["strings"]["text"])[0]
+
+        cls = getattr(learners, entry["attrs"]["class"])
+        learner = cls(text, oracle, entry["attrs"]["k"])
+        learner.set_checkpoint(state)
+        return learner
+
+    def _read_log(self, name, counts, use_mmap):
+        if counts.get(name, 0) == 0:
+            return []
+        return _read_strings(self._path, name, counts[name], use_mmap)
@@ -0,0 +1,53 @@
+from time import time
+
+
+class Timer(object):
+    """
+    A stopwatch. Time is only counted between calls to start and stop,
+    and accumulates until reset is called.
+    """
+
+    def __init__(self):
+        self._start_time = None
+        self._elapsed = 0.
+
+    def start(self):
+        """
+        Starts counting time.
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._start_time = time()
+
+    def stop(self):
+        """
+        Stops counting time.
+
+        :rtype: NoneType
+        :return: None
+        """
+        if self._start_time is not None:
+            self._elapsed += time() - self._start_time
+            self._start_time = None
+
+    def reset(self):
+        """
+        Stops the timer and sets the time counted to 0.
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._start_time = None
+        self._elapsed = 0.
+
+    def elapsed(self):
+        """
+        Finds the time counted so far.
+
+        :rtype: float
+        :return: The number of seconds counted
+        """
+        if self._start_time is None:
+            return self._elapsed
+        return self._elapsed + time() - self._start_time
@@ -1,11 +1,30 @@
-import cPickle as pickle
-from os.path import isfile
 from time import time
 
 from nltk.grammar import CFG
 from nltk.parse.generate import generate
 
+from checkpoints import Checkpoint
 from learners import PrimalLearner
+from oracles import GrammarText, GrammarOracle, StoredOracle
+
+# The number of snapshots kept by run_trial
+KEEP_SNAPSHOTS = 3
+
+
+IMP_GRAMMAR = CFG.fromstring("""
+        Pgm -> Id ',' Pgm | Stmt
+        Stmt -> Block | Id '=' Aexp ';' | Stmt Stmt
+        Stmt -> 'if(' Bexp ')' Block 'else' Block
+        Stmt -> 'while(' Bexp ')' Block
+        Block -> '{}' | '{' Stmt '}'
+        Bexp -> 'true' | Aexp '<=' Aexp | '!' Bexp
+        Bexp -> Bexp '&&' Bexp | Bexp '||' Bexp | '(' Bexp ')'
+        Aexp -> Int | Id | Aexp '+' Aexp | Aexp '-' Aexp
+        Aexp -> Aexp '*' Aexp | Aexp '/' Aexp | '(' Aexp ')'
+        Id -> 'a' | 'b' 
+        Bool -> 'true' | 'false'
+        Int -> '0' | '1' 
+    """)
 
 
 def test_import():
@@ -17,27 +36,17 @@ def code_to_string(code):
 
 
 def create_learner():
-    if isfile("imp_learner.p"):
-        learner_file = open("imp_learner.p", "rb")
-        learner = pickle.load(learner_file)
-        learner_file.close()
-        return learner
+    grammar = IMP_GRAMMAR
+
+    # Answers are kept across runs
+    oracle = StoredOracle(GrammarOracle(grammar), "imp_oracle.sqlite")
+
+    # Resumes from the text position saved with the checkpoint
+    checkpoint = Checkpoint("imp_checkpoint")
+    if len(checkpoint.get_snapshots()) > 0:
+        return checkpoint.load(None, oracle)
     else:
-        grammar = CFG.fromstring("""
-                Pgm -> Id ',' Pgm | Stmt
-                Stmt -> Block | Id '=' Aexp ';' | Stmt Stmt
-                Stmt -> 'if(' Bexp ')' Block 'else' Block
-                Stmt -> 'while(' Bexp ')' Block
-                Block -> '{}' | '{' Stmt '}'
-                Bexp -> 'true' | Aexp '<=' Aexp | '!' Bexp
-                Bexp -> Bexp '&&' Bexp | Bexp '||' Bexp | '(' Bexp ')'
-                Aexp -> Int | Id | Aexp '+' Aexp | Aexp '-' Aexp
-                Aexp -> Aexp '*' Aexp | Aexp '/' Aexp | '(' Aexp ')'
-                Id -> 'a' | 'b' 
-                Bool -> 'true' | 'false'
-                Int -> '0' | '1' 
-            """)
-        return PrimalLearner.from_grammar(grammar, k=1)
+        return PrimalLearner(GrammarText(grammar), oracle, 1)
 
 
 def run_trial(learner):
@@ -46,9 +55,9 @@ def run_trial(learner):
     end_time = time()
     print "Time Elapsed: {:.2f} seconds".format(end_time - start_time)
 
-    # learner_file = open("imp_learner.p", "wb")
-    # pickle.dump(learner, learner_file)
-    # learner_file.close()
+    checkpoint = Checkpoint("imp_checkpoint")
+    checkpoint.save(learner)
+    checkpoint.prune(KEEP_SNAPSHOTS)
 
 
 def run_trials(learner):
@@ -64,4 +73,5 @@ def test_learner(learner):
         print code_to_string(p)
 
 
-print "what's going on "
+if __name__ == "__main__":
+    print "what's going on "
@@ -1,13 +1,233 @@
 import cPickle as pickle
 from abc import ABCMeta, abstractmethod
+from array import array
 from itertools import combinations
+from time import time
 
-from nltk.grammar import CFG, Nonterminal, Production
-from nltk.parse import ChartParser
+from nltk.grammar import Nonterminal, Production
 
 import oracles
 from display_helpers import Timer
-from scl import Sentence, SentenceSet, Context, ContextSet
+from metrics import MetricsRecorder
+from observations import ObservationTable
+from recognizers import CYKRecognizer
+from scl import SYMBOLS, Sentence, SentenceSet, Context, ContextIndex, BitContextSet, SubsetIndex, \
+    ids_from_mask, mask_from_ids, mask_to_bytes, mask_from_bytes
+
+
+def _new_subsets(old, new, k):
+    """
+    Generates the subsets of size at most k of old and new together
+    that contain at least one element of new.
+
+    :type old: list
+    :param old: Elements seen before
+
+    :type new: list
+    :param new: New elements
+
+    :type k: int
+    :param k: The largest subset size
+
+    :rtype: generator
+    :return: The subsets, as tuples
+    """
+    for i in range(1, k + 1):
+        for j in range(1, i + 1):
+            for new_part in combinations(new, j):
+                for old_part in combinations(old, i - j):
+                    yield new_part + old_part
+
+
+def _pair_id(i, j):
+    """
+    Numbers the pairs of kernel indices, so that the pairs of the first
+    n kernels are numbered 0 to n ** 2 - 1. Pairs whose larger index is
+    m are numbered m ** 2 to (m + 1) ** 2 - 1.
+
+    :type i: int
+    :param i: The index of the left kernel
+
+    :type j: int
+    :param j: The index of the right kernel
+
+    :rtype: int
+    :return: The ID of the pair
+    """
+    m = max(i, j)
+    if i == m:
+        return m * m + j
+    return m * m + m + 1 + i
+
+
+def _pair_of(pair):
+    """
+    Finds the pair of kernel indices numbered by _pair_id.
+
+    :type pair: int
+    :param pair: The ID of the pair
+
+    :rtype: tuple
+    :return: The indices of the left and right kernels
+    """
+    m = int(pair ** 0.5)
+    while m * m > pair:
+        m -= 1
+    while (m + 1) * (m + 1) <= pair:
+        m += 1
+
+    rest = pair - m * m
+    if rest <= m:
+        return m, rest
+    return rest - m - 1, m
+
+
+def _saved_id(word, ids):
+    """
+    Finds the ID a symbol is saved with.
+
+    :type word: str
+    :param word: An interned symbol
+
+    :type ids: array
+    :param ids: The saved ID of each symbol in SYMBOLS, or None if
+        symbols are saved with their IDs in SYMBOLS
+
+    :rtype: int
+    :return: The saved ID of word
+    """
+    symbol = SYMBOLS.intern(word)
+    return symbol if ids is None else ids[symbol]
+
+
+def _encode_rules(rules, names, ids=None):
+    """
+    Encodes rules in binary normal form as int triples (lhs, rhs_1,
+    rhs_2). Nonterminals are encoded as 1 plus their position in names,
+    and the start symbol, or a missing right-hand side symbol, as 0.
+    Terminals are encoded as -1 minus their saved symbol ID.
+
+    :type rules: iterable
+    :param rules: Productions
+
+    :type names: list
+    :param names: The names of the nonterminals other than the start
+        symbol
+
+    :type ids: array
+    :param ids: The saved ID of each symbol in SYMBOLS, or None if
+        symbols are saved with their IDs in SYMBOLS
+
+    :rtype: str
+    :return: The triples, as an array of ints
+    """
+    codes = dict((name, i + 1) for i, name in enumerate(names))
+
+    def encode(symbol):
+        if isinstance(symbol, Nonterminal):
+            return codes.get(symbol.symbol(), 0)
+        return -1 - _saved_id(symbol, ids)
+
+    triples = array("i")
+    for rule in rules:
+        rhs = [encode(symbol) for symbol in rule.rhs()]
+        triples.extend([encode(rule.lhs())] + rhs + [0] * (2 - len(rhs)))
+    return triples.tostring()
+
+
+def _decode_rules(data, names, start_symbol, words):
+    """
+    Decodes rules encoded by _encode_rules.
+
+    :type data: str
+    :param data: The triples, as an array of ints
+
+    :type names: list
+    :param names: The names of the nonterminals other than the start
+        symbol
+
+    :type start_symbol: Nonterminal
+    :param start_symbol: The start symbol
+
+    :type words: list
+    :param words: The symbols that were interned when the rules were
+        encoded, in order of their IDs
+
+    :rtype: list
+    :return: The Productions
+    """
+    nonterminals = [start_symbol] + [Nonterminal(name) for name in names]
+
+    def decode(code):
+        if code >= 0:
+            return nonterminals[code]
+        return words[-1 - code]
+
+    triples = array("i")
+    triples.fromstring(data)
+    rules = []
+    for i in xrange(0, len(triples), 3):
+        lhs, rhs_1, rhs_2 = triples[i:i + 3]
+        rhs = [decode(code) for code in (rhs_1, rhs_2) if code != 0]
+        rules.append(Production(decode(lhs), rhs))
+    return rules
+
+
+def _symbol_ids(words):
+    """
+    Interns the symbols of a saved state, finding the IDs they have in
+    this process. They only differ from the saved IDs if other symbols
+    were interned before the state was loaded.
+
+    :type words: list
+    :param words: The symbols that were interned when the state was
+        saved, in order of their IDs
+
+    :rtype: array
+    :return: The ID of each saved symbol in SYMBOLS, or None if every
+        symbol has its saved ID
+    """
+    ids = array("I", [SYMBOLS.intern(w) for w in words])
+    if ids == array("I", xrange(len(ids))):
+        return None
+    return ids
+
+
+def _translate_codes(codes, ids):
+    """
+    Translates the interned ints of a saved Sentence or side of a
+    Context to the IDs of the symbols in this process.
+
+    :type codes: str
+    :param codes: A byte string of interned ints
+
+    :type ids: array
+    :param ids: The ID of each saved symbol, as found by _symbol_ids,
+        or the saved ID of each symbol in SYMBOLS when saving. If None,
+        the codes are kept as they are.
+
+    :rtype: str
+    :return: The translated byte string
+    """
+    if ids is None:
+        return codes
+
+    symbols = array("I")
+    symbols.fromstring(codes)
+    return array("I", [ids[s] for s in symbols]).tostring()
+
+
+def _new_learner(cls):
+    """
+    Creates an empty learner while unpickling one.
+
+    :type cls: type
+    :param cls: A subclass of Learner
+
+    :rtype: Learner
+    :return: An uninitialized learner
+    """
+    return cls.__new__(cls)
 
 
 class Learner(object):
@@ -21,33 +241,362 @@ class Learner(object):
         self._text = None
         self._oracle = None
         self._curr_guess = None
+        self._recognizer = None
+        self._metrics = None
+        self._name_ctr = 0
+        self._verbose = False
 
     def __iter__(self):
         return self
 
+    def __reduce__(self):
+        # The state refers to symbols by their interned IDs, so the
+        # symbol table is saved along with it
+        state = self.get_checkpoint()
+        state["symbols"] = [SYMBOLS.lookup(i) for i in xrange(len(SYMBOLS))]
+        return _new_learner, (type(self),), (self._text, self._oracle, state)
+
+    def __setstate__(self, state):
+        text, oracle, checkpoint = state
+        self.__init__(text, oracle, checkpoint["attrs"]["k"])
+        self.set_checkpoint(checkpoint)
+
+    def _new_name(self):
+        """
+        Generates a unique name.
+
+        :rtype: int
+        :return: A unique int
+        """
+        self._name_ctr += 1
+        return str(self._name_ctr - 1)
+
+    def _context_set(self, mask):
+        """
+        Instantiates a BitContextSet over this learner's ContextIndex.
+
+        :type mask: long
+        :param mask: A bitmask over the IDs of the index
+
+        :rtype: BitContextSet
+        :return: A BitContextSet
+        """
+        return BitContextSet.from_mask(mask, self._context_index)
+
+    def _log(self, message):
+        if self._verbose:
+            print message
+
+    def _count_rules(self):
+        """
+        Counts the nonterminals and rules of each kind in the current
+        guess. This is done whenever the rules change, so that updates
+        with nothing to do can record the counts without going through
+        the rules.
+
+        :rtype: NoneType
+        :return: None
+        """
+        counts = dict(lexical_rules=0, binary_rules=0, start_rules=0)
+        for p in self._productions:
+            if p.lhs() == self._start_symbol:
+                counts["start_rules"] += 1
+            elif len(p.rhs()) == 1:
+                counts["lexical_rules"] += 1
+            else:
+                counts["binary_rules"] += 1
+        counts["nonterminals"] = len(set(p.lhs() for p in self._productions) -
+                                     {self._start_symbol})
+        self._rule_counts = counts
+
+    def _record_counts(self, status, **counts):
+        """
+        Records the state of the guess in the metrics of the current
+        update.
+
+        :type status: str
+        :param status: "unchanged" if there was nothing to update,
+            "kept" if the guess was checked but could not change, or
+            "rebuilt"
+
+        :param counts: Further counts to record
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._metrics.set_count("step", self._num_steps)
+        self._metrics.set_count("status", status)
+        self._metrics.set_count("data", len(self._data))
+        self._metrics.set_count("substrings", len(self._substrings))
+        self._metrics.set_count("contexts", len(self._contexts))
+        self._metrics.set_count("kernels", len(self._kernels))
+        for name in ["nonterminals", "lexical_rules", "binary_rules", "start_rules"]:
+            self._metrics.set_count(name, self._rule_counts[name])
+        for name in sorted(counts):
+            self._metrics.set_count(name, counts[name])
+
     def next(self):
         return self.guess()
 
-    @abstractmethod
-    def guess(self):
+    def guess(self, verbose=None):
         """
         Makes a guess based on the next observation.
         Updates self._curr_guess.
 
+        :type verbose: bool
+        :param verbose: If given, whether information will be printed
+
         :rtype: CFG
         :returns: The next guess
         """
-        return None
+        if verbose is not None:
+            self._verbose = verbose
+
+        self.observe(next(self._text))
+        return self.rebuild()
+
+    def guess_many(self, sentences, every=None, seconds=None, verbose=None):
+        """
+        Makes a guess based on a batch of observations. The guess is
+        rebuilt once all the sentences have been observed, and also
+        along the way if every or seconds is given.
+
+        While a batch is being observed, sentences are checked against
+        the last guess that was built.
+
+        :type sentences: iterable
+        :param sentences: Sequences of words
+
+        :type every: int
+        :param every: If given, rebuild after this many sentences. It
+            must be at least 1.
+
+        :type seconds: float
+        :param seconds: If given, rebuild once this many seconds have
+            passed since the last rebuild
+
+        :type verbose: bool
+        :param verbose: If given, whether information will be printed
+
+        :rtype: CFG
+        :returns: The guess after all the sentences
+        """
+        if every is not None and every < 1:
+            raise ValueError("every must be at least 1, not {}".format(every))
+        if verbose is not None:
+            self._verbose = verbose
+
+        num_observed = 0
+        last_rebuild = time()
+        for sentence in sentences:
+            self.observe(sentence)
+            num_observed += 1
+            if every is not None and num_observed % every == 0 or \
+                    seconds is not None and time() - last_rebuild >= seconds:
+                # The CFG is only built for the last guess
+                self._update_guess()
+                self._metrics.finish()
+                last_rebuild = time()
+
+        return self.rebuild()
+
+    @abstractmethod
+    def observe(self, sentence):
+        """
+        Adds a sentence to the observations, without updating the
+        guess.
+
+        :type sentence: tuple
+        :param sentence: A sequence of words
+
+        :rtype: bool
+        :return: Whether the sentence had not been seen before
+        """
+        return False
+
+    def rebuild(self):
+        """
+        Updates the guess with the observations made since the last
+        rebuild, and builds it as a CFG.
+
+        :rtype: CFG
+        :returns: The new guess
+        """
+        self._update_guess()
+        guess = self.get_curr_guess()
+        self._metrics.finish()
+        return guess
+
+    @abstractmethod
+    def _update_guess(self):
+        """
+        Updates the recognizer's rule tables with the observations made
+        since the last rebuild, and records the counts of the update.
+        The CFG is left to get_curr_guess.
+
+        :rtype: NoneType
+        :return: None
+        """
+        pass
+
+    def get_metrics(self):
+        """
+        Public accessor for self._metrics. Hooks and an output file for
+        the metrics of each update are registered with it.
+
+        :rtype: metrics.MetricsRecorder
+        :return: self._metrics
+        """
+        return self._metrics
+
+    def get_text(self):
+        """
+        Public accessor for self._text.
+
+        :rtype: oracles.Text
+        :return: The text this learner reads from
+        """
+        return self._text
 
     def get_curr_guess(self):
         """
-        Public accessor for the current guess.
+        Public accessor for the current guess. The CFG is only built
+        from the recognizer's rule tables when it is asked for. The
+        time it takes is measured as the "cfg" phase of the current
+        update, or of the next one if it is asked for between updates.
 
         :rtype: CFG
         :return: self._curr_guess
         """
+        if self._curr_guess is None and self._recognizer is not None:
+            self._metrics.start_phase("cfg")
+            self._curr_guess = self._recognizer.to_cfg()
+            self._metrics.end_phase()
         return self._curr_guess
 
+    def save_as(self, filename, verbose=False):
+        """
+        Saves this learner to a file with cPickle. For large states,
+        checkpoints.Checkpoint is much more compact and faster to load.
+
+        :type filename: str
+        :param filename: The name of the file to save to
+
+        :type verbose: bool
+        :param verbose: If true, information will be printed
+
+        :return: None
+        """
+        f = open(filename, "wb")
+        pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+
+    def get_checkpoint(self, symbol_ids=None):
+        """
+        Collects the state of this learner in the form written by
+        checkpoints.Checkpoint. The text and the oracle are not part of
+        the state. Sentences, Contexts and terminals are given as the
+        IDs their symbols are saved with.
+
+        :type symbol_ids: array
+        :param symbol_ids: The saved ID of each symbol in SYMBOLS. If
+            None, symbols are saved with their IDs in SYMBOLS.
+
+        :rtype: dict
+        :return: A dict with the following entries.
+            attrs: JSON-serializable attributes
+            logs: Lists of byte strings that only ever grow
+            strings: Other lists of byte strings
+            arrays: NumPy arrays
+            table: The state of the ObservationTable, with the
+                substring of each row as a byte string
+            contexts: The Contexts of the learner's ContextIndex, in
+                order of their IDs, as pairs of byte strings. They also
+                only ever grow.
+        """
+        attrs = {"class": type(self).__name__,
+                 "k": self._k,
+                 "num_steps": self._num_steps,
+                 "name_ctr": self._name_ctr,
+                 "verbose": self._verbose,
+                 "built": self._recognizer is not None}
+
+        logs = {"nonterminals": [self._nonterminals[k].symbol() for k in self._kernels]}
+
+        def codes(items):
+            return [_translate_codes(s.get_codes(), symbol_ids) for s in items]
+
+        names = logs["nonterminals"]
+        terminals = array("I", [_saved_id(t, symbol_ids) for t in self._terminals])
+        strings = {"data": codes(self._data),
+                   "substrings": codes(self._substrings),
+                   "new_subs": codes(self._new_subs),
+                   "contexts": [mask_to_bytes(self._contexts.get_mask())],
+                   "new_contexts": [mask_to_bytes(self._new_contexts.get_mask())],
+                   "terminals": [terminals.tostring()],
+                   "productions": [_encode_rules(self._productions, names, symbol_ids)]}
+
+        rows, values, known = self._table.get_state()
+        contexts = [tuple(_translate_codes(side, symbol_ids) for side in c.get_codes())
+                    for c in self._context_index.get_contexts()]
+        return {"attrs": attrs, "logs": logs, "strings": strings, "arrays": dict(),
+                "table": (codes(rows), values, known), "contexts": contexts}
+
+    def set_checkpoint(self, state):
+        """
+        Restores the state collected by get_checkpoint. Sentences and
+        Contexts are given as byte strings of the interned ints they
+        had when the state was saved, along with the symbols that were
+        interned then, so that they are translated to the IDs of this
+        process.
+
+        :type state: dict
+        :param state: The state of a learner of the same class, whose
+            table rows are byte strings and whose contexts are pairs of
+            byte strings. An extra entry, symbols, lists the interned
+            symbols in order of their saved IDs.
+
+        :rtype: NoneType
+        :return: None
+        """
+        attrs = state["attrs"]
+        strings = state["strings"]
+        self._num_steps = attrs["num_steps"]
+        self._name_ctr = attrs["name_ctr"]
+        self._verbose = attrs["verbose"]
+
+        words = state["symbols"]
+        ids = _symbol_ids(words)
+
+        def sentences(items):
+            return [Sentence.from_codes(_translate_codes(c, ids)) for c in items]
+
+        self._context_index = ContextIndex()
+        for left, right in state["contexts"]:
+            self._context_index.index(Context.from_codes(_translate_codes(left, ids),
+                                                         _translate_codes(right, ids)))
+        self._table = ObservationTable(self._oracle, self._context_index)
+        rows, values, known = state["table"]
+        self._table.set_state(sentences(rows), values, known)
+
+        self._data = SentenceSet(sentences(strings["data"]))
+        self._substrings = SentenceSet(sentences(strings["substrings"]))
+        self._new_subs = sentences(strings["new_subs"])
+        self._contexts = self._context_set(mask_from_bytes(strings["contexts"][0]))
+        self._new_contexts = self._context_set(mask_from_bytes(strings["new_contexts"][0]))
+        terminals = array("I")
+        terminals.fromstring(strings["terminals"][0])
+        self._terminals = set(words[t] for t in terminals)
+        names = state["logs"]["nonterminals"]
+        self._productions = set(_decode_rules(strings["productions"][0], names, self._start_symbol,
+                                              words))
+        self._count_rules()
+
+        self._curr_guess = None
+        self._recognizer = None
+        if attrs["built"]:
+            self._recognizer = CYKRecognizer(self._start_symbol, self._productions)
+
 
 class PrimalLearner(Learner):
     """
@@ -75,66 +624,89 @@ class PrimalLearner(Learner):
         # Algorithm state
         self._data = SentenceSet([])
         self._substrings = SentenceSet([])
-        self._contexts = ContextSet([])
-        self._eliminated_rules = set()
+        self._context_index = ContextIndex()
+        self._contexts = BitContextSet([], self._context_index)
+        self._table = ObservationTable(oracle, self._context_index)
+        self._metrics = MetricsRecorder(oracle)
         self._num_steps = 0
 
-        self._verbose = False
+        # Observations not yet reflected in the guess
+        self._new_subs = []
+        self._new_contexts = BitContextSet([], self._context_index)
+
+        # Maps the IDs of pairs of kernels, as numbered by _pair_id, to
+        # bitmasks of the contexts that have been checked against their
+        # concatenation: those found to accept it and those found to
+        # reject it. Contexts are only checked when some rule depends
+        # on them. The contexts found to reject each pair are also
+        # indexed by the ID of the pair.
+        self._pairs = dict()
+        self._rejections = SubsetIndex()
 
         # Current guess
-        self._name_ctr = 0
         self._kernels = []
         self._nonterminals = dict()
         self._nt_contexts = dict()
+        self._nt_index = SubsetIndex()
         self._terminals = set()
+
+        # Maps the bitmask of the contexts of each class of nonterminals
+        # to its rules: the terminals it rewrites to, a bitmask of the
+        # IDs of the pairs of kernels it rewrites to, and whether the
+        # start symbol rewrites to it. The representative of the class
+        # of each kernel is kept to name the rules.
+        self._class_rules = dict()
+        self._reps = []
         self._productions = set()
         self._start_symbol = Nonterminal("start")
+        self._count_rules()
         self._curr_guess = None
-        self._curr_guess_parser = None
+        self._recognizer = None
 
-    def _new_name(self):
+    def _new_kernels(self, old_subs, new_subs):
         """
-        Generates a unique name.
+        Generates the kernels of size at most k that contain at least
+        one new substring. Kernels made only of old substrings already
+        have nonterminals, so they are never generated. The substrings
+        are taken in order of their words rather than of their interned
+        codes, so that the kernels are named the same way in every
+        process.
 
-        :rtype: int
-        :return: A unique int
-        """
-        self._name_ctr += 1
-        return str(self._name_ctr - 1)
+        :type old_subs: list
+        :param old_subs: The substrings seen before this observation
 
-    def _log(self, message):
-        if self._verbose:
-            print message
+        :type new_subs: list
+        :param new_subs: The substrings added by this observation
 
-    def guess(self, verbose=None):
+        :rtype: generator
+        :return: The new kernels, as SentenceSets
         """
-        Makes a guess based on the next observation.
-        Updates self._curr_guess.
+        old_subs = sorted(old_subs, key=Sentence.get_words)
+        new_subs = sorted(new_subs, key=Sentence.get_words)
+        for subset in _new_subsets(old_subs, new_subs, self._k):
+            yield SentenceSet(subset)
 
-        :rtype: CFG
-        :returns: The next guess
+    def observe(self, sentence):
         """
-        if verbose is not None:
-            self._verbose = verbose
+        Adds a sentence to the data, along with its contexts and, if
+        the current guess does not generate it, its substrings.
+
+        :type sentence: tuple
+        :param sentence: A sequence of words
 
-        sentence = Sentence(next(self._text))
+        :rtype: bool
+        :return: Whether the sentence had not been seen before
+        """
+        sentence = Sentence(sentence)
         self._num_steps += 1
         self._log("String {}: {}".format(self._num_steps, sentence))
 
         if sentence in self._data:
             self._log("String already seen")
-            return self._curr_guess
+            return False
 
-        # Info from previous guess
         num_contexts = len(self._contexts)
         num_subs = len(self._substrings)
-        if self._curr_guess is not None:
-            num_nts = len(set(p.lhs() for p in self._curr_guess.productions())) - 1
-        else:
-            num_nts = 0
-
-        total_timer = Timer()
-        total_timer.start()
 
         # Update data and terminals
         words = sentence.get_words()
@@ -142,170 +714,363 @@ class PrimalLearner(Learner):
         self._terminals.update(set(words))
 
         # Update contexts
+        self._metrics.start_phase("contexts")
         self._log("Updating contexts...")
         inds = range(0, len(words) + 1)
-        contexts = [Context(words[:i], words[j:]) for i in inds for j in inds[i:]]
-        self._contexts.update(ContextSet(contexts))
+        contexts = [sentence.context(i, j) for i in inds for j in inds[i:]]
+        new_contexts = BitContextSet(contexts, self._context_index).difference(self._contexts)
+        self._contexts.update(new_contexts)
+        self._new_contexts.update(new_contexts)
         self._log("{} new contexts added".format(len(self._contexts) - num_contexts))
 
         # Update substrings
+        self._metrics.start_phase("substrings")
         self._log("Updating substrings...")
 
         is_new_sentence = True
-        if self._curr_guess_parser is not None:
-            try:
-                parses = self._curr_guess_parser.parse(words)
-                is_new_sentence = len(list(parses)) == 0
-            except:
-                is_new_sentence = True
+        if self._recognizer is not None:
+            is_new_sentence = not self._recognizer.recognize(words)
 
         if is_new_sentence:
-            subs = [Sentence(words[i:j]) for i in inds for j in inds[i:]]
-            self._substrings.update(SentenceSet(subs))
+            subs = [sentence.substring(i, j) for i in inds for j in inds[i:]]
+            new_subs = list(SentenceSet(subs).difference(self._substrings))
+            self._substrings.update(SentenceSet(new_subs))
+            self._new_subs.extend(new_subs)
             self._log("{} new substrings added".format(len(self._substrings) - num_subs))
         else:
             self._log("Sentence already generated by current guess")
 
+        self._metrics.end_phase()
+        return True
+
+    def _update_guess(self):
+        """
+        Updates the rule tables with the observations made since the
+        last rebuild.
+
+        Nonterminals with the same contexts have the same rules, so
+        they form a class represented by the oldest of them. The rules
+        of a class are kept until its contexts change: only the classes
+        whose contexts are new are checked against the rules, and only
+        the pairs of kernels with a new kernel are checked for every
+        class. A new class is only checked against the old pairs that
+        the classes its nonterminals came from rewrite to, or, if its
+        nonterminals are all new, against the old pairs that none of
+        its contexts has rejected.
+
+        :rtype: NoneType
+        :return: None
+        """
+        new_subs = self._new_subs
+        new_contexts = self._new_contexts
+        if self._recognizer is not None and len(new_subs) == 0 and len(new_contexts) == 0:
+            self._record_counts("unchanged", changed_classes=0, checked_pairs=0)
+            return
+
+        self._new_subs = []
+        self._new_contexts = BitContextSet([], self._context_index)
+        old_subs = list(self._substrings.difference(SentenceSet(new_subs)))
+
+        total_timer = Timer()
+        total_timer.start()
+
         # Construct the nonterminals
+        self._metrics.start_phase("nonterminals")
         self._log("Constructing nonterminals...")
 
-        kernels = set()
-        for i in range(1, self._k + 1):
-            subsets = [SentenceSet(j) for j in combinations(self._substrings, i)]
-            kernels.update(subsets)
-
-        for kernel in kernels:
-            if kernel not in self._nonterminals:
-                nt_name = self._new_name()
-                contexts = self._oracle.restr_right_triangle(kernel, self._contexts)
-                nt = Nonterminal(nt_name)
-                self._nonterminals[kernel] = nt
-                self._nt_contexts[nt] = contexts
-
-        # Get a set of nonterminals with unique contexts
-        self._log("Removing equivalent nonterminals...")
-        context_nts = {con: nt for nt, con in self._nt_contexts.iteritems()}
-        self._log("{} nonterminals removed".format(len(kernels) - len(context_nts)))
-        self._log("{} new nonterminals constructed".format(len(context_nts) - num_nts))
-
-        # Construct the rules
-        self._log("Constructing rules...")
-        self._productions = set()
-        timer = Timer()
+        # Maps the nonterminals that gain contexts to their old contexts
+        grown = dict()
+        if len(new_contexts) > 0:
+            for nt_id, kernel in enumerate(self._kernels):
+                contexts = self._table.accepting(kernel, new_contexts)
+                if len(contexts) > 0:
+                    nt_contexts = self._nt_contexts[self._nonterminals[kernel]]
+                    grown[nt_id] = nt_contexts.get_mask()
+                    nt_contexts.update(contexts)
+                    self._nt_index.add(nt_id, contexts)
+
+        num_old_kernels = len(self._kernels)
+        for kernel in self._new_kernels(old_subs, new_subs):
+            nt_name = self._new_name()
+            contexts = self._table.accepting(kernel, self._contexts)
+            nt = Nonterminal(nt_name)
+            self._nt_index.add(len(self._kernels), contexts)
+            self._kernels.append(kernel)
+            self._nonterminals[kernel] = nt
+            self._nt_contexts[nt] = contexts
+
+        # Group the nonterminals into classes with the same contexts,
+        # represented by the oldest nonterminal of each
+        classes = dict()
+        reps = []
+        for nt_id, kernel in enumerate(self._kernels):
+            contexts = self._nt_contexts[self._nonterminals[kernel]].get_mask()
+            reps.append(classes.setdefault(contexts, nt_id))
+        changed = dict((contexts, rep) for contexts, rep in classes.iteritems()
+                       if contexts not in self._class_rules)
 
-        # Lexical rules
-        timer.start()
+        # If no class has new contexts and every nonterminal keeps its
+        # representative, the rules cannot change
+        if self._recognizer is not None and len(changed) == 0 and reps == self._reps:
+            total_timer.stop()
+            elapsed = total_timer.elapsed()
+            self._log("Nonterminals unchanged; keeping current guess ({:.2f} secs)".format(elapsed))
+            self._record_counts("kept", changed_classes=0, checked_pairs=0)
+            return
+
+        self._log("{} classes of nonterminals, {} of them new".format(len(classes), len(changed)))
+        rep_mask = mask_from_ids(classes.values())
+        changed_mask = mask_from_ids(changed.values())
+
+        # Lexical rules, for the new classes and the new terminals
+        self._metrics.start_phase("lexical_rules")
+        new_terminals = set(s.get_words()[0] for s in new_subs if len(s) == 1)
+        lexical = dict()
         for t in self._terminals:
             t_kernel = SentenceSet([Sentence([t])])
-            t_nt = self._nonterminals[t_kernel]
-            t_contexts = self._nt_contexts[t_nt]
+            t_contexts = self._nt_contexts[self._nonterminals[t_kernel]]
+            nt_ids = rep_mask if t in new_terminals else changed_mask
+            for nt_id in ids_from_mask(self._nt_index.subsets_of(t_contexts, nt_ids)):
+                lexical.setdefault(nt_id, set()).add(t)
 
-            for contexts, nt in context_nts.iteritems():
-                rule = Production(nt, [t])
-                if rule in self._productions:
-                    continue
-                if rule in self._eliminated_rules:
-                    continue
+        elapsed = self._metrics.end_phase()
+        self._log("Checked lexical rules ({:.2f} secs)".format(elapsed))
 
-                if contexts.issubset(t_contexts):
-                    self._productions.add(rule)
-                else:
-                    self._eliminated_rules.add(rule)
-
-        timer.stop()
-        num_lex = len(self._productions)
-        self._log("{} lexical rules ({:.2f} secs)".format(num_lex, timer.elapsed()))
-
-        # Binary rules
-        timer.reset()
-        timer.start()
-        for kernel_l in self._nonterminals:
-            for kernel_r in self._nonterminals:
-                kernel_rhs = kernel_l + kernel_r
-                sents_rhs = list(kernel_rhs.intersection(self._substrings))
-
-                inds = range(len(sents_rhs) / self._k + 1)
-                kers_rhs = [sents_rhs[self._k * i:self._k * (i + 1)] for i in inds]
-                kers_rhs = [SentenceSet(k) for k in kers_rhs if len(k) > 0]
-
-                nts_rhs = [self._nonterminals[k] for k in kers_rhs]
-                contexts_nts_rhs = [self._nt_contexts[nt] for nt in nts_rhs]
-                if len(contexts_nts_rhs) > 0:
-                    contexts_rhs = contexts_nts_rhs[0].intersection(*contexts_nts_rhs)
-                else:
-                    contexts_rhs = self._contexts
-
-                # Membership queries
-                new_strs_rhs = kernel_rhs.difference(SentenceSet(sents_rhs))
-                new_contexts_rhs = self._oracle.restr_right_triangle(new_strs_rhs, contexts_rhs)
-                contexts_rhs.intersection_update(new_contexts_rhs)
-
-                # Building the rules
-                for contexts, nt in context_nts.iteritems():
-                    nt_l = context_nts[self._nt_contexts[self._nonterminals[kernel_l]]]
-                    nt_r = context_nts[self._nt_contexts[self._nonterminals[kernel_r]]]
-                    rule = Production(nt, [nt_l, nt_r])
-                    if rule in self._productions:
-                        continue
-                    if rule in self._eliminated_rules:
-                        continue
-
-                    if contexts.issubset(contexts_rhs):
-                        self._productions.add(rule)
-                    else:
-                        self._eliminated_rules.add(rule)
-
-        timer.stop()
-        num_bin = len(self._productions) - num_lex
-        self._log("{} binary rules ({:.2f} secs)".format(num_bin, timer.elapsed()))
-
-        # Start rules
-        timer.reset()
-        timer.start()
-        for contexts, nt in context_nts.iteritems():
-            rule = Production(self._start_symbol, [nt])
-            if rule in self._productions:
-                continue
-            if rule in self._eliminated_rules:
-                continue
-            if Context([], []) in contexts:
-                self._productions.add(rule)
+        # Binary rules, for the new classes and the new pairs of kernels
+        self._metrics.start_phase("binary_rules")
+        num_old_pairs = num_old_kernels ** 2
+        old_pairs = (1L << num_old_pairs) - 1
+        old_classes = dict()
+        for nt_id, contexts in grown.iteritems():
+            new_class = self._nt_contexts[self._nonterminals[self._kernels[nt_id]]].get_mask()
+            old_classes.setdefault(new_class, set()).add(contexts)
+
+        worklist = dict((pair, rep_mask) for pair in xrange(num_old_pairs,
+                                                             len(self._kernels) ** 2))
+        for contexts, rep in changed.iteritems():
+            if contexts in old_classes:
+                candidates = old_pairs
+                for old_class in old_classes[contexts]:
+                    candidates &= self._class_rules[old_class][1]
             else:
-                self._eliminated_rules.add(rule)
+                rejected = self._rejections.intersecting(self._context_set(contexts), old_pairs)
+                candidates = old_pairs & ~rejected
+            for pair in ids_from_mask(candidates):
+                worklist[pair] = worklist.get(pair, 0L) | (1L << rep)
+
+        binary = dict()
+        for pair, nt_ids in worklist.iteritems():
+            for nt_id in ids_from_mask(self._check_pair(pair, nt_ids)):
+                binary[nt_id] = binary.get(nt_id, 0L) | (1L << pair)
+        num_checked = len(worklist)
 
-        timer.stop()
-        num_start = len(self._productions) - num_lex - num_bin
-        self._log("{} start rules ({:.2f} secs)".format(num_start, timer.elapsed()))
+        elapsed = self._metrics.end_phase()
+        self._log("Checked binary rules for {} pairs ({:.2f} secs)".format(num_checked, elapsed))
 
-        # Construct the grammar
-        self._curr_guess = CFG(self._start_symbol, self._productions)
-        self._curr_guess_parser = ChartParser(self._curr_guess)
+        # Start rules, for the new classes
+        self._metrics.start_phase("start_rules")
+        empty_id = self._context_index.find(Context([], []))
+        start = set(rep for contexts, rep in changed.iteritems()
+                    if empty_id is not None and (contexts >> empty_id) & 1 == 1)
+
+        elapsed = self._metrics.end_phase()
+        self._log("Checked start rules ({:.2f} secs)".format(elapsed))
+
+        # Update the grammar
+        self._metrics.start_phase("grammar")
+        class_rules = dict()
+        for contexts, rep in classes.iteritems():
+            if contexts in changed:
+                terminals, pairs, is_start = frozenset(), 0L, rep in start
+            else:
+                terminals, pairs, is_start = self._class_rules[contexts]
+            class_rules[contexts] = (terminals.union(lexical.get(rep, ())),
+                                     pairs | binary.get(rep, 0L), is_start)
+        self._class_rules = class_rules
+        self._reps = reps
+
+        self._productions = self._collect_rules(classes)
+        self._count_rules()
+        if self._recognizer is None:
+            self._recognizer = CYKRecognizer(self._start_symbol)
+        self._recognizer.update(self._productions)
+        self._curr_guess = None
 
         total_timer.stop()
         elapsed = total_timer.elapsed()
-        num_rules = len(self._curr_guess.productions())
+        num_rules = len(self._recognizer)
         self._log("Constructed grammar with {} rules ({:.2f} secs)".format(num_rules, elapsed))
 
-        return self._curr_guess
+        self._record_counts("rebuilt", changed_classes=len(changed), checked_pairs=num_checked)
 
-    def save_as(self, filename, verbose=False):
+    def _collect_rules(self, classes):
         """
-        Saves this PrimalLearner object to a file.
+        Names the rules of each class of nonterminals after the
+        representatives of the classes.
 
-        :type filename: str
-        :param filename: The name of the file to save to
+        :type classes: dict
+        :param classes: Maps the contexts of each class to the index of
+            its representative
 
-        :type verbose: bool
-        :param verbose: If true, information will be printed
+        :rtype: set
+        :return: The Productions of the guess
+        """
+        nts = [self._nonterminals[self._kernels[rep]] for rep in self._reps]
+        productions = set()
+        for contexts, (terminals, pairs, is_start) in self._class_rules.iteritems():
+            nt = nts[classes[contexts]]
+            productions.update(Production(nt, [t]) for t in terminals)
+            for pair in ids_from_mask(pairs):
+                i, j = _pair_of(pair)
+                productions.add(Production(nt, [nts[i], nts[j]]))
+            if is_start:
+                productions.add(Production(self._start_symbol, [nt]))
+        return productions
+
+    def _check_pair(self, pair, nt_ids):
+        """
+        Finds the nonterminals whose contexts all accept the
+        concatenation of a pair of kernels.
+
+        Contexts are only checked against the concatenation when some
+        nonterminal that has not been ruled out has them, in batches
+        that double in size, oldest contexts first. A nonterminal is
+        ruled out as soon as one of its contexts rejects the
+        concatenation, so most contexts are never checked. The results
+        are kept for later rebuilds.
+
+        :type pair: int
+        :param pair: The ID of the pair of kernels, as numbered by
+            _pair_id
+
+        :type nt_ids: long
+        :param nt_ids: A bitmask of the nonterminals to consider
 
+        :rtype: long
+        :return: A bitmask of the nonterminals in nt_ids that can
+            rewrite to the concatenation
+        """
+        accepted, rejected = self._pairs.get(pair, (0L, 0L))
+        if rejected != 0:
+            nt_ids &= ~self._nt_index.intersecting(self._context_set(rejected), nt_ids)
+
+        i, j = _pair_of(pair)
+        batch_size = 1
+        while nt_ids != 0:
+            passing = self._nt_index.subsets_of(self._context_set(accepted), nt_ids)
+            unchecked = self._nt_index.union_of(nt_ids & ~passing) & ~accepted
+            if unchecked == 0:
+                break
+
+            batch = 0L
+            for _ in xrange(batch_size):
+                if unchecked == 0:
+                    break
+                lowest = unchecked & -unchecked
+                batch |= lowest
+                unchecked ^= lowest
+            batch_size *= 2
+
+            contexts = self._table.accepting_product(self._kernels[i], self._kernels[j],
+                                                     self._context_set(batch))
+            accepted |= contexts.get_mask()
+            refuted = batch & ~contexts.get_mask()
+            if refuted != 0:
+                rejected |= refuted
+                self._rejections.add(pair, self._context_set(refuted))
+                nt_ids &= ~self._nt_index.intersecting(self._context_set(refuted), nt_ids)
+
+        self._pairs[pair] = (accepted, rejected)
+        return nt_ids
+
+    def get_checkpoint(self, symbol_ids=None):
+        """
+        Collects the state of this learner in the form written by
+        checkpoints.Checkpoint. Kernels are saved as rows of the
+        ObservationTable.
+
+        :type symbol_ids: array
+        :param symbol_ids: The saved ID of each symbol in SYMBOLS, as
+            described in Learner.get_checkpoint
+
+        :rtype: dict
+        :return: The state, as described in Learner.get_checkpoint
+        """
+        state = super(PrimalLearner, self).get_checkpoint(symbol_ids)
+        state["logs"]["kernels"] = [array("I", sorted(self._table.get_row(s) for s in k)).tostring()
+                                    for k in self._kernels]
+
+        strings = state["strings"]
+        strings["nt_contexts"] = [mask_to_bytes(self._nt_contexts[self._nonterminals[k]].get_mask())
+                                  for k in self._kernels]
+
+        pairs = sorted(self._pairs.iteritems())
+        strings["pair_ids"] = [array("I", [pair for pair, _ in pairs]).tostring()]
+        strings["pair_accepted"] = [mask_to_bytes(accepted) for _, (accepted, _) in pairs]
+        strings["pair_rejected"] = [mask_to_bytes(rejected) for _, (_, rejected) in pairs]
+
+        classes = sorted(self._class_rules.iteritems())
+        strings["class_contexts"] = [mask_to_bytes(contexts) for contexts, _ in classes]
+        strings["class_terminals"] = [
+            array("I", sorted(_saved_id(t, symbol_ids) for t in terminals)).tostring()
+            for _, (terminals, _, _) in classes]
+        strings["class_pairs"] = [mask_to_bytes(rules[1]) for _, rules in classes]
+        strings["class_start"] = [array("B", [rules[2] for _, rules in classes]).tostring()]
+        return state
+
+    def set_checkpoint(self, state):
+        """
+        Restores the state collected by get_checkpoint.
+
+        :type state: dict
+        :param state: The state of a PrimalLearner
+
+        :rtype: NoneType
         :return: None
         """
-        f = open(filename, "wb")
-        parser = self._curr_guess_parser
-        self._curr_guess_parser = None
-        pickle.dump(self, filename)
-        self._curr_guess_parser = parser
-        f.close()
+        super(PrimalLearner, self).set_checkpoint(state)
+        logs = state["logs"]
+        strings = state["strings"]
+
+        self._kernels = []
+        self._nonterminals = dict()
+        self._nt_contexts = dict()
+        self._nt_index = SubsetIndex()
+        classes = dict()
+        self._reps = []
+        for nt_id, codes in enumerate(logs["kernels"]):
+            rows = array("I")
+            rows.fromstring(codes)
+            kernel = self._table.get_sentences(mask_from_ids(rows.tolist()))
+            nt = Nonterminal(logs["nonterminals"][nt_id])
+            contexts = self._context_set(mask_from_bytes(strings["nt_contexts"][nt_id]))
+            self._nt_index.add(nt_id, contexts)
+            self._kernels.append(kernel)
+            self._nonterminals[kernel] = nt
+            self._nt_contexts[nt] = contexts
+            self._reps.append(classes.setdefault(contexts.get_mask(), nt_id))
+
+        pair_ids = array("I")
+        pair_ids.fromstring(strings["pair_ids"][0])
+        self._pairs = dict()
+        self._rejections = SubsetIndex()
+        for pair, accepted, rejected in zip(pair_ids, strings["pair_accepted"],
+                                            strings["pair_rejected"]):
+            self._pairs[pair] = (mask_from_bytes(accepted), mask_from_bytes(rejected))
+            if self._pairs[pair][1] != 0:
+                self._rejections.add(pair, self._context_set(self._pairs[pair][1]))
+
+        words = state["symbols"]
+        start = array("B")
+        start.fromstring(strings["class_start"][0])
+        self._class_rules = dict()
+        for contexts, codes, pairs, is_start in zip(strings["class_contexts"],
+                                                    strings["class_terminals"],
+                                                    strings["class_pairs"], start):
+            terminals = array("I")
+            terminals.fromstring(codes)
+            self._class_rules[mask_from_bytes(contexts)] = (
+                frozenset(words[t] for t in terminals), mask_from_bytes(pairs), is_start == 1)
 
     @staticmethod
     def from_grammar(grammar, k):
@@ -324,3 +1089,442 @@ class PrimalLearner(Learner):
         text = oracles.GrammarText(grammar)
         oracle = oracles.GrammarOracle(grammar)
         return PrimalLearner(text, oracle, k)
+
+    @staticmethod
+    def from_command(text, command, k, num_workers=4):
+        """
+        Instantiate a PrimalLearner whose membership queries are answered
+        by an external command, as described in oracles.CommandOracle.
+
+        :type text: oracles.Text
+        :param text: A text
+
+        :type command: list
+        :param command: The program to run and its arguments
+
+        :type k: int
+        :param k: The grammar learned will have the k-FKP.
+
+        :type num_workers: int
+        :param num_workers: The number of processes running command
+
+        :rtype: PrimalLearner
+        :return: A PrimalLearner
+        """
+        oracle = oracles.CommandOracle(command, num_workers=num_workers)
+        return PrimalLearner(text, oracle, k)
+
+
+class DualLearner(Learner):
+    """
+        Implementation of the dual algorithm of Yoshinaka (2011).
+        Nonterminals are indexed by sets of at most k contexts, and
+        each one generates the substrings accepted by all of its
+        contexts.
+    """
+
+    def __init__(self, text, oracle, k):
+        """
+        Initialize from a Text and an Oracle.
+
+        :type text: oracles.Text
+        :param text: A text
+
+        :type oracle: oracles.Oracle
+        :param oracle: An oracle
+
+        :type k: int
+        :param k: The grammar learned will have the k-FCP.
+        """
+        super(DualLearner, self).__init__()
+        self._text = text
+        self._oracle = oracle
+        self._k = k
+
+        # Algorithm state
+        self._data = SentenceSet([])
+        self._substrings = SentenceSet([])
+        self._context_index = ContextIndex()
+        self._contexts = BitContextSet([], self._context_index)
+        self._table = ObservationTable(oracle, self._context_index)
+        self._metrics = MetricsRecorder(oracle)
+        self._num_steps = 0
+
+        # Observations not yet reflected in the guess
+        self._new_subs = []
+        self._new_contexts = BitContextSet([], self._context_index)
+
+        # Maps pairs of closures of nonterminals to the contexts
+        # accepting the concatenations of their substrings, and a
+        # bitmask of the kernels contained in those contexts
+        self._pairs = dict()
+
+        # Current guess
+        self._kernels = []
+        self._kernel_index = SubsetIndex()
+        self._nonterminals = dict()
+        self._nt_strings = dict()
+        self._terminals = set()
+
+        # Maps the closure of each class of nonterminals to the
+        # terminals it rewrites to. The representative of the class of
+        # each kernel is kept to name the rules, along with a bitmask of
+        # the kernels containing the empty context.
+        self._class_terminals = dict()
+        self._reps = []
+        self._start_kernels = 0L
+        self._productions = set()
+        self._start_symbol = Nonterminal("start")
+        self._count_rules()
+        self._curr_guess = None
+        self._recognizer = None
+
+    def observe(self, sentence):
+        """
+        Adds a sentence to the data, along with its substrings and, if
+        the current guess does not generate it, its contexts.
+
+        :type sentence: tuple
+        :param sentence: A sequence of words
+
+        :rtype: bool
+        :return: Whether the sentence had not been seen before
+        """
+        sentence = Sentence(sentence)
+        self._num_steps += 1
+        self._log("String {}: {}".format(self._num_steps, sentence))
+
+        if sentence in self._data:
+            self._log("String already seen")
+            return False
+
+        num_contexts = len(self._contexts)
+        num_subs = len(self._substrings)
+
+        # Update data and terminals
+        words = sentence.get_words()
+        self._data.add(sentence)
+        self._terminals.update(set(words))
+
+        # Update substrings
+        self._metrics.start_phase("substrings")
+        self._log("Updating substrings...")
+        inds = range(0, len(words) + 1)
+        subs = [sentence.substring(i, j) for i in inds for j in inds[i:]]
+        new_subs = list(SentenceSet(subs).difference(self._substrings))
+        self._substrings.update(SentenceSet(new_subs))
+        self._new_subs.extend(new_subs)
+        self._log("{} new substrings added".format(len(self._substrings) - num_subs))
+
+        # Update contexts
+        self._metrics.start_phase("contexts")
+        self._log("Updating contexts...")
+
+        is_new_sentence = True
+        if self._recognizer is not None:
+            is_new_sentence = not self._recognizer.recognize(words)
+
+        if is_new_sentence:
+            contexts = [sentence.context(i, j) for i in inds for j in inds[i:]]
+            new_contexts = BitContextSet(contexts, self._context_index).difference(self._contexts)
+            self._contexts.update(new_contexts)
+            self._new_contexts.update(new_contexts)
+            self._log("{} new contexts added".format(len(self._contexts) - num_contexts))
+        else:
+            self._log("Sentence already generated by current guess")
+
+        self._metrics.end_phase()
+        return True
+
+    def _update_guess(self):
+        """
+        Updates the rule tables with the observations made since the
+        last rebuild.
+
+        Nonterminals with the same closure have the same rules, so they
+        form a class represented by the oldest of them. This includes
+        the nonterminals whose closure is empty: no terminal rule
+        applies to them, but every nonterminal rewrites to any pair
+        containing them, since no string of K has to be checked.
+        The lexical rules of a class are kept until its closure
+        changes, and the rules for a pair of classes are only checked
+        against the new contexts and kernels unless one of the classes
+        is new.
+
+        :rtype: NoneType
+        :return: None
+        """
+        new_subs = self._new_subs
+        new_contexts = self._new_contexts
+        if self._recognizer is not None and len(new_subs) == 0 and len(new_contexts) == 0:
+            self._record_counts("unchanged", changed_classes=0, checked_pairs=0)
+            return
+
+        self._new_subs = []
+        self._new_contexts = BitContextSet([], self._context_index)
+        old_contexts = list(self._contexts.difference(new_contexts))
+
+        total_timer = Timer()
+        total_timer.start()
+
+        # Construct the nonterminals
+        self._metrics.start_phase("nonterminals")
+        self._log("Constructing nonterminals...")
+
+        # The cells of the new substrings are filled as the closures of
+        # the kernels need them
+        self._table.add_rows(new_subs)
+
+        num_old_kernels = len(self._kernels)
+        empty_id = self._context_index.find(Context([], []))
+        for kernel in _new_subsets(old_contexts, list(new_contexts), self._k):
+            kernel = BitContextSet(kernel, self._context_index)
+            kernel_id = len(self._kernels)
+            if empty_id is not None and (kernel.get_mask() >> empty_id) & 1 == 1:
+                self._start_kernels |= 1L << kernel_id
+            nt = Nonterminal(self._new_name())
+            self._kernel_index.add(kernel_id, kernel)
+            self._kernels.append(kernel)
+            self._nonterminals[kernel] = nt
+
+        # The closure of each kernel within the substrings only changes
+        # when substrings are added
+        if len(new_subs) > 0:
+            updated_kernels = self._kernels
+        else:
+            updated_kernels = self._kernels[num_old_kernels:]
+
+        for kernel in updated_kernels:
+            self._nt_strings[self._nonterminals[kernel]] = self._table.accepted_rows(kernel)
+
+        # Group the nonterminals into classes by closure, represented by
+        # the oldest nonterminal of each
+        classes = dict()
+        reps = []
+        for kernel_id, kernel in enumerate(self._kernels):
+            strings = self._nt_strings[self._nonterminals[kernel]]
+            reps.append(classes.setdefault(strings, kernel_id))
+        changed = set(strings for strings in classes if strings not in self._class_terminals)
+
+        # If there are no new contexts, no class is new and every
+        # nonterminal keeps its representative, the rules cannot change
+        if self._recognizer is not None and len(new_contexts) == 0 and len(changed) == 0 and \
+                reps == self._reps:
+            total_timer.stop()
+            elapsed = total_timer.elapsed()
+            self._log("Nonterminals unchanged; keeping current guess ({:.2f} secs)".format(elapsed))
+            self._record_counts("kept", changed_classes=0, checked_pairs=0)
+            return
+
+        self._log("{} classes of nonterminals, {} of them new".format(len(classes), len(changed)))
+
+        # Lexical rules, for the new classes. The rows of the terminals
+        # never change, so neither do the rules of the other classes.
+        self._metrics.start_phase("lexical_rules")
+        rows = [(t, self._table.get_row(Sentence([t]))) for t in self._terminals]
+        class_terminals = dict()
+        for strings in classes:
+            if strings in changed:
+                class_terminals[strings] = frozenset(t for t, row in rows
+                                                     if (strings >> row) & 1 == 1)
+            else:
+                class_terminals[strings] = self._class_terminals[strings]
+
+        elapsed = self._metrics.end_phase()
+        self._log("Checked lexical rules ({:.2f} secs)".format(elapsed))
+
+        # Binary rules, for the pairs of classes with a new class, and
+        # for the new contexts and kernels
+        self._metrics.start_phase("binary_rules")
+        new_ids = self._kernel_index.get_keys() >> num_old_kernels << num_old_kernels
+        pairs = dict()
+        num_checked = 0
+        for strings_l in classes:
+            for strings_r in classes:
+                state = self._pairs.get((strings_l, strings_r))
+                if state is not None and len(new_contexts) == 0:
+                    pairs[(strings_l, strings_r)] = state
+                    continue
+
+                num_checked += 1
+                left = self._table.get_sentences(strings_l)
+                right = self._table.get_sentences(strings_r)
+                if state is None:
+                    contexts_rhs = self._table.accepting_product(left, right, self._contexts)
+                    passing = self._kernel_index.subsets_of(contexts_rhs)
+                else:
+                    contexts_rhs, passing = state
+                    contexts = self._table.accepting_product(left, right, new_contexts)
+                    contexts_rhs = contexts_rhs.union(contexts)
+                    passing |= self._kernel_index.subsets_of(contexts_rhs, new_ids)
+                pairs[(strings_l, strings_r)] = (contexts_rhs, passing)
+
+        elapsed = self._metrics.end_phase()
+        self._log("Checked binary rules for {} pairs ({:.2f} secs)".format(num_checked, elapsed))
+
+        # Update the grammar
+        self._metrics.start_phase("grammar")
+        self._class_terminals = class_terminals
+        self._pairs = pairs
+        self._reps = reps
+
+        self._productions = self._collect_rules(classes)
+        self._count_rules()
+        if self._recognizer is None:
+            self._recognizer = CYKRecognizer(self._start_symbol)
+        self._recognizer.update(self._productions)
+        self._curr_guess = None
+
+        total_timer.stop()
+        elapsed = total_timer.elapsed()
+        num_rules = len(self._recognizer)
+        self._log("Constructed grammar with {} rules ({:.2f} secs)".format(num_rules, elapsed))
+
+        self._record_counts("rebuilt", changed_classes=len(changed), checked_pairs=num_checked)
+
+    def _collect_rules(self, classes):
+        """
+        Names the rules of each class of nonterminals after the
+        representatives of the classes.
+
+        :type classes: dict
+        :param classes: Maps the closure of each class to the index of
+            its representative
+
+        :rtype: set
+        :return: The Productions of the guess
+        """
+        nts = [self._nonterminals[self._kernels[rep]] for rep in self._reps]
+        productions = set()
+        for strings, terminals in self._class_terminals.iteritems():
+            productions.update(Production(nts[classes[strings]], [t]) for t in terminals)
+
+        for (strings_l, strings_r), (_, passing) in self._pairs.iteritems():
+            rhs = [nts[classes[strings_l]], nts[classes[strings_r]]]
+            productions.update(Production(nts[kernel_id], rhs)
+                               for kernel_id in ids_from_mask(passing))
+
+        productions.update(Production(self._start_symbol, [nts[kernel_id]])
+                           for kernel_id in ids_from_mask(self._start_kernels))
+        return productions
+
+    def get_checkpoint(self, symbol_ids=None):
+        """
+        Collects the state of this learner in the form written by
+        checkpoints.Checkpoint. Classes of nonterminals are saved as
+        their closures.
+
+        :type symbol_ids: array
+        :param symbol_ids: The saved ID of each symbol in SYMBOLS, as
+            described in Learner.get_checkpoint
+
+        :rtype: dict
+        :return: The state, as described in Learner.get_checkpoint
+        """
+        state = super(DualLearner, self).get_checkpoint(symbol_ids)
+        state["logs"]["kernels"] = [mask_to_bytes(k.get_mask()) for k in self._kernels]
+
+        strings = state["strings"]
+        strings["nt_strings"] = [mask_to_bytes(self._nt_strings[self._nonterminals[k]])
+                                 for k in self._kernels]
+        strings["start_kernels"] = [mask_to_bytes(self._start_kernels)]
+
+        pairs = sorted(self._pairs.iteritems())
+        strings["pair_left"] = [mask_to_bytes(l) for (l, _), _ in pairs]
+        strings["pair_right"] = [mask_to_bytes(r) for (_, r), _ in pairs]
+        strings["pair_contexts"] = [mask_to_bytes(v[0].get_mask()) for _, v in pairs]
+        strings["pair_passing"] = [mask_to_bytes(v[1]) for _, v in pairs]
+
+        classes = sorted(self._class_terminals.iteritems())
+        strings["class_strings"] = [mask_to_bytes(s) for s, _ in classes]
+        strings["class_terminals"] = [
+            array("I", sorted(_saved_id(t, symbol_ids) for t in terminals)).tostring()
+            for _, terminals in classes]
+        return state
+
+    def set_checkpoint(self, state):
+        """
+        Restores the state collected by get_checkpoint.
+
+        :type state: dict
+        :param state: The state of a DualLearner
+
+        :rtype: NoneType
+        :return: None
+        """
+        super(DualLearner, self).set_checkpoint(state)
+        logs = state["logs"]
+        strings = state["strings"]
+
+        self._kernels = []
+        self._kernel_index = SubsetIndex()
+        self._nonterminals = dict()
+        self._nt_strings = dict()
+        classes = dict()
+        self._reps = []
+        for kernel_id, codes in enumerate(logs["kernels"]):
+            kernel = self._context_set(mask_from_bytes(codes))
+            nt = Nonterminal(logs["nonterminals"][kernel_id])
+            nt_strings = mask_from_bytes(strings["nt_strings"][kernel_id])
+            self._kernel_index.add(kernel_id, kernel)
+            self._kernels.append(kernel)
+            self._nonterminals[kernel] = nt
+            self._nt_strings[nt] = nt_strings
+            self._reps.append(classes.setdefault(nt_strings, kernel_id))
+        self._start_kernels = mask_from_bytes(strings["start_kernels"][0])
+
+        self._pairs = dict()
+        for values in zip(strings["pair_left"], strings["pair_right"],
+                          strings["pair_contexts"], strings["pair_passing"]):
+            left, right, contexts, passing = [mask_from_bytes(v) for v in values]
+            self._pairs[(left, right)] = (self._context_set(contexts), passing)
+
+        words = state["symbols"]
+        self._class_terminals = dict()
+        for nt_strings, codes in zip(strings["class_strings"], strings["class_terminals"]):
+            terminals = array("I")
+            terminals.fromstring(codes)
+            self._class_terminals[mask_from_bytes(nt_strings)] = frozenset(words[t]
+                                                                           for t in terminals)
+
+    @staticmethod
+    def from_grammar(grammar, k):
+        """
+        Instantiate a DualLearner from a grammar.
+
+        :type grammar: CFG
+        :param grammar: A grammar
+
+        :type k: int
+        :param k: The grammar learned will have the k-FCP.
+
+        :rtype: DualLearner
+        :return: A DualLearner
+        """
+        text = oracles.GrammarText(grammar)
+        oracle = oracles.GrammarOracle(grammar)
+        return DualLearner(text, oracle, k)
+
+    @staticmethod
+    def from_command(text, command, k, num_workers=4):
+        """
+        Instantiate a DualLearner whose membership queries are answered
+        by an external command, as described in oracles.CommandOracle.
+
+        :type text: oracles.Text
+        :param text: A text
+
+        :type command: list
+        :param command: The program to run and its arguments
+
+        :type k: int
+        :param k: The grammar learned will have the k-FCP.
+
+        :type num_workers: int
+        :param num_workers: The number of processes running command
+
+        :rtype: DualLearner
+        :return: A DualLearner
+        """
+        oracle = oracles.CommandOracle(command, num_workers=num_workers)
+        return DualLearner(text, oracle, k)
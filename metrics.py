@@ -0,0 +1,265 @@
+import json
+from collections import OrderedDict
+
+from display_helpers import Timer
+
+
+class GuessMetrics(object):
+    """
+    Measurements of one update of a learner's guess. For each phase of
+    the update, it records the time spent, the membership queries made,
+    how many of them were answered by the cache, and how many were
+    computed by the oracle. It also records counts describing the
+    learner's state after the update.
+    """
+
+    def __init__(self):
+        self._phases = OrderedDict()
+        self._counts = OrderedDict()
+
+    def add_phase(self, phase, duration, queries, cache_hits, computed):
+        """
+        Adds measurements to a phase. Phases measured more than once,
+        such as those of observations in a batch, are added up.
+
+        :type phase: str
+        :param phase: The name of the phase
+
+        :type duration: float
+        :param duration: The number of seconds spent
+
+        :type queries: int
+        :param queries: The number of membership queries
+
+        :type cache_hits: int
+        :param cache_hits: The number of queries answered by the cache
+
+        :type computed: int
+        :param computed: The number of queries answered by the oracle
+
+        :rtype: NoneType
+        :return: None
+        """
+        totals = self._phases.setdefault(phase, OrderedDict(
+            [("duration", 0.), ("queries", 0), ("cache_hits", 0), ("computed", 0)]))
+        totals["duration"] += duration
+        totals["queries"] += queries
+        totals["cache_hits"] += cache_hits
+        totals["computed"] += computed
+
+    def set_count(self, name, value):
+        """
+        Records a count.
+
+        :type name: str
+        :param name: The name of the count
+
+        :type value: int
+        :param value: The count
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._counts[name] = value
+
+    def get_phases(self):
+        """
+        Public accessor for self._phases.
+
+        :rtype: OrderedDict
+        :return: The measurements of each phase, in the order in which
+            the phases were first measured
+        """
+        return self._phases
+
+    def get_counts(self):
+        """
+        Public accessor for self._counts.
+
+        :rtype: OrderedDict
+        :return: The counts
+        """
+        return self._counts
+
+    def get_duration(self):
+        """
+        Adds up the time spent in all phases.
+
+        :rtype: float
+        :return: The number of seconds spent
+        """
+        return sum(p["duration"] for p in self._phases.itervalues())
+
+    def to_dict(self):
+        """
+        Converts these metrics to a JSON-serializable dict.
+
+        :rtype: OrderedDict
+        :return: The counts, with the phases under the key "phases"
+        """
+        record = OrderedDict(self._counts)
+        record["duration"] = self.get_duration()
+        record["phases"] = self._phases
+        return record
+
+
+class MetricsRecorder(object):
+    """
+    Measures the phases of a learner's updates. Once an update is
+    finished, its GuessMetrics are passed to every registered hook and,
+    if an output file is set, written to it as a line of JSON.
+
+    Hooks and the open output file are not pickled; the output file is
+    reopened for appending when needed.
+    """
+
+    def __init__(self, oracle):
+        """
+        Initialize with the oracle whose queries are counted.
+
+        :type oracle: oracles.Oracle
+        :param oracle: An oracle
+        """
+        self._oracle = oracle
+        self._hooks = []
+        self._filename = None
+        self._file = None
+        self._current = GuessMetrics()
+        self._last = None
+
+        self._phase = None
+        self._timer = Timer()
+        self._oracle_counts = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_hooks"] = []
+        state["_file"] = None
+        return state
+
+    def add_hook(self, hook):
+        """
+        Registers a function to be called with the GuessMetrics of
+        each update.
+
+        :type hook: function
+        :param hook: A function taking a GuessMetrics
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Unregisters a function registered with add_hook.
+
+        :type hook: function
+        :param hook: A registered function
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._hooks.remove(hook)
+
+    def set_output(self, filename):
+        """
+        Sets the JSON lines file the metrics are appended to.
+
+        :type filename: str
+        :param filename: The name of the file, or None to stop writing
+            metrics
+
+        :rtype: NoneType
+        :return: None
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._filename = filename
+
+    def get_last(self):
+        """
+        Public accessor for self._last.
+
+        :rtype: GuessMetrics
+        :return: The metrics of the last finished update, or None
+        """
+        return self._last
+
+    def _read_oracle(self):
+        cache = self._oracle.get_cache()
+        return cache.get_hits(), cache.get_misses(), self._oracle.get_num_computed()
+
+    def start_phase(self, phase):
+        """
+        Ends the current phase, if any, and starts measuring another.
+
+        :type phase: str
+        :param phase: The name of the phase
+
+        :rtype: NoneType
+        :return: None
+        """
+        self.end_phase()
+        self._phase = phase
+        self._oracle_counts = self._read_oracle()
+        self._timer.reset()
+        self._timer.start()
+
+    def end_phase(self):
+        """
+        Ends the current phase, if any.
+
+        :rtype: float
+        :return: The number of seconds spent in the phase, or 0 if no
+            phase was being measured
+        """
+        if self._phase is None:
+            return 0.
+
+        self._timer.stop()
+        duration = self._timer.elapsed()
+        hits, misses, computed = [b - a for a, b in zip(self._oracle_counts, self._read_oracle())]
+        self._current.add_phase(self._phase, duration, hits + misses, hits, computed)
+        self._phase = None
+        return duration
+
+    def set_count(self, name, value):
+        """
+        Records a count for the current update.
+
+        :type name: str
+        :param name: The name of the count
+
+        :type value: int
+        :param value: The count
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._current.set_count(name, value)
+
+    def finish(self):
+        """
+        Finishes the current update, passing its metrics to the hooks
+        and the output file.
+
+        :rtype: GuessMetrics
+        :return: The metrics of the update
+        """
+        self.end_phase()
+        metrics = self._current
+        self._current = GuessMetrics()
+        self._last = metrics
+
+        if self._filename is not None:
+            if self._file is None:
+                self._file = open(self._filename, "a")
+            self._file.write(json.dumps(metrics.to_dict()) + "\n")
+            self._file.flush()
+
+        for hook in self._hooks:
+            hook(metrics)
+
+        return metrics
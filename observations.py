@@ -0,0 +1,426 @@
+from binascii import hexlify, unhexlify
+
+import numpy as np
+
+from scl import SentenceSet, CONTEXTS, BitContextSet, ids_from_mask
+
+
+def _mask_to_vector(mask, width):
+    """
+    Converts a bitmask to a boolean vector.
+
+    :type mask: long
+    :param mask: A bitmask
+
+    :type width: int
+    :param width: The length of the vector. Bits beyond it are dropped.
+
+    :rtype: np.ndarray
+    :return: A boolean vector whose ith entry is bit i of mask
+    """
+    digits = "%x" % mask
+    if len(digits) % 2 == 1:
+        digits = "0" + digits
+
+    packed = np.frombuffer(unhexlify(digits)[::-1], dtype=np.uint8)
+    bits = np.unpackbits(packed).reshape(-1, 8)[:, ::-1].ravel()
+    vector = np.zeros(width, dtype=bool)
+    n = min(width, len(bits))
+    vector[:n] = bits[:n]
+    return vector
+
+
+def _vector_to_mask(vector):
+    """
+    Converts a boolean vector to a bitmask.
+
+    :type vector: np.ndarray
+    :param vector: A boolean vector
+
+    :rtype: long
+    :return: A bitmask whose bit i is the ith entry of vector
+    """
+    padding = -len(vector) % 8
+    bits = np.concatenate([vector, np.zeros(padding, dtype=bool)])
+    packed = np.packbits(bits.reshape(-1, 8)[:, ::-1])
+    if len(packed) == 0:
+        return 0L
+    return long(hexlify(packed[::-1].tostring()), 16)
+
+
+class ObservationTable(object):
+    """
+    A table of membership query answers for Context.wrap(substring),
+    stored as growable NumPy boolean matrices. Rows are substrings and
+    columns are the Context IDs assigned by the learner's ContextIndex,
+    so that a row converts directly to a BitContextSet. A second matrix records
+    which cells have been filled; cells are filled on demand.
+
+    The primal learner reads the table by rows, to find the contexts
+    of a set of substrings, and the dual learner reads it by columns,
+    to find the substrings of a set of contexts.
+
+    The table also indexes each row by its splits into two rows, so
+    that concatenations of substrings are found without building the
+    concatenated Sentences. Rows may be added in any order: a split
+    whose halves do not both have rows yet is indexed once the second
+    of them is added.
+    """
+
+    def __init__(self, oracle, index=CONTEXTS):
+        """
+        Initialize with an empty table.
+
+        :type oracle: oracles.Oracle
+        :param oracle: The oracle used to fill the table
+
+        :type index: ContextIndex
+        :param index: The index assigning the columns of Contexts
+        """
+        self._oracle = oracle
+        self._index = index
+        self._rows = dict()
+        self._sentences = []
+        self._splits = dict()
+        self._pending = dict()
+        self._values = np.zeros((16, 16), dtype=bool)
+        self._known = np.zeros((16, 16), dtype=bool)
+
+    def __len__(self):
+        return len(self._sentences)
+
+    def get_shape(self):
+        """
+        Finds the number of rows and columns in use.
+
+        :rtype: tuple
+        :return: The number of substrings and of Context IDs
+        """
+        return len(self._sentences), len(self._index)
+
+    def _grow(self, num_rows, num_cols):
+        """
+        Enlarges the matrices, doubling their capacity as needed.
+
+        :type num_rows: int
+        :param num_rows: The number of rows required
+
+        :type num_cols: int
+        :param num_cols: The number of columns required
+
+        :rtype: NoneType
+        :return: None
+        """
+        rows, cols = self._values.shape
+        if num_rows <= rows and num_cols <= cols:
+            return
+
+        while rows < num_rows:
+            rows *= 2
+        while cols < num_cols:
+            cols *= 2
+
+        old_rows, old_cols = self._values.shape
+        for name in ("_values", "_known"):
+            matrix = np.zeros((rows, cols), dtype=bool)
+            matrix[:old_rows, :old_cols] = getattr(self, name)
+            setattr(self, name, matrix)
+
+    def get_state(self):
+        """
+        Collects the contents of the table, for saving.
+
+        :rtype: tuple
+        :return: The substring of each row, and the values and known
+            matrices cut down to the rows and columns in use
+        """
+        num_rows, num_cols = self.get_shape()
+        return (list(self._sentences), self._values[:num_rows, :num_cols],
+                self._known[:num_rows, :num_cols])
+
+    def set_state(self, sentences, values, known):
+        """
+        Replaces the contents of the table with ones produced by
+        get_state. The matrices are used as they are, so they may be
+        memory-mapped copy-on-write.
+
+        :type sentences: list
+        :param sentences: The substring of each row
+
+        :type values: np.ndarray
+        :param values: The answers for each row and column
+
+        :type known: np.ndarray
+        :param known: Which answers have been filled
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._rows = dict()
+        self._sentences = []
+        self._splits = dict()
+        self._pending = dict()
+        if values.size > 0:
+            self._values = values
+            self._known = known
+        self._row_ids(sentences)
+
+    def _row_ids(self, sentences):
+        """
+        Looks up the rows of some sentences, adding rows for sentences
+        that do not have one yet.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: np.ndarray
+        :return: The row of each sentence
+        """
+        ids = []
+        num_old_rows = len(self._sentences)
+        for s in sentences:
+            row = self._rows.get(s)
+            if row is None:
+                row = len(self._sentences)
+                self._rows[s] = row
+                self._sentences.append(s)
+            ids.append(row)
+
+        for row in xrange(num_old_rows, len(self._sentences)):
+            self._add_splits(row)
+
+        self._grow(len(self._sentences), len(self._index))
+        return np.array(ids, dtype=np.intp)
+
+    def _add_split(self, row, i, wait=True):
+        """
+        Indexes a row by its split at a position, if both halves have
+        rows.
+
+        :type row: int
+        :param row: A row ID
+
+        :type i: int
+        :param i: The number of words in the left half
+
+        :type wait: bool
+        :param wait: If true and a half has no row, the split is
+            indexed when the missing halves are added
+
+        :rtype: NoneType
+        :return: None
+        """
+        sentence = self._sentences[row]
+        halves = sentence.substring(0, i), sentence.substring(i, len(sentence))
+        left, right = [self._rows.get(h) for h in halves]
+        if left is not None and right is not None:
+            self._splits[(left, right)] = row
+            return
+        if not wait:
+            return
+
+        for half, half_row in zip(halves, (left, right)):
+            if half_row is None:
+                self._pending.setdefault(half, []).append((row, i))
+
+    def _add_splits(self, row):
+        """
+        Indexes a row by its splits into two rows, and the rows split
+        into it and another row.
+
+        :type row: int
+        :param row: A row ID
+
+        :rtype: NoneType
+        :return: None
+        """
+        sentence = self._sentences[row]
+        # A split waiting on both halves is still waiting on the other
+        for whole, i in self._pending.pop(sentence, ()):
+            self._add_split(whole, i, wait=False)
+        for i in xrange(len(sentence) + 1):
+            self._add_split(row, i)
+
+    def _col_ids(self, contexts):
+        """
+        Finds the columns of a set of contexts.
+
+        :type contexts: BitContextSet
+        :param contexts: A set of contexts
+
+        :rtype: np.ndarray
+        :return: The IDs of the contexts
+        """
+        self._grow(len(self._sentences), len(self._index))
+        vector = _mask_to_vector(contexts.get_mask(), len(self._index))
+        return np.flatnonzero(vector)
+
+    def _fill(self, rows, cols):
+        """
+        Fills the unknown cells of a block with the oracle.
+
+        :type rows: np.ndarray
+        :param rows: Row IDs
+
+        :type cols: np.ndarray
+        :param cols: Column IDs
+
+        :rtype: NoneType
+        :return: None
+        """
+        block = np.ix_(rows, cols)
+        missing_r, missing_c = np.nonzero(~self._known[block])
+        if len(missing_r) == 0:
+            return
+
+        missing_r = rows[missing_r]
+        missing_c = cols[missing_c]
+        queries = [self._index.lookup(c).wrap(self._sentences[r])
+                   for r, c in zip(missing_r, missing_c)]
+        answers = self._oracle.query_many(queries)
+
+        self._values[missing_r, missing_c] = answers
+        self._known[missing_r, missing_c] = True
+
+    def add_rows(self, sentences):
+        """
+        Adds rows for some sentences, leaving their cells unknown until
+        they are needed.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._row_ids(sentences)
+
+    def fill(self, sentences, contexts):
+        """
+        Fills the cells for some sentences and contexts in one batch
+        of membership queries.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :type contexts: BitContextSet
+        :param contexts: A set of contexts
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._fill(self._row_ids(sentences), self._col_ids(contexts))
+
+    def accepting(self, sentences, contexts):
+        """
+        Finds the contexts that accept all of a set of sentences, by
+        ANDing the rows of the sentences.
+
+        :type sentences: SentenceSet
+        :param sentences: A set of sentences
+
+        :type contexts: BitContextSet
+        :param contexts: The contexts to check
+
+        :rtype: BitContextSet
+        :return: The contexts in contexts accepting every sentence
+        """
+        return self._accepting_rows(self._row_ids(sentences), contexts)
+
+    def _accepting_rows(self, rows, contexts):
+        """
+        Finds the contexts that accept all of a set of rows.
+
+        :type rows: np.ndarray
+        :param rows: Row IDs
+
+        :type contexts: BitContextSet
+        :param contexts: The contexts to check
+
+        :rtype: BitContextSet
+        :return: The contexts in contexts accepting every row
+        """
+        cols = self._col_ids(contexts)
+        self._fill(rows, cols)
+
+        result = np.zeros(len(self._index), dtype=bool)
+        result[cols] = self._values[np.ix_(rows, cols)].all(axis=0)
+        return BitContextSet.from_mask(_vector_to_mask(result), self._index)
+
+    def accepted_rows(self, contexts):
+        """
+        Finds the substrings accepted by all of a set of contexts, by
+        ANDing the columns of the contexts.
+
+        :type contexts: BitContextSet
+        :param contexts: A set of contexts
+
+        :rtype: long
+        :return: A bitmask over the rows of the table
+        """
+        rows = np.arange(len(self._sentences), dtype=np.intp)
+        cols = self._col_ids(contexts)
+        self._fill(rows, cols)
+        return _vector_to_mask(self._values[np.ix_(rows, cols)].all(axis=1))
+
+    def get_sentences(self, mask):
+        """
+        Looks up the substrings in a bitmask over the rows.
+
+        :type mask: long
+        :param mask: A bitmask over the rows of the table
+
+        :rtype: SentenceSet
+        :return: The substrings in mask
+        """
+        return SentenceSet([self._sentences[r] for r in ids_from_mask(mask)])
+
+    def get_row(self, sentence):
+        """
+        Looks up the row of a substring.
+
+        :type sentence: Sentence
+        :param sentence: A Sentence
+
+        :rtype: int
+        :return: The row of sentence, or None if it has no row
+        """
+        return self._rows.get(sentence)
+
+    def accepting_product(self, left, right, contexts):
+        """
+        Finds the contexts that accept every concatenation of a string
+        from left with a string from right. Concatenations that have
+        rows are found with the split index and looked up in the table;
+        only the rest are built and checked with the oracle.
+
+        :type left: SentenceSet
+        :param left: A set of sentences
+
+        :type right: SentenceSet
+        :param right: A set of sentences
+
+        :type contexts: BitContextSet
+        :param contexts: The contexts to check
+
+        :rtype: BitContextSet
+        :return: The contexts in contexts accepting left + right
+        """
+        known = set()
+        unknown = []
+        right_rows = self._row_ids(right)
+        for u in self._row_ids(left):
+            for v in right_rows:
+                w = self._splits.get((u, v))
+                if w is None:
+                    unknown.append((u, v))
+                else:
+                    known.add(w)
+
+        contexts = self._accepting_rows(np.array(sorted(known), dtype=np.intp), contexts)
+        if len(unknown) == 0 or len(contexts) == 0:
+            return contexts
+
+        # Membership queries
+        unknown = SentenceSet([self._sentences[u] + self._sentences[v] for u, v in unknown])
+        return self._oracle.restr_right_triangle(unknown, contexts)
@@ -1,9 +1,29 @@
+import errno
+import json
+import mmap
+import os
+import select
+import sqlite3
+import subprocess
+import warnings
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from hashlib import sha1
+from itertools import product
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
+from random import Random
+from threading import Lock, Timer
+from time import time
 
-from nltk import CFG, ChartParser
-from nltk.parse.generate import generate
+from nltk import CFG
+from nltk.grammar import Nonterminal
 
-from scl import Sentence, ContextSet, SentenceSet
+from recognizers import EarleyRecognizer
+from scl import Sentence, SentenceSet
+
+DEFAULT_CACHE_SIZE = 2 ** 18
 
 
 class Text(object):
@@ -17,33 +37,816 @@ class Text(object):
         pass
 
 
+def _min_lengths(grammar):
+    """
+    Finds the length of the shortest string derived from each
+    nonterminal of a grammar.
+
+    :type grammar: CFG
+    :param grammar: A CFG
+
+    :rtype: dict
+    :return: The length for each nonterminal that derives a string
+    """
+    lengths = dict()
+    changed = True
+    while changed:
+        changed = False
+        for p in grammar.productions():
+            length = _rhs_length(p.rhs(), lengths)
+            if length is not None and length < lengths.get(p.lhs(), length + 1):
+                lengths[p.lhs()] = length
+                changed = True
+
+    return lengths
+
+
+def _rhs_length(symbols, lengths):
+    """
+    Adds up the lengths of a sequence of symbols.
+
+    :type symbols: tuple
+    :param symbols: Terminals and Nonterminals
+
+    :type lengths: dict
+    :param lengths: A length for each Nonterminal
+
+    :rtype: int
+    :return: The total length, or None if some Nonterminal has no
+        length
+    """
+    total = 0
+    for s in symbols:
+        if not isinstance(s, Nonterminal):
+            total += 1
+        elif s in lengths:
+            total += lengths[s]
+        else:
+            return None
+    return total
+
+
 class GrammarText(Text):
     """
-    A text from a grammar.
+    A text from a grammar, listing each string of the language once,
+    shortest first. Strings of the same length are listed in sorted
+    order.
+
+    The strings of each length derived from each nonterminal are found
+    by dynamic programming over the rules, from the strings of the
+    same or shorter lengths.
+    """
+
+    def __init__(self, grammar, depth=None, max_length=None):
+        """
+        Initialize from a CFG.
+
+        :type grammar: CFG
+        :param grammar: A CFG generating the text.
+
+        :type depth: int
+        :param depth: Deprecated. If given, the text only lists the
+            strings with a derivation tree of at most this depth, as
+            nltk.parse.generate.generate does, but still shortest
+            first and without duplicates. It stays the second
+            parameter, so that GrammarText(grammar, depth) keeps its
+            meaning.
+
+        :type max_length: int
+        :param max_length: If given, the text ends after the strings of
+            this length
+        """
+        self._grammar = grammar
+        self._max_length = max_length
+        self._depth = depth
+        self._num_read = 0
+
+        self._min_lengths = _min_lengths(grammar)
+        self._rules = [p for p in grammar.productions()
+                       if _rhs_length(p.rhs(), self._min_lengths) is not None]
+        self._strings = dict((nt, []) for nt in self._min_lengths)
+        self._length = -1
+        self._queue = []
+
+        # The text also ends once no longer strings exist
+        limit = self._find_max_length()
+        if limit is not None and (max_length is None or limit < max_length):
+            self._max_length = limit
+
+        if depth is not None:
+            warnings.warn("GrammarText(depth=...) is deprecated; use max_length",
+                          DeprecationWarning, stacklevel=2)
+            self._queue = self._strings_to_depth(depth)
+
+    def __getstate__(self):
+        return self._grammar, self._max_length, self._num_read, self._depth
+
+    def __setstate__(self, state):
+        # Texts pickled before depth was deprecated have no depth
+        grammar, max_length, num_read = state[:3]
+        depth = state[3] if len(state) > 3 else None
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            self.__init__(grammar, max_length=max_length, depth=depth)
+        for _ in xrange(num_read):
+            self.next()
+
+    def _strings_to_depth(self, depth):
+        """
+        Finds the strings of the language with a derivation tree of at
+        most a given depth, counting the terminals at the leaves as
+        nltk.parse.generate.generate does.
+
+        :type depth: int
+        :param depth: The maximum depth
+
+        :rtype: list
+        :return: The strings, as tuples of words, longest first
+        """
+        strings = dict((nt, set()) for nt in self._min_lengths)
+        for d in xrange(1, depth + 1):
+            shallower = strings
+            strings = dict((nt, set()) for nt in self._min_lengths)
+            for p in self._rules:
+                parts = [shallower[s] if isinstance(s, Nonterminal) else [(s,)] if d > 1 else []
+                         for s in p.rhs()]
+                strings[p.lhs()].update(sum(t, ()) for t in product(*parts))
+
+        start = self._grammar.start()
+        result = [s for s in strings.get(start, ())
+                  if self._max_length is None or len(s) <= self._max_length]
+        return sorted(result, key=lambda s: (len(s), s), reverse=True)
+
+    def _find_max_length(self):
+        """
+        Finds the length of the longest string of the language.
+
+        :rtype: int
+        :return: The length, or None if the language is infinite
+        """
+        start = self._grammar.start()
+        if start not in self._min_lengths:
+            return -1
+
+        # The nonterminals deriving some nonempty string
+        nonempty = set()
+        changed = True
+        while changed:
+            changed = False
+            for p in self._rules:
+                if p.lhs() not in nonempty and \
+                        any(not isinstance(s, Nonterminal) or s in nonempty for s in p.rhs()):
+                    nonempty.add(p.lhs())
+                    changed = True
+
+        # An edge from A to B means that A rewrites to a string with B
+        # in it. The edge adds to the length if the rest of the string
+        # can be nonempty.
+        edges = dict((nt, set()) for nt in self._min_lengths)
+        adding = []
+        for p in self._rules:
+            rhs = p.rhs()
+            for i, s in enumerate(rhs):
+                if isinstance(s, Nonterminal):
+                    edges[p.lhs()].add(s)
+                    rest = rhs[:i] + rhs[i + 1:]
+                    if any(not isinstance(r, Nonterminal) or r in nonempty for r in rest):
+                        adding.append((p.lhs(), s))
+
+        def reachable(source):
+            found = {source}
+            stack = [source]
+            while len(stack) > 0:
+                for nt in edges[stack.pop()]:
+                    if nt not in found:
+                        found.add(nt)
+                        stack.append(nt)
+            return found
+
+        # The language is infinite if and only if a cycle reachable
+        # from the start symbol contains an edge adding to the length
+        from_start = reachable(start)
+        for a, b in adding:
+            if a in from_start and a in reachable(b):
+                return None
+
+        # Otherwise the longest lengths are bounded, so this ends
+        lengths = dict(self._min_lengths)
+        changed = True
+        while changed:
+            changed = False
+            for p in self._rules:
+                length = _rhs_length(p.rhs(), lengths)
+                if length > lengths[p.lhs()]:
+                    lengths[p.lhs()] = length
+                    changed = True
+
+        return lengths[start]
+
+    def _concatenations(self, symbols, length):
+        """
+        Generates the strings of a given length derived from a
+        sequence of symbols, using the strings found so far.
+
+        :type symbols: tuple
+        :param symbols: Terminals and Nonterminals
+
+        :type length: int
+        :param length: The length of the strings
+
+        :rtype: generator
+        :return: The strings, as tuples of words
+        """
+        if len(symbols) == 0:
+            if length == 0:
+                yield ()
+            return
+
+        first = symbols[0]
+        rest = symbols[1:]
+        rest_length = _rhs_length(rest, self._min_lengths)
+        if not isinstance(first, Nonterminal):
+            if length - 1 >= rest_length:
+                for t in self._concatenations(rest, length - 1):
+                    yield (first,) + t
+            return
+
+        for i in xrange(self._min_lengths[first], length - rest_length + 1):
+            for s in self._strings[first][i]:
+                for t in self._concatenations(rest, length - i):
+                    yield s + t
+
+    def _extend(self):
+        """
+        Finds the strings of the next length.
+
+        :rtype: NoneType
+        :return: None
+        """
+        length = self._length + 1
+        for strings in self._strings.itervalues():
+            strings.append(set())
+
+        # Empty rules may make strings depend on others of the same
+        # length, so the rules are applied until nothing changes
+        changed = True
+        while changed:
+            changed = False
+            for p in self._rules:
+                strings = self._strings[p.lhs()][length]
+                new_strings = set(self._concatenations(p.rhs(), length))
+                if not new_strings.issubset(strings):
+                    strings.update(new_strings)
+                    changed = True
+
+        self._length = length
+        start = self._grammar.start()
+        if start in self._strings:
+            self._queue = sorted(self._strings[start][length], reverse=True)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while len(self._queue) == 0:
+            if self._depth is not None or \
+                    self._max_length is not None and self._length >= self._max_length:
+                raise StopIteration
+            self._extend()
+
+        self._num_read += 1
+        return self._queue.pop()
+
+
+class SampledGrammarText(Text):
+    """
+    A text from a grammar, made of random derivations in which each
+    rule is chosen with probability proportional to its weight. Only
+    strings no longer than a given length are produced, and each is
+    produced once.
     """
 
-    def __init__(self, grammar, depth=5):
+    def __init__(self, grammar, max_length, weights=None, seed=None, max_tries=1000):
         """
         Initialize from a CFG.
 
         :type grammar: CFG
         :param grammar: A CFG generating the text.
+
+        :type max_length: int
+        :param max_length: The length of the longest strings produced
+
+        :type weights: dict
+        :param weights: A weight for each Production. Rules without a
+            weight have weight 1.
+
+        :type seed: int
+        :param seed: A seed for the random number generator
+
+        :type max_tries: int
+        :param max_tries: The text ends after this many derivations in
+            a row have produced strings seen before
+        """
+        self._grammar = grammar
+        self._max_length = max_length
+        self._max_tries = max_tries
+        self._random = Random(seed)
+        self._seen = set()
+
+        self._min_lengths = _min_lengths(grammar)
+        self._rules = dict()
+        for p in grammar.productions():
+            length = _rhs_length(p.rhs(), self._min_lengths)
+            if length is not None:
+                weight = 1. if weights is None else weights.get(p, 1.)
+                self._rules.setdefault(p.lhs(), []).append((p.rhs(), length, weight))
+
+    def __iter__(self):
+        return self
+
+    def _sample(self):
+        """
+        Samples a derivation, expanding the leftmost nonterminal with
+        a rule that leaves room for the shortest strings derived from
+        the rest.
+
+        :rtype: tuple
+        :return: A string, or None if the derivation took too long
+        """
+        start = self._grammar.start()
+        if self._min_lengths.get(start, self._max_length + 1) > self._max_length:
+            return None
+
+        words = []
+        stack = [start]
+        room = self._max_length - self._min_lengths[start]
+        for _ in xrange(100 * (self._max_length + 1)):
+            if len(stack) == 0:
+                return tuple(words)
+
+            symbol = stack.pop()
+            if not isinstance(symbol, Nonterminal):
+                words.append(symbol)
+                continue
+
+            min_length = self._min_lengths[symbol]
+            rules = [r for r in self._rules[symbol] if r[1] - min_length <= room]
+            point = self._random.uniform(0, sum(w for _, _, w in rules))
+            for rhs, length, weight in rules:
+                point -= weight
+                # Rules with weight 0 are never chosen, even if point is 0
+                if point <= 0 and weight > 0:
+                    break
+
+            room -= length - min_length
+            stack.extend(reversed(rhs))
+
+        return None
+
+    def next(self):
+        for _ in xrange(self._max_tries):
+            sentence = self._sample()
+            if sentence is not None and sentence not in self._seen:
+                self._seen.add(sentence)
+                return sentence
+
+        raise StopIteration
+
+
+class FileText(Text):
+    """
+    A text read from a file with one sentence per line. The file is
+    memory-mapped rather than read into memory, and each line is only
+    split into words when it is returned. Blank lines are skipped.
+
+    The file can be split into shards of roughly equal size, each
+    made up of the lines that start in one range of bytes, so that
+    several learners can read disjoint parts of a corpus. Reading can
+    be resumed from the offset returned by get_offset. Lines read before
+    the offset are only skipped as duplicates if the set returned by
+    get_seen is passed back along with it.
+    """
+
+    def __init__(self, filename, offset=None, shard=0, num_shards=1, skip_seen=True,
+                 tokenize=None, seen=None):
+        """
+        Initialize from a file.
+
+        :type filename: str
+        :param filename: The name of the file
+
+        :type offset: int
+        :param offset: If given, the byte offset of the line to start
+            reading from, as returned by get_offset
+
+        :type shard: int
+        :param shard: The shard to read
+
+        :type num_shards: int
+        :param num_shards: The number of shards the file is split into
+
+        :type skip_seen: bool
+        :param skip_seen: If true, lines identical to one that has
+            already been read are skipped before being tokenized. Only
+            the SHA-1 digests of lines are kept, so distinct lines are
+            not mistaken for each other.
+
+        :type tokenize: function
+        :param tokenize: A function splitting a line into words. By
+            default, lines are split on whitespace.
+
+        :type seen: set
+        :param seen: If given, the digests of lines already read, as
+            returned by get_seen. It may be shared with other texts.
+        """
+        self._filename = filename
+        self._shard = shard
+        self._num_shards = num_shards
+        self._skip_seen = skip_seen
+        self._tokenize = tokenize
+        self._seen = set() if seen is None else seen
+
+        self._file = open(filename, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = None
+        if size > 0:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._start = self._line_start(size * shard // num_shards)
+        self._end = self._line_start(size * (shard + 1) // num_shards)
+        self._offset = self._start if offset is None else offset
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_file"]
+        del state["_data"]
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(state["_filename"], offset=state["_offset"], shard=state["_shard"],
+                      num_shards=state["_num_shards"], skip_seen=state["_skip_seen"],
+                      tokenize=state["_tokenize"], seen=state["_seen"])
+
+    def _line_start(self, position):
+        """
+        Finds the start of the first line starting at or after a byte
+        offset.
+
+        :type position: int
+        :param position: A byte offset
+
+        :rtype: int
+        :return: The offset of the start of the line
+        """
+        if self._data is None or position == 0:
+            return 0
+        if position >= len(self._data):
+            return len(self._data)
+
+        newline = self._data.find("\n", position - 1)
+        return len(self._data) if newline < 0 else newline + 1
+
+    def __iter__(self):
+        return self
+
+    def get_offset(self):
+        """
+        Finds the offset to resume reading from.
+
+        :rtype: int
+        :return: The byte offset of the next line to be read
+        """
+        return self._offset
+
+    def get_seen(self):
+        """
+        Public accessor for the digests of the lines read, to pass back
+        along with the offset when resuming.
+
+        :rtype: set
+        :return: self._seen
+        """
+        return self._seen
+
+    def close(self):
+        """
+        Unmaps and closes the file.
+
+        :rtype: NoneType
+        :return: None
+        """
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        self._file.close()
+
+    def next(self):
+        while self._offset < self._end:
+            newline = self._data.find("\n", self._offset, self._end)
+            if newline < 0:
+                newline = self._end
+            line = self._data[self._offset:newline].strip()
+            self._offset = newline + 1
+
+            if len(line) == 0:
+                continue
+            if self._skip_seen:
+                digest = sha1(line).digest()
+                if digest in self._seen:
+                    continue
+                self._seen.add(digest)
+
+            if self._tokenize is None:
+                return tuple(line.split())
+            return tuple(self._tokenize(line))
+
+        raise StopIteration
+
+
+class CorpusText(Text):
+    """
+    A text read from several files in turn, each read as a FileText.
+    Every file is split into the same shards, and lines that have
+    already been read are skipped across all of the files.
+    """
+
+    def __init__(self, filenames, offset=None, shard=0, num_shards=1, skip_seen=True,
+                 tokenize=None, seen=None):
+        """
+        Initialize from a list of files.
+
+        :type filenames: list
+        :param filenames: The names of the files
+
+        :type offset: tuple
+        :param offset: If given, the index of the file and the byte
+            offset within it to resume from, as returned by get_offset
+
+        :type shard: int
+        :param shard: The shard to read
+
+        :type num_shards: int
+        :param num_shards: The number of shards each file is split into
+
+        :type skip_seen: bool
+        :param skip_seen: If true, lines identical to one that has
+            already been read are skipped
+
+        :type tokenize: function
+        :param tokenize: A function splitting a line into words
+
+        :type seen: set
+        :param seen: If given, the digests of lines already read, as
+            returned by get_seen. Without it, lines read before offset
+            are not skipped.
+        """
+        self._filenames = list(filenames)
+        self._options = dict(shard=shard, num_shards=num_shards, skip_seen=skip_seen,
+                             tokenize=tokenize)
+        self._seen = set() if seen is None else seen
+
+        self._index, file_offset = (0, None) if offset is None else offset
+        self._text = None
+        self._open(file_offset)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_text"] = None
+        state["_offset"] = self.get_offset()
+        return state
+
+    def __setstate__(self, state):
+        index, file_offset = state.pop("_offset")
+        self.__dict__.update(state)
+        self._index = index
+        self._open(file_offset)
+
+    def _open(self, file_offset=None):
+        """
+        Opens the current file, sharing the digests of lines seen.
+
+        :type file_offset: int
+        :param file_offset: The byte offset to start reading the file
+            from
+
+        :rtype: NoneType
+        :return: None
         """
-        self._iterator = generate(grammar, depth=depth)
+        if self._text is not None:
+            self._text.close()
+            self._text = None
+
+        if self._index < len(self._filenames):
+            self._text = FileText(self._filenames[self._index], offset=file_offset,
+                                  seen=self._seen, **self._options)
 
     def __iter__(self):
         return self
 
+    def get_offset(self):
+        """
+        Finds the offset to resume reading from.
+
+        :rtype: tuple
+        :return: The index of the current file and the byte offset of
+            the next line to be read from it
+        """
+        if self._text is None:
+            return self._index, None
+        return self._index, self._text.get_offset()
+
+    def get_seen(self):
+        """
+        Public accessor for the digests of the lines read, to pass back
+        along with the offset when resuming.
+
+        :rtype: set
+        :return: self._seen
+        """
+        return self._seen
+
+    def close(self):
+        """
+        Closes the current file.
+
+        :rtype: NoneType
+        :return: None
+        """
+        if self._text is not None:
+            self._text.close()
+            self._text = None
+
     def next(self):
-        return next(self._iterator)
+        while self._text is not None:
+            try:
+                return self._text.next()
+            except StopIteration:
+                self._index += 1
+                self._open()
+
+        raise StopIteration
+
+
+class MembershipCache(object):
+    """
+    A bounded LRU cache of membership query answers, keyed by the
+    interned words of each sentence.
+    """
+
+    def __init__(self, capacity=None):
+        """
+        Initialize with a maximum number of answers.
+
+        :type capacity: int
+        :param capacity: The maximum number of answers to keep. If
+            None, the cache is unbounded; if 0, nothing is cached.
+        """
+        self._capacity = capacity
+        self._answers = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._answers)
+
+    def __contains__(self, key):
+        return key in self._answers
+
+    def get(self, key):
+        """
+        Looks up an answer, marking it as recently used.
+
+        :type key: str
+        :param key: The interned words of a sentence
+
+        :rtype: bool
+        :return: The cached answer, or None if there is none
+        """
+        try:
+            answer = self._answers.pop(key)
+        except KeyError:
+            self._misses += 1
+            return None
+
+        self._answers[key] = answer
+        self._hits += 1
+        return answer
+
+    def put(self, key, answer):
+        """
+        Stores an answer, evicting the least recently used answer if
+        the cache is full.
+
+        :type key: str
+        :param key: The interned words of a sentence
+
+        :type answer: bool
+        :param answer: The answer to store
+
+        :rtype: NoneType
+        :return: None
+        """
+        if self._capacity == 0:
+            return
+
+        self._answers.pop(key, None)
+        self._answers[key] = answer
+        if self._capacity is not None and len(self._answers) > self._capacity:
+            self._answers.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        """
+        Removes all answers. The counters are kept.
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._answers.clear()
+
+    def get_capacity(self):
+        return self._capacity
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    def get_evictions(self):
+        return self._evictions
 
 
 class Oracle(object):
     """
-    An oracle.
+    An oracle. Answers to membership queries made through query are
+    memoized in an LRU cache. Subclasses that do not call
+    Oracle.__init__ get a cache of DEFAULT_CACHE_SIZE answers when it
+    is first used.
     """
     __metaclass__ = ABCMeta
 
+    _cache = None
+    _num_computed = 0
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Initialize the membership query cache.
+
+        :type cache_size: int
+        :param cache_size: The maximum number of cached answers. If
+            None, the cache is unbounded; if 0, nothing is cached.
+        """
+        self._cache = MembershipCache(cache_size)
+        self._num_computed = 0
+
+    def __getstate__(self):
+        # The cache is keyed by the codes of Sentences, which refer to
+        # the symbols interned in this process, so it is not pickled
+        state = self.__dict__.copy()
+        state["_cache"] = MembershipCache(self.get_cache().get_capacity())
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Releases the processes, threads or files used to answer
+        queries. Oracles using none do nothing. An oracle used in a with
+        statement is closed at the end of it.
+
+        :rtype: NoneType
+        :return: None
+        """
+        pass
+
+    def get_cache(self):
+        """
+        Public accessor for the membership query cache, which is
+        created if necessary.
+
+        :rtype: MembershipCache
+        :return: self._cache
+        """
+        if self._cache is None:
+            self._cache = MembershipCache(DEFAULT_CACHE_SIZE)
+        return self._cache
+
+    def get_num_computed(self):
+        """
+        Public accessor for self._num_computed.
+
+        :rtype: int
+        :return: The number of queries made through query or
+            query_many that were not answered by the cache
+        """
+        return self._num_computed
+
     @abstractmethod
     def generates(self, sentence):
         """
@@ -57,33 +860,89 @@ class Oracle(object):
         """
         return False
 
-    def restr_right_triangle(self, sentences, contexts):
-        result = ContextSet([])
-        for c in contexts:
-            is_valid_context = True
-            for s in c.wrap_set(sentences):
-                if not self.generates(s):
-                    is_valid_context = False
-                    break
+    def generates_many(self, sentences):
+        """
+        Decides language membership for many sentences at once.
+        Subclasses with a high per-call overhead should override this.
 
-            if is_valid_context:
-                result.add(c)
+        :type sentences: list
+        :param sentences: A list of Sentences
 
-        return result
+        :rtype: list
+        :return: Whether or not the oracle accepts each sentence
+        """
+        return [self.generates(s) for s in sentences]
 
-    def restr_left_triangle(self, contexts, sentences):
-        result = SentenceSet([])
-        for s in sentences:
-            is_valid_substring = True
-            for t in contexts.wrap(s):
-                if not self.generates(t):
-                    is_valid_substring = False
-                    break
+    def query(self, sentence):
+        """
+        A memoized version of generates.
+
+        :type sentence: Sentence
+        :param sentence: A sentence
+
+        :rtype: bool
+        :return: Whether or not the oracle accepts sentence
+        """
+        cache = self.get_cache()
+        key = sentence.get_codes()
+        answer = cache.get(key)
+        if answer is None:
+            answer = self.generates(sentence)
+            cache.put(key, answer)
+            self._num_computed += 1
+
+        return answer
+
+    def query_many(self, sentences):
+        """
+        A memoized version of generates_many. Sentences that are not
+        in the cache are submitted to generates_many in one batch.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: list
+        :return: Whether or not the oracle accepts each sentence
+        """
+        cache = self.get_cache()
+        keys = [s.get_codes() for s in sentences]
+        answers = [cache.get(key) for key in keys]
+
+        missing = dict()
+        for key, s, answer in zip(keys, sentences, answers):
+            if answer is None:
+                missing.setdefault(key, s)
 
-            if is_valid_substring:
-                result.add(s)
+        if len(missing) == 0:
+            return answers
 
-        return result
+        missing_keys = list(missing)
+        missing_answers = self.generates_many([missing[k] for k in missing_keys])
+        self._num_computed += len(missing_keys)
+        new_answers = dict(zip(missing_keys, missing_answers))
+        for key, answer in new_answers.iteritems():
+            cache.put(key, answer)
+
+        return [new_answers[k] if a is None else a for k, a in zip(keys, answers)]
+
+    def restr_right_triangle(self, sentences, contexts):
+        sentences = list(sentences)
+        context_list = list(contexts)
+        n = len(sentences)
+
+        answers = self.query_many([c.wrap(s) for c in context_list for s in sentences])
+        result = [c for i, c in enumerate(context_list) if all(answers[i * n:(i + 1) * n])]
+        # Keeps the type of contexts, and the index of a BitContextSet
+        return contexts.intersection(result)
+
+    def restr_left_triangle(self, contexts, sentences):
+        sentence_list = list(sentences)
+        contexts = list(contexts)
+        n = len(contexts)
+
+        answers = self.query_many([c.wrap(s) for s in sentence_list for c in contexts])
+        result = [s for i, s in enumerate(sentence_list) if all(answers[i * n:(i + 1) * n])]
+        return SentenceSet(result)
 
 
 class GrammarOracle(Oracle):
@@ -91,14 +950,35 @@ class GrammarOracle(Oracle):
     An oracle from a grammar.
     """
 
-    def __init__(self, grammar):
+    def __init__(self, grammar, cache_size=DEFAULT_CACHE_SIZE):
         """
         Initialize from a CFG.
 
         :type grammar: CFG
         :param grammar: The grammar for this oracle
+
+        :type cache_size: int
+        :param cache_size: The maximum number of cached answers
         """
-        self._parser = ChartParser(grammar)
+        super(GrammarOracle, self).__init__(cache_size=cache_size)
+        self._grammar = grammar
+        self._recognizer = EarleyRecognizer(grammar)
+
+    def __getstate__(self):
+        return self._grammar, self.get_cache().get_capacity()
+
+    def __setstate__(self, state):
+        grammar, cache_size = state
+        self.__init__(grammar, cache_size=cache_size)
+
+    def get_grammar(self):
+        """
+        Public accessor for self._grammar.
+
+        :rtype: CFG
+        :return: self._grammar
+        """
+        return self._grammar
 
     def generates(self, sentence):
         """
@@ -110,8 +990,844 @@ class GrammarOracle(Oracle):
         :rtype: bool
         :return: Whether the grammar generates the sentence
         """
+        return self._recognizer.recognize(sentence.get_words())
+
+    def generates_many(self, sentences):
+        """
+        Decides whether the grammar generates each of the sentences,
+        parsing prefixes shared by several sentences only once.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: list
+        :return: Whether the grammar generates each sentence
+        """
+        return self._recognizer.recognize_many([s.get_words() for s in sentences])
+
+
+# The oracle used by each ParallelOracle worker process
+_worker_oracle = None
+
+
+def _init_worker(oracle):
+    global _worker_oracle
+    _worker_oracle = oracle
+
+
+def _generates_chunk(sentences):
+    return _worker_oracle.generates_many(sentences)
+
+
+class ParallelOracle(Oracle):
+    """
+    Wraps an oracle so that batches of membership queries are sharded
+    across a pool of worker processes. Each worker receives its own
+    copy of the wrapped oracle when it starts, so a GrammarOracle
+    compiles its recognizer once per worker.
+
+    The workers run until close is called, so the oracle should be
+    used in a with statement:
+
+        with ParallelOracle(GrammarOracle(grammar)) as oracle:
+            learner = PrimalLearner(text, oracle, k)
+            ...
+    """
+
+    def __init__(self, oracle, processes=None, chunk_size=256,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Initialize from another Oracle.
+
+        :type oracle: Oracle
+        :param oracle: The oracle answering the queries. It must be
+            picklable.
+
+        :type processes: int
+        :param processes: The number of worker processes. If None, one
+            worker is started for each CPU.
+
+        :type chunk_size: int
+        :param chunk_size: The number of sentences sent to a worker at
+            a time. Batches smaller than this are answered in this
+            process.
+
+        :type cache_size: int
+        :param cache_size: The maximum number of cached answers
+        """
+        super(ParallelOracle, self).__init__(cache_size=cache_size)
+        self._oracle = oracle
+        self._processes = processes
+        self._chunk_size = chunk_size
+        self._pool = None
+
+    def __getstate__(self):
+        state = super(ParallelOracle, self).__getstate__()
+        state["_pool"] = None
+        return state
+
+    def _get_pool(self):
+        """
+        Starts the worker processes if they are not running.
+
+        :rtype: Pool
+        :return: self._pool
+        """
+        if self._pool is None:
+            self._pool = Pool(self._processes, initializer=_init_worker,
+                              initargs=(self._oracle,))
+        return self._pool
+
+    def close(self):
+        """
+        Shuts down the worker processes. They are restarted if more
+        queries are made.
+
+        :rtype: NoneType
+        :return: None
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def generates(self, sentence):
+        """
+        Asks the wrapped oracle, in this process.
+
+        :type sentence: Sentence
+        :param sentence: A sentence
+
+        :rtype: bool
+        :return: Whether or not the wrapped oracle accepts sentence
+        """
+        return self._oracle.generates(sentence)
+
+    def generates_many(self, sentences):
+        """
+        Asks the wrapped oracle in the worker processes, one chunk of
+        sentences at a time. The sentences are sorted first, so that
+        sentences sharing a prefix land in the same chunk. Answers are
+        returned in the order of sentences.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: list
+        :return: Whether or not the wrapped oracle accepts each sentence
+        """
+        if len(sentences) <= self._chunk_size:
+            return self._oracle.generates_many(sentences)
+
+        order = sorted(xrange(len(sentences)), key=lambda i: sentences[i].get_codes())
+        ordered = [sentences[i] for i in order]
+
+        size = self._chunk_size
+        chunks = [ordered[i:i + size] for i in range(0, len(ordered), size)]
+        answers = [False] * len(sentences)
+        position = 0
+        for chunk_answers in self._get_pool().map(_generates_chunk, chunks):
+            for answer in chunk_answers:
+                answers[order[position]] = answer
+                position += 1
+
+        return answers
+
+
+class AsyncOracle(Oracle):
+    """
+    An oracle whose membership checks mostly wait on something outside
+    this process, such as an external tool or a service. Checks run in
+    a pool of threads, so that up to max_in_flight of them are waiting
+    at once; generates_many, and so query_many and the triangle
+    restrictions, submit a whole batch to the pool.
+
+    Subclasses implement generates, which is called from the pool's
+    threads and must be thread-safe.
+    """
+
+    def __init__(self, max_in_flight=64, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Initialize the membership query cache.
+
+        :type max_in_flight: int
+        :param max_in_flight: The largest number of membership checks
+            running at once
+
+        :type cache_size: int
+        :param cache_size: The maximum number of cached answers
+        """
+        super(AsyncOracle, self).__init__(cache_size=cache_size)
+        self._max_in_flight = max_in_flight
+        self._pool = None
+
+    def __getstate__(self):
+        state = super(AsyncOracle, self).__getstate__()
+        state["_pool"] = None
+        return state
+
+    def _get_pool(self):
+        """
+        Starts the threads if they are not running.
+
+        :rtype: ThreadPool
+        :return: self._pool
+        """
+        if self._pool is None:
+            self._pool = ThreadPool(self._max_in_flight)
+        return self._pool
+
+    def close(self):
+        """
+        Shuts down the threads. They are restarted if more queries are
+        made.
+
+        :rtype: NoneType
+        :return: None
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def get_max_in_flight(self):
+        """
+        Public accessor for self._max_in_flight.
+
+        :rtype: int
+        :return: self._max_in_flight
+        """
+        return self._max_in_flight
+
+    def generates_async(self, sentence, callback=None):
+        """
+        Starts deciding language membership for a sentence without
+        waiting for the answer. The cache is not used.
+
+        :type sentence: Sentence
+        :param sentence: A sentence
+
+        :type callback: function
+        :param callback: If given, called with the answer once it is
+            known
+
+        :rtype: multiprocessing.pool.AsyncResult
+        :return: A handle whose get method waits for the answer
+        """
+        return self._get_pool().apply_async(self.generates, (sentence,), callback=callback)
+
+    def generates_many(self, sentences):
+        """
+        Decides language membership for many sentences, with up to
+        max_in_flight checks running at once. If a check raises an
+        exception, it is raised here once the batch is done.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: list
+        :return: Whether or not the oracle accepts each sentence
+        """
+        if len(sentences) <= 1:
+            return [self.generates(s) for s in sentences]
+        return self._get_pool().map(self.generates, sentences, chunksize=1)
+
+
+class SubprocessOracle(AsyncOracle):
+    """
+    An oracle that runs a command for each membership query. The words
+    of the sentence are written to the command's standard input,
+    separated by spaces and followed by a newline, and the sentence is
+    accepted if the command exits with status 0.
+    """
+
+    def __init__(self, command, timeout=None, max_in_flight=16,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Initialize from a command.
+
+        :type command: list
+        :param command: The program to run and its arguments
+
+        :type timeout: float
+        :param timeout: If given, the number of seconds after which the
+            command is killed and an IOError is raised
+
+        :type max_in_flight: int
+        :param max_in_flight: The largest number of commands running at
+            once
+
+        :type cache_size: int
+        :param cache_size: The maximum number of cached answers
+        """
+        super(SubprocessOracle, self).__init__(max_in_flight=max_in_flight,
+                                               cache_size=cache_size)
+        self._command = list(command)
+        self._timeout = timeout
+
+    def generates(self, sentence):
+        """
+        Runs the command on the sentence.
+
+        :type sentence: Sentence
+        :param sentence: A sentence
+
+        :rtype: bool
+        :return: Whether the command exited with status 0
+        """
+        with open(os.devnull, "wb") as devnull:
+            process = subprocess.Popen(self._command, stdin=subprocess.PIPE, stdout=devnull,
+                                       close_fds=True)
+
+        timed_out = []
+
+        def kill():
+            timed_out.append(True)
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+        timer = None
+        if self._timeout is not None:
+            timer = Timer(self._timeout, kill)
+            timer.start()
+
+        try:
+            process.communicate(" ".join(sentence.get_words()) + "\n")
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        if len(timed_out) > 0:
+            raise IOError("{} timed out on {}".format(self._command[0], sentence))
+        return process.returncode == 0
+
+
+_ACCEPT = frozenset(["1", "true", "yes", "accept"])
+_REJECT = frozenset(["0", "false", "no", "reject"])
+
+
+class _CommandWorker(object):
+    """
+    A long-lived process answering membership queries, one per line.
+    """
+
+    def __init__(self, command):
+        """
+        Starts the process.
+
+        :type command: list
+        :param command: The program to run and its arguments
+        """
+        self._command = command
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, close_fds=True, bufsize=0)
+        self._buffer = ""
+
+    def is_alive(self):
+        """
+        Checks whether the process is still running.
+
+        :rtype: bool
+        :return: True if the process has not exited
+        """
+        return self._process.poll() is None
+
+    def kill(self):
+        """
+        Stops the process.
+
+        :rtype: NoneType
+        :return: None
+        """
+        try:
+            self._process.kill()
+        except OSError:
+            pass
+        self._process.wait()
+
+    def close(self):
+        """
+        Closes the input of the process, lets it exit and waits for it.
+        If it does not exit within a second, it is killed.
+
+        :rtype: NoneType
+        :return: None
+        """
+        try:
+            self._process.stdin.close()
+        except IOError:
+            pass
+
+        deadline = time() + 1.
+        while self._process.poll() is None and time() < deadline:
+            select.select([], [], [], 0.01)
+        if self._process.poll() is None:
+            self.kill()
+
+    def ask(self, lines, timeout=None):
+        """
+        Writes lines to the process and reads one line of output for
+        each. Writing and reading are interleaved, so a batch may be
+        larger than the pipe buffers.
+
+        :type lines: list
+        :param lines: Lines, without newlines
+
+        :type timeout: float
+        :param timeout: If given, the number of seconds to wait for the
+            whole batch
+
+        :rtype: list
+        :return: The output lines, without newlines
+        """
+        deadline = None if timeout is None else time() + timeout
+        data = "".join(line + "\n" for line in lines)
+        stdin = self._process.stdin.fileno()
+        stdout = self._process.stdout.fileno()
+
+        replies = []
+        while len(replies) < len(lines):
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise IOError("{} timed out".format(self._command[0]))
+
+            writers = [stdin] if len(data) > 0 else []
+            readable, writable, _ = select.select([stdout], writers, [], remaining)
+
+            if len(writable) > 0:
+                try:
+                    written = os.write(stdin, data[:select.PIPE_BUF])
+                except OSError as e:
+                    if e.errno == errno.EPIPE:
+                        raise IOError("{} exited".format(self._command[0]))
+                    raise
+                data = data[written:]
+
+            if len(readable) > 0:
+                chunk = os.read(stdout, 65536)
+                if len(chunk) == 0:
+                    raise IOError("{} exited".format(self._command[0]))
+                self._buffer += chunk
+                while "\n" in self._buffer and len(replies) < len(lines):
+                    line, self._buffer = self._buffer.split("\n", 1)
+                    replies.append(line)
+
+        return replies
+
+
+class CommandOracle(AsyncOracle):
+    """
+    An oracle that keeps a number of worker processes running an
+    external command, such as a parser, and streams queries to them.
+
+    Each query is written to a worker's standard input as a line of
+    words separated by spaces. For each line, the worker writes a line
+    beginning with 1, true, yes or accept if it accepts the sentence,
+    or with 0, false, no or reject if it does not. Batches of queries
+    are split into chunks of at most batch_size lines, which are
+    written to the workers in parallel.
+
+    If a worker exits, writes something else or does not answer a
+    chunk in time, it is killed and restarted and the chunk is retried
+    on the new worker, up to retries times.
+    """
+
+    def __init__(self, command, num_workers=4, batch_size=256, timeout=None, retries=1,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Initialize from a command. The workers are started when they
+        are first needed.
+
+        :type command: list
+        :param command: The program to run and its arguments
+
+        :type num_workers: int
+        :param num_workers: The number of worker processes
+
+        :type batch_size: int
+        :param batch_size: The number of queries written to a worker at
+            a time
+
+        :type timeout: float
+        :param timeout: If given, the number of seconds a worker may
+            take to answer a chunk of queries
+
+        :type retries: int
+        :param retries: The number of times a chunk is retried after a
+            worker fails
+
+        :type cache_size: int
+        :param cache_size: The maximum number of cached answers
+        """
+        super(CommandOracle, self).__init__(max_in_flight=num_workers, cache_size=cache_size)
+        self._command = list(command)
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._retries = retries
+        self._num_restarts = 0
+        self._restart_lock = Lock()
+        self._workers = None
+
+    def __getstate__(self):
+        state = super(CommandOracle, self).__getstate__()
+        state["_workers"] = None
+        del state["_restart_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._restart_lock = Lock()
+
+    def get_num_restarts(self):
+        """
+        Public accessor for self._num_restarts.
+
+        :rtype: int
+        :return: The number of times a worker has been restarted
+        """
+        return self._num_restarts
+
+    def _get_workers(self):
+        """
+        Creates the queue of idle workers if it does not exist. Workers
+        that have not been started are represented by None.
+
+        :rtype: Queue
+        :return: self._workers
+        """
+        if self._workers is None:
+            self._workers = Queue()
+            for _ in xrange(self._max_in_flight):
+                self._workers.put(None)
+        return self._workers
+
+    def close(self):
+        """
+        Stops the worker processes and threads. They are restarted if
+        more queries are made.
+
+        :rtype: NoneType
+        :return: None
+        """
+        super(CommandOracle, self).close()
+        if self._workers is not None:
+            while not self._workers.empty():
+                worker = self._workers.get()
+                if worker is not None:
+                    worker.close()
+            self._workers = None
+
+    def _ask(self, worker, sentences):
+        """
+        Asks a worker about a chunk of sentences.
+
+        :type worker: _CommandWorker
+        :param worker: A worker
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: list
+        :return: Whether or not the worker accepts each sentence
+        """
+        replies = worker.ask([" ".join(s.get_words()) for s in sentences], self._timeout)
+
+        answers = []
+        for reply in replies:
+            verdict = reply.strip().split(" ", 1)[0].lower()
+            if verdict in _ACCEPT:
+                answers.append(True)
+            elif verdict in _REJECT:
+                answers.append(False)
+            else:
+                raise IOError("{} gave an invalid answer: {!r}".format(self._command[0], reply))
+        return answers
+
+    def _count_restart(self):
+        """
+        Counts a worker restart. Chunks are asked about from several
+        threads, so the count is updated under a lock.
+
+        :rtype: NoneType
+        :return: None
+        """
+        with self._restart_lock:
+            self._num_restarts += 1
+
+    def _generates_chunk(self, sentences):
+        """
+        Asks an idle worker about a chunk of sentences, restarting it
+        if it fails.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: list
+        :return: Whether or not the command accepts each sentence
+        """
+        workers = self._get_workers()
+        worker = workers.get()
         try:
-            parses = self._parser.parse(sentence.get_words())
-            return list(parses) != []
-        except:
-            return False
+            for attempt in xrange(self._retries + 1):
+                if worker is None or not worker.is_alive():
+                    if worker is not None:
+                        self._count_restart()
+                    worker = _CommandWorker(self._command)
+
+                try:
+                    return self._ask(worker, sentences)
+                except IOError:
+                    worker.kill()
+                    worker = None
+                    self._count_restart()
+                    if attempt == self._retries:
+                        raise
+        finally:
+            workers.put(worker)
+
+    def generates(self, sentence):
+        """
+        Asks a worker about the sentence.
+
+        :type sentence: Sentence
+        :param sentence: A sentence
+
+        :rtype: bool
+        :return: Whether or not the command accepts sentence
+        """
+        return self._generates_chunk([sentence])[0]
+
+    def generates_many(self, sentences):
+        """
+        Asks the workers about the sentences, one chunk per worker at a
+        time. Answers are returned in the order of sentences.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: list
+        :return: Whether or not the command accepts each sentence
+        """
+        if len(sentences) <= self._batch_size:
+            return self._generates_chunk(sentences)
+
+        size = self._batch_size
+        chunks = [sentences[i:i + size] for i in xrange(0, len(sentences), size)]
+        answers = []
+        for chunk_answers in self._get_pool().map(self._generates_chunk, chunks, chunksize=1):
+            answers.extend(chunk_answers)
+        return answers
+
+
+def grammar_fingerprint(grammar):
+    """
+    Computes a fingerprint identifying the language of a grammar, which
+    depends neither on the order of its rules nor on the names of its
+    nonterminals.
+
+    Nonterminals are split into classes, starting from a single class,
+    until the nonterminals of each class have the same rules up to the
+    classes of the nonterminals in them. Each class is then named by a
+    digest of its rules, so merging equivalent nonterminals or renaming
+    them leaves the fingerprint unchanged. Grammars with the same
+    fingerprint have the same rules once the nonterminals of each class
+    are merged, so they generate the same language.
+
+    :type grammar: CFG
+    :param grammar: A CFG
+
+    :rtype: str
+    :return: A hex digest of the class of the start symbol and the
+        rules of each class
+    """
+    def encode(symbol, names):
+        if isinstance(symbol, Nonterminal):
+            return u"n" + names[symbol]
+        return u"t" + json.dumps(symbol)
+
+    productions = grammar.productions()
+    nts = set(p.lhs() for p in productions)
+    nts.update(s for p in productions for s in p.rhs() if isinstance(s, Nonterminal))
+    nts.add(grammar.start())
+
+    names = dict((nt, u"") for nt in nts)
+    num_classes = 1
+    while True:
+        rules = dict((nt, set()) for nt in nts)
+        for p in productions:
+            rules[p.lhs()].add(u" ".join(encode(s, names) for s in p.rhs()))
+        names = dict((nt, unicode(sha1(u"\n".join([names[nt]] + sorted(rules[nt]))
+                                        .encode("utf-8")).hexdigest()))
+                     for nt in nts)
+
+        # Each round splits classes, so the classes are stable once
+        # their number stops growing
+        if len(set(names.itervalues())) == num_classes:
+            break
+        num_classes = len(set(names.itervalues()))
+
+    classes = set(u"{} -> {}".format(names[nt], u" | ".join(sorted(rules[nt]))) for nt in nts)
+    text = u"\n".join([names[grammar.start()]] + sorted(classes))
+    return sha1(text.encode("utf-8")).hexdigest()
+
+
+class StoredOracle(Oracle):
+    """
+    Wraps an oracle so that its answers are kept in an sqlite database
+    and shared by every run with the same target language. Answers are
+    keyed by a fingerprint of the language and by the words of each
+    sentence, since the interned codes of Sentences differ from run to
+    run.
+
+    The database is opened in write-ahead logging mode, so several
+    processes can read it while one of them writes. The answers
+    computed for a batch are written back in a single transaction.
+    """
+
+    def __init__(self, oracle, filename, fingerprint=None, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Initialize from another Oracle and a database file.
+
+        :type oracle: Oracle
+        :param oracle: The oracle answering queries missing from the
+            database
+
+        :type filename: str
+        :param filename: The database file, which is created if needed
+
+        :type fingerprint: str
+        :param fingerprint: A string identifying the language of the
+            oracle. It may be omitted if oracle is a GrammarOracle.
+
+        :type cache_size: int
+        :param cache_size: The maximum number of cached answers
+        """
+        super(StoredOracle, self).__init__(cache_size=cache_size)
+        if fingerprint is None:
+            if not isinstance(oracle, GrammarOracle):
+                raise ValueError("A fingerprint is needed for oracles other than GrammarOracles")
+            fingerprint = grammar_fingerprint(oracle.get_grammar())
+
+        self._oracle = oracle
+        self._filename = filename
+        self._fingerprint = fingerprint
+        self._hits = 0
+        self._misses = 0
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = super(StoredOracle, self).__getstate__()
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
+
+    def _connect(self):
+        """
+        Opens the database if it is not open in this process. A
+        connection inherited through fork is left to the parent, since
+        sqlite connections cannot be shared between processes.
+
+        :rtype: sqlite3.Connection
+        :return: self._connection
+        """
+        if self._pid != os.getpid():
+            self._connection = None
+        if self._connection is None:
+            self._connection = sqlite3.connect(self._filename, timeout=60)
+            self._pid = os.getpid()
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS answers ("
+                                     "fingerprint TEXT, sentence TEXT, answer INTEGER, "
+                                     "PRIMARY KEY (fingerprint, sentence))")
+            self._connection.commit()
+        return self._connection
+
+    def close(self):
+        """
+        Closes the database. It is reopened if more queries are made.
+
+        :rtype: NoneType
+        :return: None
+        """
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def get_fingerprint(self):
+        """
+        Public accessor for self._fingerprint.
+
+        :rtype: str
+        :return: self._fingerprint
+        """
+        return self._fingerprint
+
+    def get_hits(self):
+        """
+        Public accessor for self._hits.
+
+        :rtype: int
+        :return: The number of answers found in the database
+        """
+        return self._hits
+
+    def get_misses(self):
+        """
+        Public accessor for self._misses.
+
+        :rtype: int
+        :return: The number of answers computed by the wrapped oracle
+        """
+        return self._misses
+
+    def generates(self, sentence):
+        """
+        Looks up the answer in the database, asking the wrapped oracle
+        if it is missing.
+
+        :type sentence: Sentence
+        :param sentence: A sentence
+
+        :rtype: bool
+        :return: Whether or not the wrapped oracle accepts sentence
+        """
+        return self.generates_many([sentence])[0]
+
+    def generates_many(self, sentences):
+        """
+        Looks up the answers in the database, asking the wrapped oracle
+        about the missing ones in one batch and storing its answers.
+
+        :type sentences: list
+        :param sentences: A list of Sentences
+
+        :rtype: list
+        :return: Whether or not the wrapped oracle accepts each sentence
+        """
+        connection = self._connect()
+        keys = [json.dumps(s.get_words()) for s in sentences]
+
+        # sqlite limits the number of parameters in a query
+        stored = dict()
+        for i in xrange(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            query = ("SELECT sentence, answer FROM answers WHERE fingerprint = ? "
+                     "AND sentence IN ({})".format(", ".join("?" * len(chunk))))
+            stored.update(connection.execute(query, [self._fingerprint] + chunk))
+
+        missing = [i for i, key in enumerate(keys) if key not in stored]
+        self._hits += len(keys) - len(missing)
+        self._misses += len(missing)
+        if len(missing) > 0:
+            answers = self._oracle.generates_many([sentences[i] for i in missing])
+            rows = [(self._fingerprint, keys[i], int(a)) for i, a in zip(missing, answers)]
+            with connection:
+                connection.executemany("INSERT OR IGNORE INTO answers VALUES (?, ?, ?)", rows)
+            stored.update((keys[i], a) for i, a in zip(missing, answers))
+
+        return [bool(stored[key]) for key in keys]
@@ -0,0 +1,446 @@
+from nltk.grammar import CFG, Nonterminal
+
+from scl import ids_from_mask
+
+
+class EarleyRecognizer(object):
+    """
+    A membership recognizer for CFGs based on Earley's algorithm.
+
+    Unlike nltk's parsers, it never builds parse trees, so deciding
+    membership takes polynomial time even for ambiguous grammars.
+    Empty rules are handled following Aycock and Horspool (2002).
+
+    A chart is a list of columns: one for the empty prefix, and one for
+    each word read so far. Columns are never modified once built, so a
+    chart for a prefix is made from the chart of a longer one by
+    deleting the columns after it.
+    """
+
+    def __init__(self, grammar):
+        """
+        Compile a CFG.
+
+        :type grammar: CFG
+        :param grammar: The grammar to recognize
+        """
+        # Nonterminals are replaced by ints, which are much faster to
+        # hash and compare than nltk Nonterminals
+        nt_ids = dict()
+        for p in grammar.productions():
+            nt_ids.setdefault(p.lhs(), len(nt_ids))
+
+        self._start = nt_ids.get(grammar.start(), -1)
+        self._lhs = []
+        self._rhs = []
+        self._rules_by_lhs = dict()
+        for p in grammar.productions():
+            lhs = nt_ids[p.lhs()]
+            rhs = tuple(nt_ids.get(s, -1) if isinstance(s, Nonterminal) else s
+                        for s in p.rhs())
+            self._rules_by_lhs.setdefault(lhs, []).append(len(self._lhs))
+            self._lhs.append(lhs)
+            self._rhs.append(rhs)
+
+        self._nullable = self._find_nullable()
+
+        agenda = [(r, 0, 0) for r in self._rules_by_lhs.get(self._start, [])]
+        self._initial_column = self._close([], agenda)
+
+    def _find_nullable(self):
+        """
+        Finds the nonterminals that derive the empty string.
+
+        :rtype: set
+        :return: The set of nullable nonterminals
+        """
+        nullable = set()
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in zip(self._lhs, self._rhs):
+                if lhs not in nullable and all(s in nullable for s in rhs):
+                    nullable.add(lhs)
+                    changed = True
+
+        return nullable
+
+    def _close(self, chart, agenda):
+        """
+        Builds a new column by running prediction and completion on
+        an agenda of items until no new items are found.
+
+        :type chart: list
+        :param chart: The columns preceding the new column
+
+        :type agenda: list
+        :param agenda: Items of the form (rule, dot, origin)
+
+        :rtype: tuple
+        :return: A column of the form (waiting, scans, accepting),
+            where waiting maps nonterminals and scans maps terminals
+            to the items expecting them
+        """
+        index = len(chart)
+        items = set(agenda)
+        waiting = dict()
+        scans = dict()
+        accepting = False
+
+        while len(agenda) > 0:
+            rule, dot, origin = agenda.pop()
+            rhs = self._rhs[rule]
+
+            if dot == len(rhs):
+                # Completion
+                lhs = self._lhs[rule]
+                if lhs == self._start and origin == 0:
+                    accepting = True
+
+                if origin == index:
+                    parents = waiting.get(lhs, [])
+                else:
+                    parents = chart[origin][0].get(lhs, [])
+
+                for p_rule, p_dot, p_origin in parents:
+                    item = (p_rule, p_dot + 1, p_origin)
+                    if item not in items:
+                        items.add(item)
+                        agenda.append(item)
+                continue
+
+            symbol = rhs[dot]
+            if type(symbol) is not int:
+                scans.setdefault(symbol, []).append((rule, dot, origin))
+                continue
+
+            # Prediction
+            waiting.setdefault(symbol, []).append((rule, dot, origin))
+            new_items = [(r, 0, index) for r in self._rules_by_lhs.get(symbol, [])]
+            if symbol in self._nullable:
+                new_items.append((rule, dot + 1, origin))
+
+            for item in new_items:
+                if item not in items:
+                    items.add(item)
+                    agenda.append(item)
+
+        return waiting, scans, accepting
+
+    def initial_chart(self):
+        """
+        Makes a chart for the empty prefix.
+
+        :rtype: list
+        :return: A chart
+        """
+        return [self._initial_column]
+
+    def advance(self, chart, word):
+        """
+        Extends a chart by one word, in place.
+
+        :type chart: list
+        :param chart: A chart
+
+        :type word: str
+        :param word: The next word
+
+        :rtype: bool
+        :return: False, leaving the chart unchanged, if no sentence of
+            the language starts with the words read so far and word
+        """
+        scanned = chart[-1][1].get(word)
+        if scanned is None:
+            return False
+
+        agenda = [(rule, dot + 1, origin) for rule, dot, origin in scanned]
+        chart.append(self._close(chart, agenda))
+        return True
+
+    @staticmethod
+    def accepts(chart):
+        """
+        Checks whether the words read into a chart form a sentence.
+
+        :type chart: list
+        :param chart: A chart
+
+        :rtype: bool
+        :return: Whether the words read so far form a sentence
+        """
+        return chart[-1][2]
+
+    def recognize(self, words):
+        """
+        Decides whether the grammar generates a sequence of words.
+
+        :type words: tuple
+        :param words: A sequence of words
+
+        :rtype: bool
+        :return: Whether the grammar generates words
+        """
+        chart = self.initial_chart()
+        for word in words:
+            if not self.advance(chart, word):
+                return False
+
+        return self.accepts(chart)
+
+    def recognize_many(self, sentences):
+        """
+        Decides whether the grammar generates each of several
+        sequences of words.
+
+        The sequences are visited in sorted order, which walks the trie
+        of their prefixes, and each one reuses the columns built for
+        the prefix it shares with the previous one. Queries made by
+        wrapping many strings in a context, or one string in contexts
+        with the same left side, share long prefixes.
+
+        :type sentences: list
+        :param sentences: Sequences of words
+
+        :rtype: list
+        :return: Whether the grammar generates each sequence
+        """
+        answers = [False] * len(sentences)
+        order = sorted(xrange(len(sentences)), key=sentences.__getitem__)
+
+        # The chart holds the columns for the first words of prev, up
+        # to the first word no sentence of the language continues with
+        chart = self.initial_chart()
+        prev = ()
+        for index in order:
+            words = sentences[index]
+            common = 0
+            limit = min(len(prev), len(words))
+            while common < limit and words[common] == prev[common]:
+                common += 1
+
+            del chart[common + 1:]
+            for word in words[len(chart) - 1:]:
+                if not self.advance(chart, word):
+                    break
+
+            answers[index] = len(chart) == len(words) + 1 and self.accepts(chart)
+            prev = words
+
+        return answers
+
+
+class CYKRecognizer(object):
+    """
+    A membership recognizer for grammars in the form of the learners'
+    hypotheses, whose rules are start -> A, A -> B C, or A -> a.
+
+    Rules are kept in tables indexed by their right-hand sides, with
+    the left-hand sides of each entry stored as a bitmask over
+    nonterminal IDs. The tables are updated in place as rules are
+    added and removed, so the recognizer never has to be rebuilt.
+    """
+
+    def __init__(self, start, productions=None):
+        """
+        Initialize with a start symbol and some rules.
+
+        :type start: Nonterminal
+        :param start: The start symbol
+
+        :type productions: set
+        :param productions: Initial Productions
+        """
+        self._start = start
+        self._nt_ids = dict()
+        self._productions = set()
+
+        # Maps terminals to left-hand sides
+        self._lexical = dict()
+
+        # Maps pairs of nonterminal IDs to left-hand sides
+        self._binary = dict()
+
+        # Maps the ID of B to the IDs of all C such that some binary
+        # rule has B C as its right-hand side
+        self._right_ids = dict()
+
+        # The IDs of the nonterminals A with a rule start -> A
+        self._start_ids = 0L
+
+        if productions is not None:
+            self.update(productions)
+
+    def __len__(self):
+        return len(self._productions)
+
+    def __contains__(self, production):
+        return production in self._productions
+
+    def _nt_id(self, nt):
+        """
+        Looks up the ID of a nonterminal, assigning one if necessary.
+
+        :type nt: Nonterminal
+        :param nt: A nonterminal
+
+        :rtype: int
+        :return: The ID of nt
+        """
+        nt_id = self._nt_ids.get(nt)
+        if nt_id is None:
+            nt_id = len(self._nt_ids)
+            self._nt_ids[nt] = nt_id
+        return nt_id
+
+    def _toggle(self, production, add):
+        """
+        Adds a rule to the tables or removes a rule from them.
+
+        :type production: Production
+        :param production: A rule
+
+        :type add: bool
+        :param add: Whether to add or remove the rule
+
+        :rtype: NoneType
+        :return: None
+        """
+        lhs = production.lhs()
+        rhs = production.rhs()
+        lhs_bit = 1L << self._nt_id(lhs)
+
+        if lhs == self._start and len(rhs) == 1 and isinstance(rhs[0], Nonterminal):
+            rhs_bit = 1L << self._nt_id(rhs[0])
+            if add:
+                self._start_ids |= rhs_bit
+            else:
+                self._start_ids &= ~rhs_bit
+
+        elif len(rhs) == 1 and not isinstance(rhs[0], Nonterminal):
+            mask = self._lexical.get(rhs[0], 0L)
+            mask = mask | lhs_bit if add else mask & ~lhs_bit
+            if mask == 0:
+                self._lexical.pop(rhs[0], None)
+            else:
+                self._lexical[rhs[0]] = mask
+
+        elif len(rhs) == 2 and all(isinstance(s, Nonterminal) for s in rhs):
+            key = (self._nt_id(rhs[0]), self._nt_id(rhs[1]))
+            mask = self._binary.get(key, 0L)
+            mask = mask | lhs_bit if add else mask & ~lhs_bit
+            right_ids = self._right_ids.get(key[0], 0L)
+            if mask == 0:
+                self._binary.pop(key, None)
+                right_ids &= ~(1L << key[1])
+            else:
+                self._binary[key] = mask
+                right_ids |= 1L << key[1]
+            self._right_ids[key[0]] = right_ids
+
+        else:
+            raise ValueError("Rule {} is not of the form start -> A, "
+                             "A -> B C, or A -> a".format(production))
+
+    def add(self, production):
+        """
+        Adds a rule.
+
+        :type production: Production
+        :param production: A rule
+
+        :rtype: NoneType
+        :return: None
+        """
+        if production not in self._productions:
+            self._toggle(production, True)
+            self._productions.add(production)
+
+    def remove(self, production):
+        """
+        Removes a rule, if present.
+
+        :type production: Production
+        :param production: A rule
+
+        :rtype: NoneType
+        :return: None
+        """
+        if production in self._productions:
+            self._toggle(production, False)
+            self._productions.remove(production)
+
+    def update(self, productions):
+        """
+        Changes the rules to a new set, touching only the rules that
+        differ from the current ones.
+
+        :type productions: set
+        :param productions: The new set of Productions
+
+        :rtype: NoneType
+        :return: None
+        """
+        productions = set(productions)
+        for p in self._productions - productions:
+            self.remove(p)
+        for p in productions - self._productions:
+            self.add(p)
+
+    def get_productions(self):
+        """
+        Public accessor for the rules.
+
+        :rtype: set
+        :return: The current Productions
+        """
+        return set(self._productions)
+
+    def to_cfg(self):
+        """
+        Builds an nltk grammar with the current rules.
+
+        :rtype: CFG
+        :return: A CFG
+        """
+        return CFG(self._start, list(self._productions), calculate_leftcorners=False)
+
+    def recognize(self, words):
+        """
+        Decides whether the grammar generates a sequence of words.
+
+        :type words: tuple
+        :param words: A sequence of words
+
+        :rtype: bool
+        :return: Whether the grammar generates words
+        """
+        n = len(words)
+        if n == 0 or self._start_ids == 0:
+            return False
+
+        # cells[i][j] is the bitmask of nonterminals deriving words[i:j]
+        cells = [[0L] * (n + 1) for _ in range(n)]
+        for i, word in enumerate(words):
+            cells[i][i + 1] = self._lexical.get(word, 0L)
+            if cells[i][i + 1] == 0:
+                return False
+
+        for length in range(2, n + 1):
+            for i in range(0, n - length + 1):
+                j = i + length
+                mask = 0L
+                for k in range(i + 1, j):
+                    left = cells[i][k]
+                    right = cells[k][j]
+                    if left == 0 or right == 0:
+                        continue
+
+                    for b in ids_from_mask(left):
+                        c_mask = self._right_ids.get(b, 0L) & right
+                        if c_mask != 0:
+                            for c in ids_from_mask(c_mask):
+                                mask |= self._binary[(b, c)]
+                cells[i][j] = mask
+
+        return cells[0][n] & self._start_ids != 0
@@ -1,7 +1,89 @@
+from array import array
+from binascii import hexlify, unhexlify
+
+_CODE_TYPE = "I"
+_CODE_SIZE = array(_CODE_TYPE).itemsize
+
+
+class SymbolTable(object):
+    """
+    Interns words as small ints, so that sequences of words can be
+    stored as compact byte strings.
+    """
+
+    def __init__(self):
+        self._ids = dict()
+        self._words = []
+
+    def __len__(self):
+        return len(self._words)
+
+    def intern(self, word):
+        """
+        Looks up the int representing a word, assigning a new one if
+        the word has not been seen before.
+
+        :type word: str
+        :param word: A word
+
+        :rtype: int
+        :return: The int representing word
+        """
+        try:
+            return self._ids[word]
+        except KeyError:
+            self._ids[word] = len(self._words)
+            self._words.append(word)
+            return self._ids[word]
+
+    def lookup(self, symbol):
+        """
+        Looks up the word represented by an int.
+
+        :type symbol: int
+        :param symbol: An int assigned by intern
+
+        :rtype: str
+        :return: The word represented by symbol
+        """
+        return self._words[symbol]
+
+    def encode(self, words):
+        """
+        Encodes a sequence of words as a byte string.
+
+        :type words: list
+        :param words: A list of words
+
+        :rtype: str
+        :return: The words, as a byte string of interned ints
+        """
+        return array(_CODE_TYPE, [self.intern(w) for w in words]).tostring()
+
+    def decode(self, codes):
+        """
+        Decodes a byte string produced by encode.
+
+        :type codes: str
+        :param codes: A byte string of interned ints
+
+        :rtype: tuple
+        :return: The words represented by codes
+        """
+        symbols = array(_CODE_TYPE)
+        symbols.fromstring(codes)
+        return tuple(self._words[s] for s in symbols)
+
+
+SYMBOLS = SymbolTable()
+
+
 class Sentence(object):
     """
-    A sentence.
+    A sentence. Words are interned in SYMBOLS and stored as a byte
+    string, which is cheap to hash, compare and concatenate.
     """
+    __slots__ = ("_codes", "_hash")
 
     def __init__(self, words):
         """
@@ -10,39 +92,86 @@ class Sentence(object):
         :type words: list
         :param words: A list of words
         """
-        self._words = tuple(words)
+        self._codes = SYMBOLS.encode(words)
+        self._hash = hash(self._codes)
 
     def __getitem__(self, key):
-        return self._words[key]
+        return self.get_words()[key]
 
     def __eq__(self, other):
-        return self._words == other.get_words()
+        return self._codes == other.get_codes()
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        return hash(self._words)
+        return self._hash
+
+    def __reduce__(self):
+        return Sentence, (self.get_words(),)
 
     def __add__(self, other):
         if type(other) is Sentence:
-            return Sentence(self._words + other.get_words())
+            return Sentence.from_codes(self._codes + other.get_codes())
         elif type(other) is SentenceSet:
             return SentenceSet([self + s for s in other])
         else:
             raise TypeError("Summands must be Sentences or SentenceSets.")
 
     def __len__(self):
-        return len(self._words)
+        return len(self._codes) // _CODE_SIZE
 
     def __str__(self):
         return self.to_string()
 
     def get_words(self):
         """
-        Public accessor for self._words.
+        Decodes the words of this Sentence.
 
         :rtype: tuple
-        :return: self._words
+        :return: The words of this Sentence
+        """
+        return SYMBOLS.decode(self._codes)
+
+    def get_codes(self):
+        """
+        Public accessor for self._codes.
+
+        :rtype: str
+        :return: self._codes
+        """
+        return self._codes
+
+    def substring(self, i, j):
+        """
+        Extracts the substring spanning words i through j - 1.
+
+        :type i: int
+        :param i: The index of the first word
+
+        :type j: int
+        :param j: The index after the last word
+
+        :rtype: Sentence
+        :return: The substring
+        """
+        return Sentence.from_codes(self._codes[i * _CODE_SIZE:j * _CODE_SIZE])
+
+    def context(self, i, j):
+        """
+        Extracts the context surrounding words i through j - 1.
+
+        :type i: int
+        :param i: The index of the first word
+
+        :type j: int
+        :param j: The index after the last word
+
+        :rtype: Context
+        :return: The context
         """
-        return self._words
+        return Context.from_codes(self._codes[:i * _CODE_SIZE],
+                                  self._codes[j * _CODE_SIZE:])
 
     def to_string(self):
         """
@@ -51,7 +180,7 @@ class Sentence(object):
         :rtype: str
         :return: This Sentence, as a string
         """
-        return " ".join(self._words)
+        return " ".join(self.get_words())
 
     @staticmethod
     def from_string(string):
@@ -66,6 +195,22 @@ class Sentence(object):
         """
         return Sentence(string.split(" "))
 
+    @staticmethod
+    def from_codes(codes):
+        """
+        Instantiates a Sentence from a byte string of interned ints.
+
+        :type codes: str
+        :param codes: A byte string produced by SYMBOLS.encode
+
+        :rtype: Sentence
+        :return: A Sentence
+        """
+        sentence = Sentence.__new__(Sentence)
+        sentence._codes = codes
+        sentence._hash = hash(codes)
+        return sentence
+
 
 class SentenceSet(object):
     """
@@ -202,8 +347,10 @@ class SentenceSet(object):
 
 class Context(object):
     """
-    A 2D context.
+    A 2D context. Like Sentences, both sides are stored as byte
+    strings of interned ints.
     """
+    __slots__ = ("_left", "_right", "_hash")
 
     def __init__(self, left, right):
         """
@@ -215,21 +362,36 @@ class Context(object):
         :type right: list
         :param right: The right side
         """
-        self._left = tuple(left)
-        self._right = tuple(right)
+        self._left = SYMBOLS.encode(left)
+        self._right = SYMBOLS.encode(right)
+        self._hash = hash((self._left, self._right))
 
     def get_left(self):
-        return self._left
+        return SYMBOLS.decode(self._left)
 
     def get_right(self):
-        return self._right
+        return SYMBOLS.decode(self._right)
+
+    def get_codes(self):
+        """
+        Public accessor for self._left and self._right.
+
+        :rtype: tuple
+        :return: (self._left, self._right)
+        """
+        return self._left, self._right
 
     def __eq__(self, other):
-        return self._left == other.get_left() and \
-               self._right == other.get_right()
+        return (self._left, self._right) == other.get_codes()
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        return hash((self._left, self._right))
+        return self._hash
+
+    def __reduce__(self):
+        return Context, (self.get_left(), self.get_right())
 
     def wrap(self, sentence):
         """
@@ -244,7 +406,8 @@ class Context(object):
         if type(sentence) is not Sentence:
             raise TypeError("Context.wrap must be used for Sentences.")
 
-        return Sentence(self._left + sentence.get_words() + self._right)
+        return Sentence.from_codes(self._left + sentence.get_codes() +
+                                   self._right)
 
     def wrap_set(self, sentenceset):
         """
@@ -268,7 +431,7 @@ class Context(object):
         :rtype: tuple
         :return: This context as a tuple of strings
         """
-        return " ".join(self._left), " ".join(self._right)
+        return " ".join(self.get_left()), " ".join(self.get_right())
 
     @staticmethod
     def from_string_tuple(string_tuple):
@@ -285,71 +448,303 @@ class Context(object):
         right = string_tuple[1].split(" ")
         return Context(left, right)
 
+    @staticmethod
+    def from_codes(left, right):
+        """
+        Instantiates a Context from byte strings of interned ints.
+
+        :type left: str
+        :param left: The left side, as produced by SYMBOLS.encode
+
+        :type right: str
+        :param right: The right side, as produced by SYMBOLS.encode
+
+        :rtype: Context
+        :return: A Context
+        """
+        context = Context.__new__(Context)
+        context._left = left
+        context._right = right
+        context._hash = hash((left, right))
+        return context
+
     def __str__(self):
         return str(self.to_string_tuple())
 
 
-class ContextSet(object):
+def mask_from_ids(ids):
+    """
+    Converts a list of bit positions to a bitmask.
+
+    :type ids: list
+    :param ids: A list of non-negative ints
+
+    :rtype: long
+    :return: A bitmask with the bits in ids set
+    """
+    if len(ids) == 0:
+        return 0L
+
+    bits = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bits[i // 8] |= 1 << (i % 8)
+
+    bits.reverse()
+    return long(hexlify(bits), 16)
+
+
+def ids_from_mask(mask):
+    """
+    Converts a bitmask to a list of bit positions.
+
+    :type mask: long
+    :param mask: A bitmask
+
+    :rtype: list
+    :return: The positions of the bits set in mask, in increasing order
+    """
+    bits = bin(mask)[:1:-1]
+    return [i for i, b in enumerate(bits) if b == "1"]
+
+
+def mask_to_bytes(mask):
+    """
+    Converts a bitmask to a byte string.
+
+    :type mask: long
+    :param mask: A bitmask
+
+    :rtype: str
+    :return: The bitmask as a big-endian byte string
+    """
+    if mask == 0:
+        return ""
+
+    digits = "%x" % mask
+    if len(digits) % 2 == 1:
+        digits = "0" + digits
+    return unhexlify(digits)
+
+
+def mask_from_bytes(data):
+    """
+    Converts a byte string produced by mask_to_bytes to a bitmask.
+
+    :type data: str
+    :param data: A byte string
+
+    :rtype: long
+    :return: A bitmask
+    """
+    if len(data) == 0:
+        return 0L
+    return long(hexlify(data), 16)
+
+
+class ContextIndex(object):
+    """
+    Assigns each Context a unique ID, which is used as its position in
+    the bitmasks of BitContextSets. Each learner keeps its own index,
+    so that its bitmasks only span the Contexts it has seen; CONTEXTS
+    is the index used by default.
+    """
+
+    def __init__(self):
+        self._ids = dict()
+        self._contexts = []
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def index(self, context):
+        """
+        Looks up the ID of a Context, assigning a new one if the
+        Context has not been seen before.
+
+        :type context: Context
+        :param context: A Context
+
+        :rtype: int
+        :return: The ID of context
+        """
+        try:
+            return self._ids[context]
+        except KeyError:
+            self._ids[context] = len(self._contexts)
+            self._contexts.append(context)
+            return self._ids[context]
+
+    def find(self, context):
+        """
+        Looks up the ID of a Context without assigning a new one.
+
+        :type context: Context
+        :param context: A Context
+
+        :rtype: int
+        :return: The ID of context, or None if it has none
+        """
+        return self._ids.get(context)
+
+    def get_contexts(self):
+        """
+        Lists the indexed Contexts.
+
+        :rtype: list
+        :return: The Contexts, in order of their IDs
+        """
+        return list(self._contexts)
+
+    def lookup(self, context_id):
+        """
+        Looks up the Context with a given ID.
+
+        :type context_id: int
+        :param context_id: An ID assigned by index
+
+        :rtype: Context
+        :return: The Context with ID context_id
+        """
+        return self._contexts[context_id]
+
+    def to_mask(self, contexts):
+        """
+        Converts Contexts to a bitmask.
+
+        :type contexts: list
+        :param contexts: A list of Contexts
+
+        :rtype: long
+        :return: A bitmask with the bits of contexts set
+        """
+        return mask_from_ids([self.index(c) for c in contexts])
+
+
+CONTEXTS = ContextIndex()
+
+
+class BitContextSet(object):
     """
-    A set of Contexts, since Contexts are not hashable.
+    A set of Contexts that stores membership as a bitmask over the IDs
+    assigned by a ContextIndex. Subset tests, intersections, equality
+    and hashing are bitwise operations on a single long. Sets combined
+    with each other must share their index.
     """
+    __slots__ = ("_mask", "_index")
 
-    def __init__(self, contexts):
+    def __init__(self, contexts, index=CONTEXTS):
         """
         Initialize from a list of Contexts.
 
         :param contexts: A list of Contexts.
+
+        :type index: ContextIndex
+        :param index: The index assigning the bits of the Contexts
+        """
+        self._index = index
+        self._mask = index.to_mask(contexts)
+
+    def _mask_of(self, contextset):
+        """
+        Finds the bitmask of a BitContextSet or of a list of Contexts,
+        over the index of this BitContextSet.
+
+        :type contextset: BitContextSet
+        :param contextset: A BitContextSet or a list of Contexts
+
+        :rtype: long
+        :return: The bitmask of contextset
         """
-        self._contexts = set(contexts)
+        if type(contextset) is BitContextSet:
+            return contextset.get_mask()
+        return self._index.to_mask(contextset)
 
     def __iter__(self):
-        return iter(self._contexts)
+        return iter([self._index.lookup(i) for i in ids_from_mask(self._mask)])
+
+    def get_mask(self):
+        """
+        Public accessor for self._mask.
+
+        :rtype: long
+        :return: self._mask
+        """
+        return self._mask
+
+    def set_mask(self, mask):
+        """
+        Public mutator for self._mask.
+
+        :type mask: long
+        :param mask: The value to set self._mask to
+
+        :rtype: NoneType
+        :return: None
+        """
+        self._mask = mask
+
+    def get_index(self):
+        """
+        Public accessor for self._index.
+
+        :rtype: ContextIndex
+        :return: self._index
+        """
+        return self._index
 
     def get_contexts(self):
         """
-        Public accessor for self._contexts
+        Decodes the Contexts in this BitContextSet.
 
         :rtype: set
-        :return: self._contexts
+        :return: The Contexts in this BitContextSet
         """
-        return self._contexts
+        return set(self)
 
     def set_contexts(self, contexts):
         """
-        Public mutator for self._contexts
+        Replaces the Contexts in this BitContextSet.
 
         :type contexts: set
-        :param contexts: The value to set self._contexts to
+        :param contexts: The new Contexts
 
         :rtype: NoneType
         :return: None
         """
-        self._contexts = contexts
+        self._mask = self._index.to_mask(contexts)
 
     def __contains__(self, context):
         """
-        Check if this ContextSet contains a context.
+        Check if this BitContextSet contains a context.
 
         :type context: Context
         :param context: A context
 
         :rtype: bool
-        :return: Whether or not this ContextSet contains context.
+        :return: Whether or not this BitContextSet contains context.
         """
-        return context in self._contexts
+        # A Context without an ID is in no set, and is not given one
+        context_id = self._index.find(context)
+        return context_id is not None and (self._mask >> context_id) & 1 == 1
 
     def __eq__(self, other):
-        return self._contexts == other.get_contexts()
+        return self._mask == self._mask_of(other)
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        return hash(frozenset(self._contexts))
+        return hash(self._mask)
 
     def __len__(self):
-        return len(self._contexts)
+        return bin(self._mask).count("1")
+
+    def __reduce__(self):
+        return BitContextSet, (list(self), self._index)
 
     def add(self, context):
         """
-        Adds a context to this ContextSet.
+        Adds a context to this BitContextSet.
 
         :type context: Context
         :param context: A Context
@@ -357,118 +752,280 @@ class ContextSet(object):
         :rtype: NoneType
         :return: None
         """
-        self._contexts.add(context)
+        self._mask |= 1L << self._index.index(context)
+
+    def difference(self, *others):
+        """
+        Computes the difference of this with other BitContextSets.
+
+        :type others: BitContextSet
+        :param others: Other BitContextSets
+
+        :rtype: BitContextSet
+        :return: The difference of all the BitContextSets.
+        """
+        mask = self._mask
+        for o in others:
+            mask &= ~self._mask_of(o)
+        return BitContextSet.from_mask(mask, self._index)
 
     def intersection(self, *others):
         """
-        Computes the intersection of this with another ContextSet.
+        Computes the intersection of this with other BitContextSets.
 
-        :type others: ContextSet
-        :param others: Other ContextSets
+        :type others: BitContextSet
+        :param others: Other BitContextSets
 
-        :rtype: ContextSet
-        :return: The intersection of all the ContextSets.
+        :rtype: BitContextSet
+        :return: The intersection of all the BitContextSets.
         """
-        other_contexts = [o.get_contexts() for o in others]
-        return ContextSet(self._contexts.intersection(*other_contexts))
+        mask = self._mask
+        for o in others:
+            mask &= self._mask_of(o)
+        return BitContextSet.from_mask(mask, self._index)
 
     def intersection_update(self, *others):
         """
-        Computes the intersection of this with another ContextSet,
-        and updates this ContextSet to be the intersection.
+        Computes the intersection of this with other BitContextSets,
+        and updates this BitContextSet to be the intersection.
 
-        :type others: ContextSet
-        :param others: Other ContextSets
+        :type others: BitContextSet
+        :param others: Other BitContextSets
 
         :return: None
         """
-        other_contexts = [o.get_contexts() for o in others]
-        self._contexts.intersection_update(*other_contexts)
+        for o in others:
+            self._mask &= self._mask_of(o)
 
     def issubset(self, other):
         """
-        Checks to see if this ContextSet is a subset
-        of another.
+        Checks to see if this BitContextSet is a subset of another.
 
-        :type other: ContextSet
-        :param other: Another ContextSet
+        :type other: BitContextSet
+        :param other: Another BitContextSet
 
         :rtype: bool
-        :return: True if this ContextSet is a subset of the
+        :return: True if this BitContextSet is a subset of the
             other, False otherwise
         """
-        return self._contexts.issubset(other.get_contexts())
+        return self._mask & ~self._mask_of(other) == 0
 
     def issuperset(self, other):
         """
-        Checks to see if this ContextSet is a superset
-        of another.
+        Checks to see if this BitContextSet is a superset of another.
 
-        :type other: ContextSet
-        :param other: Another ContextSet
+        :type other: BitContextSet
+        :param other: Another BitContextSet
 
         :rtype: bool
-        :return: True if this ContextSet is a superset of the
+        :return: True if this BitContextSet is a superset of the
             other, False otherwise
         """
-        return self._contexts.issuperset(other.get_contexts())
+        return self._mask_of(other) & ~self._mask == 0
 
     def union(self, contextset):
         """
-        Computes the union of this with another ContextSet.
+        Computes the union of this with another BitContextSet.
 
-        :type contextset: ContextSet
-        :param contextset: Another ContextSet
+        :type contextset: BitContextSet
+        :param contextset: Another BitContextSet
 
-        :rtype: ContextSet
-        :return: The union of the two ContextSets.
+        :rtype: BitContextSet
+        :return: The union of the two BitContextSets.
         """
-        new = ContextSet([])
-        new.set_contexts(self._contexts.union(contextset.get_contexts()))
-        return new
+        return BitContextSet.from_mask(self._mask | self._mask_of(contextset), self._index)
 
     def update(self, contextset):
         """
-        Unions another ContextSet into this one.
+        Unions another BitContextSet into this one.
 
-        :type contextset: ContextSet
-        :param contextset: Another ContextSet
+        :type contextset: BitContextSet
+        :param contextset: Another BitContextSet
 
         :rtype: NoneType
         :return: None
         """
-        self._contexts.update(contextset.get_contexts())
+        self._mask |= self._mask_of(contextset)
 
     def wrap(self, sentence):
         """
-        Wraps this ContextSet around a Sentence.
+        Wraps this BitContextSet around a Sentence.
 
         :type sentence: Sentence
         :param sentence: A Sentence
 
         :rtype: SentenceSet
-        :return: This ContextSet wrapped around sentence
+        :return: This BitContextSet wrapped around sentence
         """
         if type(sentence) is not Sentence:
-            raise TypeError("ContextSet.wrap must be used for Sentences.")
+            raise TypeError("BitContextSet.wrap must be used for Sentences.")
 
         return SentenceSet([c.wrap(sentence) for c in self])
 
     def wrap_set(self, sentenceset):
         """
-        Wraps this Context around a set of Sentences.
+        Wraps this BitContextSet around a set of Sentences.
 
         :type sentenceset: SentenceSet
         :param sentenceset: A set of Sentences
 
         :rtype: SentenceSet
-        :return: This ContextSet wrapped around sentenceset
+        :return: This BitContextSet wrapped around sentenceset
         """
         if type(sentenceset) is not SentenceSet:
-            raise TypeError("ContextSet.wrap_set must be used for SentenceSets.")
+            raise TypeError("BitContextSet.wrap_set must be used for "
+                            "SentenceSets.")
 
         result = SentenceSet([])
         for s in sentenceset:
             result.update(self.wrap(s))
 
         return result
+
+    @staticmethod
+    def from_mask(mask, index=CONTEXTS):
+        """
+        Instantiates a BitContextSet from a bitmask.
+
+        :type mask: long
+        :param mask: A bitmask over the IDs assigned by index
+
+        :type index: ContextIndex
+        :param index: The index assigning the bits of mask
+
+        :rtype: BitContextSet
+        :return: A BitContextSet
+        """
+        contextset = BitContextSet.__new__(BitContextSet)
+        contextset._mask = mask
+        contextset._index = index
+        return contextset
+
+
+# BitContextSet is a drop-in replacement for the old set-backed
+# ContextSet, which is kept as an alias for code that still uses it
+ContextSet = BitContextSet
+
+
+class SubsetIndex(object):
+    """
+    An inverted index over BitContextSets, answering the question
+    "which indexed sets are subsets of X" without testing each set.
+
+    Each set is registered under an int key. For each Context ID, the
+    index keeps a bitmask of the keys whose sets contain it, so the
+    keys whose sets are not subsets of X are the union of those
+    bitmasks over the Contexts not in X. When only some keys are
+    considered, only the Contexts in their sets are visited.
+    """
+
+    def __init__(self):
+        self._keys = 0L
+        self._support = 0L
+        self._sets = dict()
+        self._with = dict()
+
+    def __len__(self):
+        return bin(self._keys).count("1")
+
+    def get_keys(self):
+        """
+        Public accessor for the registered keys.
+
+        :rtype: long
+        :return: A bitmask of the keys
+        """
+        return self._keys
+
+    def add(self, key, contexts):
+        """
+        Registers a key, or adds Contexts to the set registered under
+        an existing key.
+
+        :type key: int
+        :param key: A non-negative int
+
+        :type contexts: BitContextSet
+        :param contexts: The Contexts to add
+
+        :rtype: NoneType
+        :return: None
+        """
+        key_bit = 1L << key
+        self._keys |= key_bit
+        mask = contexts.get_mask()
+        self._support |= mask
+        self._sets[key] = self._sets.get(key, 0L) | mask
+        for context_id in ids_from_mask(mask):
+            self._with[context_id] = self._with.get(context_id, 0L) | key_bit
+
+    def subsets_of(self, contexts, keys=None):
+        """
+        Finds the keys whose sets are subsets of some Contexts.
+
+        :type contexts: BitContextSet
+        :param contexts: A set of Contexts
+
+        :type keys: long
+        :param keys: If given, a bitmask of the keys to consider
+
+        :rtype: long
+        :return: A bitmask of the keys whose sets are subsets of
+            contexts
+        """
+        if keys is None:
+            keys = self._keys
+            support = self._support
+        else:
+            keys &= self._keys
+            support = self.union_of(keys)
+
+        for context_id in ids_from_mask(support & ~contexts.get_mask()):
+            keys &= ~self._with[context_id]
+            if keys == 0:
+                break
+
+        return keys
+
+    def intersecting(self, contexts, keys=None):
+        """
+        Finds the keys whose sets share a Context with some Contexts.
+
+        :type contexts: BitContextSet
+        :param contexts: A set of Contexts
+
+        :type keys: long
+        :param keys: If given, a bitmask of the keys to consider
+
+        :rtype: long
+        :return: A bitmask of the keys whose sets intersect contexts
+        """
+        if keys is None:
+            keys = self._keys
+            support = self._support
+        else:
+            keys &= self._keys
+            support = self.union_of(keys)
+
+        found = 0L
+        for context_id in ids_from_mask(support & contexts.get_mask()):
+            found |= self._with[context_id] & keys
+            if found == keys:
+                break
+
+        return found
+
+    def union_of(self, keys):
+        """
+        Finds the Contexts in the sets registered under some keys.
+
+        :type keys: long
+        :param keys: A bitmask of keys
+
+        :rtype: long
+        :return: A bitmask of the Contexts in any of their sets
+        """
+        mask = 0L
+        for key in ids_from_mask(keys & self._keys):
+            mask |= self._sets[key]
+        return mask
@@ -0,0 +1,201 @@
+"""
+Checks that learners saved with pickle or checkpoints.Checkpoint keep
+learning exactly as they would have without being saved, whether they
+are loaded in the same process or in a new one with other interned
+symbols.
+
+    python -m unittest test_checkpoints
+"""
+import cPickle as pickle
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from nltk.grammar import CFG
+
+from checkpoints import Checkpoint
+from learners import PrimalLearner, DualLearner
+from oracles import GrammarOracle
+from scl import Sentence
+
+GRAMMAR = "S -> 'a' S 'a' | 'b' S 'b' | 'a' | 'b'"
+
+# Loads a pickled learner and a checkpoint, after interning other
+# symbols so that the saved IDs have to be translated, and prints the
+# rules of each after a few more guesses
+SCRIPT = r"""
+import cPickle as pickle
+import json
+import sys
+
+from checkpoints import Checkpoint
+from scl import Sentence
+
+Sentence(["c", "b", "d", "a"])
+pickled, directory, num_guesses = sys.argv[1], sys.argv[2], int(sys.argv[3])
+with open(pickled, "rb") as f:
+    learners = [pickle.load(f), Checkpoint(directory).load(None, pickle.load(f))]
+
+rules = []
+for learner in learners:
+    for _ in xrange(num_guesses):
+        learner.guess()
+    rules.append(sorted(str(p) for p in learner.get_curr_guess().productions()))
+print json.dumps(rules)
+"""
+
+# Loads a checkpoint after interning the same symbols in another order,
+# makes a few more guesses and saves it again
+SAVE_SCRIPT = r"""
+import sys
+
+from checkpoints import Checkpoint
+from oracles import GrammarOracle
+from scl import Sentence
+from test_checkpoints import GRAMMAR
+from nltk.grammar import CFG
+
+Sentence(["b", "a"])
+directory, num_guesses = sys.argv[1], int(sys.argv[2])
+checkpoint = Checkpoint(directory)
+learner = checkpoint.load(None, GrammarOracle(CFG.fromstring(GRAMMAR)))
+for _ in xrange(num_guesses):
+    learner.guess()
+checkpoint.save(learner)
+"""
+
+
+def _data(learner):
+    codes = learner.get_checkpoint()["strings"]["data"]
+    return sorted(Sentence.from_codes(c).get_words() for c in codes)
+
+
+def _rules(learner):
+    return sorted(str(p) for p in learner.get_curr_guess().productions())
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.grammar = CFG.fromstring(GRAMMAR)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def learners(self, num_guesses):
+        for learner_class in [PrimalLearner, DualLearner]:
+            learner = learner_class.from_grammar(self.grammar, 1)
+            for _ in xrange(num_guesses):
+                learner.guess()
+            yield learner
+
+    def check_continues(self, learner, loaded, num_guesses=3):
+        """
+        Checks that a loaded learner has the same guess as the one it
+        was saved from, and keeps having the same guesses.
+        """
+        learner.rebuild()
+        loaded.rebuild()
+        self.assertEqual(_data(loaded), _data(learner))
+        self.assertEqual(_rules(loaded), _rules(learner))
+        for _ in xrange(num_guesses):
+            learner.guess()
+            loaded.guess()
+            self.assertEqual(_rules(loaded), _rules(learner))
+
+    def test_pickle(self):
+        for learner in self.learners(3):
+            self.check_continues(learner, pickle.loads(pickle.dumps(learner, -1)))
+
+    def test_checkpoint(self):
+        for learner in self.learners(2):
+            checkpoint = Checkpoint(os.path.join(self.directory, type(learner).__name__))
+            self.assertEqual(checkpoint.save(learner), 0)
+            learner.guess()
+            learner.observe(("a", "b", "a", "b", "a"))
+            self.assertEqual(checkpoint.save(learner), 1)
+
+            for use_mmap in [True, False]:
+                loaded = checkpoint.load(None, GrammarOracle(self.grammar), use_mmap=use_mmap)
+                copy = pickle.loads(pickle.dumps(learner, -1))
+                self.check_continues(copy, loaded)
+
+    def test_prune(self):
+        learner = next(self.learners(1))
+        checkpoint = Checkpoint(self.directory)
+        for _ in xrange(4):
+            checkpoint.save(learner)
+            learner.guess()
+
+        self.assertEqual(checkpoint.prune(2), [0, 1])
+        self.assertEqual([e["snapshot"] for e in checkpoint.get_snapshots()], [2, 3])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "snapshot-0")))
+        self.assertRaises(IOError, checkpoint.load, None, GrammarOracle(self.grammar), snapshot=0)
+        self.assertEqual(checkpoint.prune(2), [])
+        self.assertRaises(ValueError, checkpoint.prune, 0)
+
+        self.assertEqual(checkpoint.save(learner), 4)
+        self.check_continues(learner, checkpoint.load(None, GrammarOracle(self.grammar)))
+
+    def test_save_loaded(self):
+        # Saving a learner loaded from an older snapshot keeps the
+        # entries it shares with the files and drops the snapshots
+        # that refer to the entries it rewrites
+        for learner in self.learners(2):
+            checkpoint = Checkpoint(os.path.join(self.directory, type(learner).__name__))
+            checkpoint.save(learner)
+            copy = pickle.loads(pickle.dumps(learner, -1))
+            learner.guess()
+            checkpoint.save(learner)
+
+            loaded = checkpoint.load(None, GrammarOracle(self.grammar), snapshot=0)
+            loaded.observe(("b", "a", "a", "a", "b"))
+            copy.observe(("b", "a", "a", "a", "b"))
+            self.assertEqual(checkpoint.save(loaded), 2)
+            self.assertEqual([e["snapshot"] for e in checkpoint.get_snapshots()], [0, 2])
+            self.check_continues(copy, checkpoint.load(None, GrammarOracle(self.grammar)))
+
+    def test_save_new_process(self):
+        for learner in self.learners(2):
+            directory = os.path.join(self.directory, type(learner).__name__)
+            checkpoint = Checkpoint(directory)
+            checkpoint.save(learner)
+
+            script = os.path.join(self.directory, "save.py")
+            with open(script, "w") as f:
+                f.write(SAVE_SCRIPT)
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+            subprocess.check_call([sys.executable, script, directory, "2"], env=env)
+
+            for _ in xrange(2):
+                learner.guess()
+            self.check_continues(learner, checkpoint.load(None, GrammarOracle(self.grammar)))
+
+    def test_new_process(self):
+        for learner in self.learners(3):
+            directory = os.path.join(self.directory, type(learner).__name__)
+            Checkpoint(directory).save(learner)
+            pickled = os.path.join(self.directory, "learner.p")
+            with open(pickled, "wb") as f:
+                pickle.dump(learner, f, -1)
+                pickle.dump(GrammarOracle(self.grammar), f, -1)
+
+            script = os.path.join(self.directory, "load.py")
+            with open(script, "w") as f:
+                f.write(SCRIPT)
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+            output = subprocess.check_output([sys.executable, script, pickled, directory, "3"],
+                                             env=env)
+
+            for _ in xrange(3):
+                learner.guess()
+            self.assertEqual(json.loads(output), [_rules(learner)] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,421 @@
+"""
+Checks the learners against a naive construction of the grammar G(K, F)
+of Yoshinaka (2011), with one nonterminal per kernel, which tests every
+rule from scratch after each observation. Membership is decided by
+hand-written recognizers of the target languages rather than by the
+grammars and parsers the learners are usually given. The learners
+reuse the results of earlier observations and merge equivalent
+nonterminals, so this checks that they generate the same strings, and
+that they end up generating the target language. It also checks when
+guess_many rebuilds the guess.
+
+    python -m unittest test_learners
+"""
+import unittest
+from itertools import combinations, product
+
+from learners import PrimalLearner, DualLearner
+from oracles import Oracle, Text
+
+
+def _anbn(words):
+    n = len(words) // 2
+    return n > 0 and list(words) == ["a"] * n + ["b"] * n
+
+
+def _anbm(words):
+    n = words.count("a")
+    return 0 < n <= len(words) - n and list(words) == ["a"] * n + ["b"] * (len(words) - n)
+
+
+def _dyck1(words):
+    depth = 0
+    for w in words:
+        depth += 1 if w == "(" else -1
+        if depth < 0:
+            return False
+    return len(words) > 0 and depth == 0
+
+
+def _arith(words):
+    # E -> T | T '+' E | T '*' E, T -> 'x' | '(' E ')' generates the
+    # same strings as the ambiguous grammar of the language
+    def expression(i):
+        i = term(i)
+        while i is not None and i < len(words) and words[i] in ("+", "*"):
+            i = term(i + 1)
+        return i
+
+    def term(i):
+        if i < len(words) and words[i] == "x":
+            return i + 1
+        if i < len(words) and words[i] == "(":
+            i = expression(i + 1)
+            if i is not None and i < len(words) and words[i] == ")":
+                return i + 1
+        return None
+
+    return expression(0) == len(words)
+
+
+LANGUAGES = {
+    "anbn": (_anbn, ("a", "b"), 6),
+    "anbm": (_anbm, ("a", "b"), 6),
+    "dyck1": (_dyck1, ("(", ")"), 8),
+    "arith": (_arith, ("x", "+", "*", "(", ")"), 5),
+}
+
+
+def _strings(alphabet, max_length):
+    """
+    Lists the nonempty strings over an alphabet up to a length,
+    shortest first.
+    """
+    return [words for n in xrange(1, max_length + 1) for words in product(alphabet, repeat=n)]
+
+
+def _subsets(elements, k):
+    return [frozenset(c) for i in xrange(1, k + 1) for c in combinations(sorted(elements), i)]
+
+
+def _spans(words):
+    n = len(words)
+    return [(i, j) for i in xrange(n + 1) for j in xrange(i, n + 1)]
+
+
+class MembershipOracle(Oracle):
+    """
+    An oracle answering with a recognizer of a language.
+    """
+
+    def __init__(self, member):
+        super(MembershipOracle, self).__init__()
+        self._member = member
+
+    def generates(self, sentence):
+        return self._member(sentence.get_words())
+
+
+class MembershipText(Text):
+    """
+    The strings of a language in order of length, found by testing
+    every string over its alphabet.
+    """
+
+    def __init__(self, member, alphabet):
+        self._member = member
+        self._alphabet = alphabet
+        self._length = 0
+        self._pending = []
+
+    def next(self):
+        while len(self._pending) == 0:
+            self._length += 1
+            self._pending = [w for w in product(self._alphabet, repeat=self._length)
+                             if self._member(w)]
+        return self._pending.pop(0)
+
+
+class Chart(object):
+    """
+    Finds the nonterminals deriving each string, for grammars with only
+    lexical and binary rules, given by functions from a terminal and
+    from a pair of nonterminals to the nonterminals rewriting to them.
+    Sets of nonterminals are bitmasks over the order in which they are
+    first derived. Results are memoized, so the substrings of the
+    strings checked are only parsed once.
+    """
+
+    def __init__(self, lexical, binary):
+        self._lexical = lexical
+        self._binary = binary
+        self._nts = []
+        self._ids = dict()
+        self._cells = dict()
+        self._pairs = dict()
+        self._rules = dict()
+
+    def _mask(self, nts):
+        mask = 0
+        for nt in nts:
+            if nt not in self._ids:
+                self._ids[nt] = len(self._nts)
+                self._nts.append(nt)
+            mask |= 1 << self._ids[nt]
+        return mask
+
+    def _members(self, mask):
+        return [i for i in xrange(mask.bit_length()) if (mask >> i) & 1]
+
+    def _cell(self, words):
+        cell = self._cells.get(words)
+        if cell is None:
+            if len(words) == 1:
+                cell = self._mask(self._lexical(words[0]))
+            else:
+                cell = 0
+                for m in xrange(1, len(words)):
+                    right = self._cell(words[m:])
+                    for left in self._members(self._cell(words[:m])):
+                        if (left, right) not in self._rules:
+                            lhs = 0
+                            for r in self._members(right):
+                                if (left, r) not in self._pairs:
+                                    nts = self._binary(self._nts[left], self._nts[r])
+                                    self._pairs[left, r] = self._mask(nts)
+                                lhs |= self._pairs[left, r]
+                            self._rules[left, right] = lhs
+                        cell |= self._rules[left, right]
+            self._cells[words] = cell
+        return cell
+
+    def derive(self, words):
+        return set(self._nts[i] for i in self._members(self._cell(words)))
+
+
+class Naive(object):
+    """
+    The grammar G(K, F) for a set K of substrings and a set F of
+    contexts, given as pairs of tuples of words. Only the terminals
+    seen so far have lexical rules. Sets of contexts are bitmasks over
+    the sorted contexts of F. Subclasses choose the nonterminals, the
+    rules, and which observations grow K and F.
+    """
+
+    def __init__(self, member, k):
+        self._member = member
+        self._answers = dict()
+        self._k = k
+        self.terminals = set()
+        self.substrings = set()
+        self.contexts = []
+        self._rows = dict()
+        self._chart = self._new_chart()
+
+    def member(self, words):
+        if words not in self._answers:
+            self._answers[words] = self._member(words)
+        return self._answers[words]
+
+    def accepting(self, strings):
+        """
+        Finds the contexts of F accepting all of some strings.
+        """
+        mask = (1 << len(self.contexts)) - 1
+        for s in strings:
+            if s not in self._rows:
+                self._rows[s] = sum(1 << i for i, (left, right) in enumerate(self.contexts)
+                                    if self.member(left + s + right))
+            mask &= self._rows[s]
+        return mask
+
+    def generates(self, words):
+        return any(self.is_start(nt) for nt in self._chart.derive(tuple(words)))
+
+    def observe(self, words):
+        words = tuple(words)
+        self.terminals.update(words)
+        self._observe(words)
+        self._rows = dict()
+        self._chart = self._new_chart()
+
+    def _add_contexts(self, words):
+        contexts = set(self.contexts)
+        contexts.update((words[:i], words[j:]) for i, j in _spans(words))
+        self.contexts = sorted(contexts)
+
+    def _observe(self, words):
+        raise NotImplementedError
+
+    def _new_chart(self):
+        raise NotImplementedError
+
+    def is_start(self, nt):
+        raise NotImplementedError
+
+
+class NaivePrimal(Naive):
+    """
+    The primal grammar: a nonterminal for each set X of at most k
+    substrings, rewriting to a string when each context of F accepting
+    all of X accepts it.
+    """
+
+    def _observe(self, words):
+        self._add_contexts(words)
+        if not self.generates(words):
+            self.substrings.update(words[i:j] for i, j in _spans(words))
+
+    def _new_chart(self):
+        kernels = _subsets(self.substrings, self._k)
+        contexts = dict((kernel, self.accepting(kernel)) for kernel in kernels)
+
+        def lexical(t):
+            if t not in self.terminals:
+                return []
+            t_contexts = self.accepting([(t,)])
+            return [x for x in kernels if contexts[x] & ~t_contexts == 0]
+
+        def binary(left, right):
+            pair_contexts = self.accepting([l + r for l in left for r in right])
+            return [x for x in kernels if contexts[x] & ~pair_contexts == 0]
+
+        return Chart(lexical, binary)
+
+    def is_start(self, nt):
+        return all(self.member(s) for s in nt)
+
+
+class NaiveDual(Naive):
+    """
+    The dual grammar: a nonterminal for each set C of at most k
+    contexts, rewriting to a string when each context of C accepts
+    it. The right-hand sides stand for the substrings of K accepted by
+    all of their contexts.
+    """
+
+    def _observe(self, words):
+        self.substrings.update(words[i:j] for i, j in _spans(words))
+        if not self.generates(words):
+            self._add_contexts(words)
+
+    def _new_chart(self):
+        ids = dict((f, 1 << i) for i, f in enumerate(self.contexts))
+        kernels = dict((kernel, sum(ids[f] for f in kernel))
+                       for kernel in _subsets(self.contexts, self._k))
+        closures = dict((kernel, [s for s in self.substrings if mask & ~self.accepting([s]) == 0])
+                        for kernel, mask in kernels.iteritems())
+
+        def lexical(t):
+            if t not in self.terminals:
+                return []
+            t_contexts = self.accepting([(t,)])
+            return [c for c, mask in kernels.iteritems() if mask & ~t_contexts == 0]
+
+        def binary(left, right):
+            pair_contexts = self.accepting([l + r for l in closures[left] for r in closures[right]])
+            return [c for c, mask in kernels.iteritems() if mask & ~pair_contexts == 0]
+
+        return Chart(lexical, binary)
+
+    def is_start(self, nt):
+        return ((), ()) in nt
+
+
+def _learned(learner):
+    """
+    Makes a membership function for the current guess of a learner.
+    """
+    guess = learner.rebuild()
+    start = guess.start()
+    lexical = dict()
+    binary = dict()
+    starts = set()
+    for p in guess.productions():
+        rhs = p.rhs()
+        if p.lhs() == start:
+            starts.add(rhs[0])
+        elif len(rhs) == 1:
+            lexical.setdefault(rhs[0], set()).add(p.lhs())
+        else:
+            binary.setdefault(rhs, set()).add(p.lhs())
+
+    chart = Chart(lambda t: lexical.get(t, ()), lambda l, r: binary.get((l, r), ()))
+    return lambda words: len(chart.derive(words) & starts) > 0
+
+
+class LearnerTest(unittest.TestCase):
+
+    def check(self, learner_class, naive_class, name, k, num_sentences):
+        """
+        Feeds the shortest sentences of a language to a learner and to
+        the naive construction, comparing the strings their guesses
+        generate up to a length after each one. The last guess must
+        generate exactly the strings of the language up to that length.
+        """
+        member, alphabet, max_length = LANGUAGES[name]
+        learner = learner_class(MembershipText(member, alphabet), MembershipOracle(member), k)
+        naive = naive_class(member, k)
+        strings = _strings(alphabet, max_length)
+
+        text = MembershipText(member, alphabet)
+        for step in xrange(num_sentences):
+            sentence = text.next()
+            learner.observe(sentence)
+            naive.observe(sentence)
+
+            generates = _learned(learner)
+            for words in strings:
+                self.assertEqual(generates(words), naive.generates(words),
+                                 "{} k={} differs on {} after {} steps".format(
+                                     name, k, " ".join(words), step + 1))
+
+        for words in strings:
+            self.assertEqual(generates(words), member(words),
+                             "{} k={} has not learned {}".format(name, k, " ".join(words)))
+
+    def test_primal(self):
+        for name, k, n in [("anbn", 1, 6), ("dyck1", 1, 5), ("arith", 1, 5),
+                           ("anbn", 2, 3), ("dyck1", 2, 2), ("arith", 2, 4)]:
+            self.check(PrimalLearner, NaivePrimal, name, k, n)
+
+    def test_dual(self):
+        # With k = 2, a^n b^m has kernels whose closure in K is empty,
+        # which still rewrite to pairs and are rewritten to
+        for name, k, n in [("anbn", 1, 6), ("dyck1", 1, 5), ("arith", 1, 5),
+                           ("anbn", 2, 4), ("dyck1", 2, 3), ("arith", 2, 4), ("anbm", 2, 4)]:
+            self.check(DualLearner, NaiveDual, name, k, n)
+
+
+class GuessManyTest(unittest.TestCase):
+
+    def setUp(self):
+        member, alphabet, _ = LANGUAGES["dyck1"]
+        text = MembershipText(member, alphabet)
+        self.sentences = [text.next() for _ in xrange(7)]
+
+    def learner(self, learner_class):
+        """
+        Makes a learner of Dyck-1, and a list to which the metrics of
+        each of its updates are added.
+        """
+        member, alphabet, _ = LANGUAGES["dyck1"]
+        learner = learner_class(MembershipText(member, alphabet), MembershipOracle(member), 1)
+        updates = []
+        learner.get_metrics().add_hook(updates.append)
+        return learner, updates
+
+    def test_every(self):
+        for learner_class in [PrimalLearner, DualLearner]:
+            learner, updates = self.learner(learner_class)
+            learner.guess_many(self.sentences, every=3)
+            self.assertEqual([m.get_counts()["step"] for m in updates], [3, 6, 7])
+
+            # Rebuilding after every sentence is the same as guessing
+            learner, _ = self.learner(learner_class)
+            other, _ = self.learner(learner_class)
+            guess = learner.guess_many(self.sentences, every=1)
+            for sentence in self.sentences:
+                other.observe(sentence)
+                other_guess = other.rebuild()
+            self.assertEqual(set(guess.productions()), set(other_guess.productions()))
+
+    def test_seconds(self):
+        for learner_class in [PrimalLearner, DualLearner]:
+            learner, updates = self.learner(learner_class)
+            learner.guess_many(self.sentences, seconds=0.)
+            self.assertEqual([m.get_counts()["step"] for m in updates], range(1, 8) + [7])
+
+            learner, updates = self.learner(learner_class)
+            learner.guess_many(self.sentences, seconds=3600.)
+            self.assertEqual([m.get_counts()["step"] for m in updates], [7])
+
+    def test_invalid_every(self):
+        learner, updates = self.learner(PrimalLearner)
+        for every in [0, -1]:
+            self.assertRaises(ValueError, learner.guess_many, self.sentences, every=every)
+        self.assertEqual(updates, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+Checks the metrics recorded for each update of a learner's guess, the
+hooks they are passed to and the JSON lines they are written as.
+
+    python -m unittest test_metrics
+"""
+import cPickle as pickle
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+from nltk.grammar import CFG, Nonterminal
+
+from learners import PrimalLearner, DualLearner
+from metrics import MetricsRecorder
+from oracles import Oracle
+from scl import Sentence
+
+GRAMMAR = CFG.fromstring("S -> S S | '(' S ')' | '(' ')'")
+
+
+class EvenOracle(Oracle):
+    """
+    An oracle accepting sentences of even length.
+    """
+
+    def generates(self, sentence):
+        return len(sentence) % 2 == 0
+
+
+class MetricsRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "metrics.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self):
+        with open(self.filename, "r") as f:
+            return [json.loads(line, object_pairs_hook=OrderedDict) for line in f]
+
+    def test_phases(self):
+        oracle = EvenOracle()
+        recorder = MetricsRecorder(oracle)
+        sentences = [Sentence(["x"] * n) for n in xrange(1, 5)]
+
+        recorder.start_phase("first")
+        oracle.query_many(sentences)
+        recorder.start_phase("second")
+        oracle.query_many(sentences[:3])
+        recorder.end_phase()
+        recorder.start_phase("first")
+        oracle.query(Sentence(["x"] * 5))
+        recorder.set_count("step", 1)
+        metrics = recorder.finish()
+
+        phases = metrics.get_phases()
+        self.assertEqual(phases.keys(), ["first", "second"])
+        self.assertEqual([phases["first"][k] for k in ["queries", "cache_hits", "computed"]],
+                         [5, 0, 5])
+        self.assertEqual([phases["second"][k] for k in ["queries", "cache_hits", "computed"]],
+                         [3, 3, 0])
+        self.assertEqual(metrics.get_counts(), {"step": 1})
+        self.assertIs(recorder.get_last(), metrics)
+
+        # The next update starts from scratch
+        self.assertEqual(recorder.finish().to_dict(),
+                         {"duration": 0., "phases": {}})
+
+    def test_hooks(self):
+        recorder = MetricsRecorder(EvenOracle())
+        first, second = [], []
+        recorder.add_hook(first.append)
+        recorder.add_hook(second.append)
+        recorder.set_count("step", 1)
+        metrics = recorder.finish()
+        self.assertEqual(first, [metrics])
+        self.assertEqual(second, [metrics])
+
+        recorder.remove_hook(first.append)
+        recorder.set_count("step", 2)
+        recorder.finish()
+        self.assertEqual(len(first), 1)
+        self.assertEqual([m.get_counts()["step"] for m in second], [1, 2])
+        self.assertRaises(ValueError, recorder.remove_hook, first.append)
+
+    def test_output(self):
+        recorder = MetricsRecorder(EvenOracle())
+        recorder.finish()
+        recorder.set_output(self.filename)
+        for step in xrange(1, 4):
+            recorder.start_phase("phase")
+            recorder.set_count("step", step)
+            recorder.set_count("status", "rebuilt")
+            recorder.finish()
+
+        records = self.read()
+        self.assertEqual([r["step"] for r in records], [1, 2, 3])
+        self.assertEqual(records[0].keys(), ["step", "status", "duration", "phases"])
+        self.assertEqual(records[0]["phases"]["phase"]["queries"], 0)
+
+        # Copies drop the hooks and the open file, and append to it
+        def hook(metrics):
+            self.fail("Hooks are not copied")
+
+        recorder.add_hook(hook)
+        copy = pickle.loads(pickle.dumps(recorder, -1))
+        copy.set_count("step", 4)
+        copy.finish()
+        self.assertEqual([r["step"] for r in self.read()], [1, 2, 3, 4])
+
+        recorder.remove_hook(hook)
+        recorder.set_output(None)
+        recorder.set_count("step", 5)
+        recorder.finish()
+        copy.set_output(None)
+        self.assertEqual(len(self.read()), 4)
+
+
+class LearnerMetricsTest(unittest.TestCase):
+
+    def check_counts(self, learner, metrics):
+        """
+        Checks the counts recorded for the guess against its rules.
+        """
+        productions = set(learner.get_curr_guess().productions())
+        start = Nonterminal("start")
+        counts = metrics.get_counts()
+        self.assertEqual(counts["start_rules"], len([p for p in productions if p.lhs() == start]))
+        self.assertEqual(counts["lexical_rules"],
+                         len([p for p in productions if p.lhs() != start and len(p.rhs()) == 1]))
+        self.assertEqual(counts["binary_rules"], len([p for p in productions if len(p.rhs()) == 2]))
+        self.assertEqual(counts["nonterminals"], len(set(p.lhs() for p in productions) - {start}))
+
+    def test_counts(self):
+        for learner_class in [PrimalLearner, DualLearner]:
+            learner = learner_class.from_grammar(GRAMMAR, 1)
+            updates = []
+            learner.get_metrics().add_hook(updates.append)
+            for _ in xrange(5):
+                learner.guess()
+                self.check_counts(learner, updates[-1])
+
+            # Updates with nothing to do record the same counts
+            learner.rebuild()
+            self.assertEqual(updates[-1].get_counts()["status"], "unchanged")
+            self.check_counts(learner, updates[-1])
+
+            copy = pickle.loads(pickle.dumps(learner, -1))
+            copy.get_metrics().add_hook(updates.append)
+            copy.rebuild()
+            self.assertEqual(updates[-1].get_counts(), updates[-2].get_counts())
+
+
+if __name__ == "__main__":
+    unittest.main()
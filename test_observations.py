@@ -0,0 +1,60 @@
+"""
+Checks that the ObservationTable indexes every split of its rows into
+two rows, whatever order the rows are added in.
+
+    python -m unittest test_observations
+"""
+import unittest
+from random import Random
+
+from nltk.grammar import CFG
+
+from learners import PrimalLearner, DualLearner
+from observations import ObservationTable
+from oracles import GrammarOracle
+from scl import Sentence, ContextIndex
+
+GRAMMAR = CFG.fromstring("S -> 'a' S 'b' | 'a' 'b'")
+
+
+def _substrings(words):
+    n = len(words)
+    return [Sentence(words[i:j]) for i in xrange(n + 1) for j in xrange(i, n + 1)]
+
+
+class ObservationTableTest(unittest.TestCase):
+
+    def check_splits(self, table):
+        """
+        Checks that the split index holds exactly the pairs of rows
+        whose concatenation has a row.
+        """
+        sentences = table.get_state()[0]
+        expected = dict()
+        for u, left in enumerate(sentences):
+            for v, right in enumerate(sentences):
+                w = table.get_row(left + right)
+                if w is not None:
+                    expected[(u, v)] = w
+        self.assertEqual(table._splits, expected)
+
+    def test_any_order(self):
+        substrings = list(set(_substrings(("a", "a", "b", "b", "a", "b"))))
+        random = Random(0)
+        for _ in xrange(10):
+            random.shuffle(substrings)
+            table = ObservationTable(GrammarOracle(GRAMMAR), ContextIndex())
+            for i in xrange(0, len(substrings), 3):
+                table.add_rows(substrings[i:i + 3])
+            self.check_splits(table)
+
+    def test_learners(self):
+        for learner_class in [PrimalLearner, DualLearner]:
+            learner = learner_class.from_grammar(GRAMMAR, 1)
+            for _ in xrange(6):
+                learner.guess()
+            self.check_splits(learner._table)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,444 @@
+"""
+Checks the oracles and their caches. The oracles that answer queries
+outside of this process use a small stand-in script for an external
+parser of a^n b^n.
+
+    python -m unittest test_oracles
+"""
+import cPickle as pickle
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from itertools import product
+from multiprocessing import active_children
+
+from nltk.grammar import CFG, Nonterminal, Production
+
+from learners import PrimalLearner
+from oracles import Oracle, AsyncOracle, ParallelOracle, SubprocessOracle, CommandOracle, \
+    GrammarOracle, StoredOracle, MembershipCache, grammar_fingerprint
+from scl import Sentence
+
+# Run as "exit", the script answers one query with its exit status. Run
+# as "lines", it answers a query per line. A sentence containing "slow"
+# is answered after a delay, one containing "hang" is never answered,
+# one containing "garbage" gets an invalid answer, and the first one
+# containing "crash" makes it exit, leaving the marker file behind.
+SCRIPT = r"""
+import os
+import sys
+import time
+
+mode, marker = sys.argv[1:3]
+
+
+def answer(words):
+    if "slow" in words:
+        time.sleep(0.2)
+        words = [w for w in words if w != "slow"]
+    if "hang" in words:
+        time.sleep(60)
+    if "crash" in words and not os.path.exists(marker):
+        open(marker, "w").close()
+        sys.exit(2)
+    if "garbage" in words:
+        return "maybe"
+    n = len(words) // 2
+    return "1" if n > 0 and words == ["a"] * n + ["b"] * n else "0 rejected"
+
+
+if mode == "exit":
+    sys.exit(0 if answer(sys.stdin.readline().split()) == "1" else 1)
+
+for line in iter(sys.stdin.readline, ""):
+    sys.stdout.write(answer(line.split()) + "\n")
+    sys.stdout.flush()
+"""
+
+
+def _accepts(sentence):
+    words = [w for w in sentence.get_words() if w != "slow"]
+    n = len(words) // 2
+    return n > 0 and words == ["a"] * n + ["b"] * n
+
+
+def _sentences(num, slow_every=3):
+    """
+    Makes sentences in and out of the language, of which every
+    slow_every-th is answered slowly.
+    """
+    sentences = []
+    for i in xrange(num):
+        words = ["a"] * (i % 4 + 1) + ["b"] * (i % 3 + 1)
+        if i % slow_every == 0:
+            words.insert(0, "slow")
+        sentences.append(Sentence(words))
+    return sentences
+
+
+class CountingOracle(AsyncOracle):
+    """
+    An AsyncOracle that sleeps longer on shorter sentences, so that
+    checks finish out of order, and counts the checks running at once.
+    """
+
+    def __init__(self, max_in_flight):
+        super(CountingOracle, self).__init__(max_in_flight=max_in_flight)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def generates(self, sentence):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05 / len(sentence))
+        with self._lock:
+            self.running -= 1
+        return _accepts(sentence)
+
+
+class RecordingOracle(Oracle):
+    """
+    An oracle recording the batches of sentences it is asked about.
+    """
+
+    def __init__(self, cache_size=None):
+        super(RecordingOracle, self).__init__(cache_size=cache_size)
+        self.batches = []
+
+    def generates(self, sentence):
+        self.batches.append([sentence.get_words()])
+        return _accepts(sentence)
+
+    def generates_many(self, sentences):
+        self.batches.append([s.get_words() for s in sentences])
+        return map(_accepts, sentences)
+
+
+class BareOracle(Oracle):
+    """
+    An oracle that does not call Oracle.__init__.
+    """
+
+    def __init__(self):
+        pass
+
+    def generates(self, sentence):
+        return _accepts(sentence)
+
+
+class CacheTest(unittest.TestCase):
+
+    def test_eviction_order(self):
+        cache = MembershipCache(3)
+        for key in "abc":
+            cache.put(key, True)
+        self.assertTrue(cache.get("a"))
+
+        # b is now the least recently used, then c
+        cache.put("d", False)
+        self.assertNotIn("b", cache)
+        cache.put("c", False)
+        cache.put("e", True)
+        self.assertEqual([key in cache for key in "abcde"], [False, False, True, True, True])
+        self.assertEqual(cache.get_evictions(), 2)
+        self.assertEqual(len(cache), 3)
+
+    def test_counters(self):
+        cache = MembershipCache()
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", False)
+        self.assertFalse(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get_hits(), cache.get_misses()), (1, 2))
+
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((cache.get_hits(), cache.get_misses(), len(cache)), (1, 3, 0))
+
+        # Nothing is kept in a cache of size 0
+        empty = MembershipCache(0)
+        empty.put("a", True)
+        self.assertEqual(len(empty), 0)
+
+    def test_query(self):
+        oracle = RecordingOracle()
+        ab = Sentence(["a", "b"])
+        self.assertTrue(oracle.query(ab))
+        self.assertTrue(oracle.query(Sentence(["a", "b"])))
+        self.assertEqual(oracle.batches, [[("a", "b")]])
+        self.assertEqual(oracle.get_num_computed(), 1)
+
+    def test_without_init(self):
+        oracle = BareOracle()
+        sentences = [Sentence(["a", "b"]), Sentence(["b", "a"])]
+        self.assertTrue(oracle.query(sentences[0]))
+        self.assertEqual(oracle.query_many(sentences), [True, False])
+        self.assertEqual(oracle.get_num_computed(), 2)
+        self.assertEqual(oracle.get_cache().get_hits(), 1)
+
+    def test_query_many_duplicates(self):
+        oracle = RecordingOracle()
+        aabb = Sentence(["a", "a", "b", "b"])
+        oracle.query(aabb)
+
+        sentences = [Sentence(w) for w in [["a", "b"], ["b", "a"], ["a", "b"], ["a", "a", "b", "b"],
+                                           ["b", "a"]]]
+        self.assertEqual(oracle.query_many(sentences), map(_accepts, sentences))
+
+        # Each missing sentence is computed once, in a single batch
+        self.assertEqual(len(oracle.batches), 2)
+        self.assertEqual(sorted(oracle.batches[1]), [("a", "b"), ("b", "a")])
+        self.assertEqual(oracle.get_num_computed(), 3)
+        cache = oracle.get_cache()
+        self.assertEqual((cache.get_hits(), cache.get_misses()), (1, 5))
+
+        # Answers are then taken from the cache
+        self.assertEqual(oracle.query_many(sentences), map(_accepts, sentences))
+        self.assertEqual(len(oracle.batches), 2)
+
+    def test_query_many_evicted(self):
+        oracle = RecordingOracle(cache_size=2)
+        sentences = [Sentence(["a"] * n + ["b"] * n) for n in xrange(1, 5)]
+        self.assertEqual(oracle.query_many(sentences), [True] * 4)
+        self.assertEqual(len(oracle.get_cache()), 2)
+
+        # Only the two most recently stored answers are kept
+        oracle.query_many(sentences)
+        self.assertEqual(len(oracle.batches[1]), 2)
+
+
+class ParallelOracleTest(unittest.TestCase):
+
+    def test_same_answers(self):
+        grammar = CFG.fromstring("S -> S S | '(' S ')' | '(' ')'")
+        serial = GrammarOracle(grammar)
+        sentences = [Sentence(w) for n in xrange(1, 9)
+                     for w in product(["(", ")"], repeat=n)]
+        with ParallelOracle(GrammarOracle(grammar), processes=3, chunk_size=16) as oracle:
+            self.assertEqual(oracle.generates_many(sentences), serial.generates_many(sentences))
+            self.assertEqual(oracle.query_many(sentences[::-1]),
+                             serial.generates_many(sentences[::-1]))
+            self.assertEqual(len(active_children()), 3)
+        self.assertEqual(active_children(), [])
+
+    def test_small_batches(self):
+        # Batches no larger than a chunk are answered by the wrapped
+        # oracle in this process, without starting the workers
+        wrapped = RecordingOracle()
+        sentences = _sentences(8, slow_every=100)
+        with ParallelOracle(wrapped, processes=2, chunk_size=8) as oracle:
+            self.assertEqual(oracle.generates_many(sentences), map(_accepts, sentences))
+            self.assertEqual(oracle.generates(sentences[0]), _accepts(sentences[0]))
+            self.assertEqual(len(wrapped.batches), 2)
+            self.assertEqual(active_children(), [])
+
+            # Larger ones are answered by the workers
+            sentences = _sentences(20, slow_every=100)
+            self.assertEqual(oracle.generates_many(sentences), map(_accepts, sentences))
+            self.assertEqual(len(wrapped.batches), 2)
+
+
+class OracleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.script = os.path.join(self.directory, "anbn.py")
+        self.marker = os.path.join(self.directory, "crashed")
+        with open(self.script, "w") as f:
+            f.write(SCRIPT)
+        self.oracles = []
+
+    def tearDown(self):
+        for oracle in self.oracles:
+            oracle.close()
+        shutil.rmtree(self.directory)
+
+    def command(self, mode):
+        return [sys.executable, self.script, mode, self.marker]
+
+    def add(self, oracle):
+        self.oracles.append(oracle)
+        return oracle
+
+    def test_async_order(self):
+        oracle = self.add(CountingOracle(max_in_flight=4))
+        sentences = _sentences(40)
+        self.assertEqual(oracle.generates_many(sentences), map(_accepts, sentences))
+        self.assertEqual(oracle.query_many(sentences), map(_accepts, sentences))
+        self.assertLessEqual(oracle.max_running, 4)
+        self.assertGreater(oracle.max_running, 1)
+
+        answers = []
+        result = oracle.generates_async(Sentence(["a", "b"]), callback=answers.append)
+        self.assertTrue(result.get())
+        self.assertEqual(answers, [True])
+
+    def test_subprocess(self):
+        oracle = self.add(SubprocessOracle(self.command("exit"), timeout=5., max_in_flight=4))
+        sentences = _sentences(12)
+        self.assertEqual(oracle.generates_many(sentences), map(_accepts, sentences))
+
+        # A crash is a rejection
+        self.assertFalse(oracle.generates(Sentence(["a", "crash", "b"])))
+
+    def test_subprocess_timeout(self):
+        oracle = self.add(SubprocessOracle(self.command("exit"), timeout=0.5))
+        start = time.time()
+        self.assertRaises(IOError, oracle.generates, Sentence(["hang"]))
+        self.assertLess(time.time() - start, 5.)
+
+    def test_command_order(self):
+        oracle = self.add(CommandOracle(self.command("lines"), num_workers=3, batch_size=4))
+        sentences = _sentences(30, slow_every=7)
+        self.assertEqual(oracle.generates_many(sentences), map(_accepts, sentences))
+        self.assertEqual(oracle.generates(Sentence(["a", "b"])), True)
+        self.assertEqual(oracle.get_num_restarts(), 0)
+
+    def test_command_restart(self):
+        oracle = self.add(CommandOracle(self.command("lines"), num_workers=2, batch_size=4))
+        sentences = _sentences(12, slow_every=100)
+        sentences[5] = Sentence(["a", "crash", "b"])
+        self.assertEqual(oracle.generates_many(sentences), map(_accepts, sentences))
+        self.assertTrue(os.path.exists(self.marker))
+        self.assertEqual(oracle.get_num_restarts(), 1)
+
+        # The restarted worker keeps answering
+        self.assertEqual(oracle.generates_many(sentences), map(_accepts, sentences))
+        self.assertEqual(oracle.get_num_restarts(), 1)
+
+        # Copies keep the count, and count their own restarts
+        os.remove(self.marker)
+        copy = self.add(pickle.loads(pickle.dumps(oracle, -1)))
+        self.assertEqual(copy.get_num_restarts(), 1)
+        more = [Sentence(["a", "crash", "b", str(i)]) for i in xrange(4)] + sentences
+        self.assertEqual(copy.generates_many(more), map(_accepts, more))
+        self.assertEqual(copy.get_num_restarts(), 2)
+
+    def test_command_timeout(self):
+        oracle = self.add(CommandOracle(self.command("lines"), num_workers=1, timeout=0.5,
+                                        retries=1))
+        start = time.time()
+        self.assertRaises(IOError, oracle.generates_many,
+                          [Sentence(["a", "b"]), Sentence(["hang"])])
+        self.assertLess(time.time() - start, 5.)
+        self.assertEqual(oracle.get_num_restarts(), 2)
+
+        # A new worker is started for the next query
+        self.assertTrue(oracle.generates(Sentence(["a", "b"])))
+
+    def test_command_invalid_answer(self):
+        oracle = self.add(CommandOracle(self.command("lines"), num_workers=1, retries=0))
+        self.assertRaises(IOError, oracle.generates, Sentence(["garbage"]))
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_names(self):
+        fingerprints = [grammar_fingerprint(CFG.fromstring(g)) for g in [
+            "S -> 'a' S 'b' | 'a' 'b'",
+            "X -> 'a' 'b' | 'a' X 'b'",
+            "S -> 'a' T 'b' | 'a' 'b' \n T -> 'a' T 'b' | 'a' 'b'",
+            "S -> A S B | A B \n A -> 'a' \n B -> 'b'",
+            "S -> 'a' S 'b' | 'b' 'a'"]]
+
+        # Renaming, reordering and merging nonterminals with the same
+        # rules keep the fingerprint, and other changes do not
+        self.assertEqual(len(set(fingerprints[:3])), 1)
+        self.assertEqual(len(set(fingerprints)), 3)
+
+    def test_renamed_guess(self):
+        learner = PrimalLearner.from_grammar(CFG.fromstring("S -> 'a' S 'b' | 'a' 'b'"), 1)
+        for _ in xrange(4):
+            guess = learner.guess()
+
+        def rename(symbol):
+            if isinstance(symbol, Nonterminal) and symbol != guess.start():
+                return Nonterminal("X" + symbol.symbol())
+            return symbol
+
+        renamed = CFG(guess.start(), [Production(rename(p.lhs()), [rename(s) for s in p.rhs()])
+                                      for p in reversed(guess.productions())])
+        self.assertEqual(grammar_fingerprint(renamed), grammar_fingerprint(guess))
+
+
+class StoredOracleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "answers.db")
+        self.oracles = []
+
+    def tearDown(self):
+        for oracle in self.oracles:
+            oracle.close()
+        shutil.rmtree(self.directory)
+
+    def open(self, oracle, fingerprint=None):
+        stored = StoredOracle(oracle, self.filename, fingerprint=fingerprint)
+        self.oracles.append(stored)
+        return stored
+
+    def test_reuse(self):
+        sentences = _sentences(12, slow_every=100)
+        first = self.open(RecordingOracle(), "anbn")
+        self.assertEqual(first.generates_many(sentences), map(_accepts, sentences))
+        self.assertEqual((first.get_hits(), first.get_misses()), (0, 12))
+
+        # A second instance, as in a new run, only asks about new
+        # sentences
+        wrapped = RecordingOracle()
+        second = self.open(wrapped, "anbn")
+        more = sentences[::2] + [Sentence(["b", "a"]), Sentence(["a", "a", "b", "b"])]
+        self.assertEqual(second.generates_many(more), map(_accepts, more))
+        self.assertEqual(wrapped.batches, [[("b", "a")]])
+        self.assertEqual((second.get_hits(), second.get_misses()), (7, 1))
+        self.assertEqual(second.generates(Sentence(["a", "a", "a", "b", "b", "b"])), True)
+        self.assertEqual(len(wrapped.batches), 1)
+
+        # Copies reopen the database
+        copy = pickle.loads(pickle.dumps(second, -1))
+        self.oracles.append(copy)
+        self.assertEqual(copy.generates_many(more), map(_accepts, more))
+        self.assertEqual(copy.get_misses(), 1)
+
+    def test_fingerprints(self):
+        sentences = _sentences(6, slow_every=100)
+        self.open(RecordingOracle(), "anbn").generates_many(sentences)
+
+        # Answers for another language are not reused
+        wrapped = RecordingOracle()
+        other = self.open(wrapped, "other")
+        other.generates_many(sentences)
+        self.assertEqual(other.get_misses(), 6)
+        self.assertEqual(len(wrapped.batches), 1)
+
+        self.assertRaises(ValueError, StoredOracle, RecordingOracle(), self.filename)
+
+    def test_grammars(self):
+        sentences = [Sentence(w) for n in xrange(1, 7) for w in product("ab", repeat=n)]
+        grammar = CFG.fromstring("S -> 'a' S 'b' | 'a' 'b'")
+        first = self.open(GrammarOracle(grammar))
+        answers = first.generates_many(sentences)
+        self.assertEqual(answers, map(_accepts, sentences))
+
+        # The fingerprint of a grammar does not depend on its
+        # nonterminal names
+        renamed = self.open(GrammarOracle(CFG.fromstring("X -> 'a' 'b' | 'a' X 'b'")))
+        self.assertEqual(renamed.get_fingerprint(), first.get_fingerprint())
+        self.assertEqual(renamed.generates_many(sentences), answers)
+        self.assertEqual(renamed.get_misses(), 0)
+
+        other = self.open(GrammarOracle(CFG.fromstring("S -> 'a' S 'b' | 'b' 'a'")))
+        self.assertNotEqual(other.get_fingerprint(), first.get_fingerprint())
+        other.generates_many(sentences)
+        self.assertEqual(other.get_hits(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
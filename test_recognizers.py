@@ -0,0 +1,117 @@
+"""
+Checks the recognizers of the oracles and of the learners' guesses.
+
+    python -m unittest test_recognizers
+"""
+import unittest
+from itertools import product
+from random import Random
+
+from nltk.grammar import CFG, Nonterminal, Production
+
+from recognizers import EarleyRecognizer, CYKRecognizer
+
+GRAMMARS = [
+    # Ambiguous
+    CFG.fromstring("S -> S S | '(' S ')' | '(' ')'"),
+    # With empty rules
+    CFG.fromstring("S -> A S B | \n A -> 'a' | \n B -> 'b'"),
+    CFG.fromstring("E -> E '+' E | E '*' E | '(' E ')' | 'x'"),
+]
+
+
+def _sentences(alphabet, max_length):
+    return [w for n in xrange(max_length + 1) for w in product(alphabet, repeat=n)]
+
+
+class EarleyRecognizerTest(unittest.TestCase):
+
+    def test_empty_rules(self):
+        # The language is a^i b^j for i <= j, including the empty string
+        recognizer = EarleyRecognizer(GRAMMARS[1])
+        for words in _sentences("ab", 6):
+            i = words.count("a")
+            expected = words == ("a",) * i + ("b",) * (len(words) - i) and i <= len(words) - i
+            self.assertEqual(recognizer.recognize(words), expected, words)
+
+    def test_recognize_many(self):
+        random = Random(0)
+        for grammar in GRAMMARS:
+            recognizer = EarleyRecognizer(grammar)
+            alphabet = sorted(set(t for p in grammar.productions() for t in p.rhs()
+                                  if isinstance(t, basestring)))
+            sentences = _sentences(alphabet, 5)
+            # Long sentences sharing prefixes, some in the language
+            prefix = tuple(random.choice(alphabet) for _ in xrange(30))
+            sentences += [prefix[:n] + s for n in xrange(0, 31, 5) for s in sentences[:20]]
+            random.shuffle(sentences)
+
+            expected = [recognizer.recognize(s) for s in sentences]
+            self.assertEqual(recognizer.recognize_many(sentences), expected)
+            self.assertEqual(recognizer.recognize_many(sentences + sentences), expected * 2)
+            self.assertTrue(any(expected))
+            self.assertEqual(recognizer.recognize_many([]), [])
+
+
+def _tables(recognizer):
+    """
+    Reads the tables of a CYKRecognizer in terms of nonterminals rather
+    than IDs, which depend on the order rules were added in.
+
+    :type recognizer: CYKRecognizer
+    :param recognizer: A recognizer
+
+    :rtype: tuple
+    :return: The start rules, lexical rules and binary rules, as sets
+    """
+    names = dict((i, nt) for nt, i in recognizer._nt_ids.iteritems())
+
+    def nts(mask):
+        return frozenset(names[i] for i in xrange(len(names)) if mask >> i & 1)
+
+    lexical = set((a, nts(mask)) for a, mask in recognizer._lexical.iteritems())
+    binary = set((names[b], names[c], nts(mask))
+                 for (b, c), mask in recognizer._binary.iteritems())
+    right = set((names[b], c) for b, mask in recognizer._right_ids.iteritems()
+                for c in nts(mask))
+    return nts(recognizer._start_ids), lexical, binary, right
+
+
+class CYKRecognizerTest(unittest.TestCase):
+
+    def test_add_remove(self):
+        start = Nonterminal("S")
+        nts = [Nonterminal(n) for n in "ABCD"]
+        rules = [Production(start, [a]) for a in nts[:3]]
+        rules += [Production(a, [t]) for a in nts for t in "ab"]
+        rules += [Production(a, [b, c]) for a in nts for b in nts for c in nts]
+
+        random = Random(0)
+        recognizer = CYKRecognizer(start)
+        for _ in xrange(30):
+            productions = set(random.sample(rules, random.randint(0, 40)))
+            if random.random() < 0.5:
+                recognizer.update(productions)
+            else:
+                for p in recognizer.get_productions() - productions:
+                    recognizer.remove(p)
+                for p in productions:
+                    recognizer.add(p)
+
+            scratch = CYKRecognizer(start, productions)
+            self.assertEqual(recognizer.get_productions(), productions)
+            self.assertEqual(_tables(recognizer), _tables(scratch))
+            for words in _sentences("ab", 4):
+                self.assertEqual(recognizer.recognize(words), scratch.recognize(words), words)
+
+    def test_earley(self):
+        grammar = CFG.fromstring("S -> A | B \n A -> B C | C C | 'a' \n B -> A A | 'b' \n "
+                                 "C -> A B | 'a' | 'b'")
+        cyk = CYKRecognizer(grammar.start(), grammar.productions())
+        earley = EarleyRecognizer(grammar)
+        for words in _sentences("ab", 6):
+            self.assertEqual(cyk.recognize(words), earley.recognize(words), words)
+
+
+if __name__ == "__main__":
+    unittest.main()
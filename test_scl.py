@@ -0,0 +1,157 @@
+"""
+Checks BitContextSets and the SubsetIndex over them against Python sets
+of Contexts.
+
+    python -m unittest test_scl
+"""
+import cPickle as pickle
+import unittest
+from random import Random
+
+from scl import Context, ContextIndex, BitContextSet, ContextSet, SubsetIndex, Sentence, \
+    SentenceSet
+
+CONTEXTS = [Context(left, right) for left in [[], ["a"], ["a", "b"]]
+            for right in [[], ["b"], ["c"]]]
+
+
+def _random_sets(random, num):
+    return [set(c for c in CONTEXTS if random.random() < 0.4) for _ in xrange(num)]
+
+
+def _mask(keys):
+    mask = 0L
+    for key in keys:
+        mask |= 1L << key
+    return mask
+
+
+class BitContextSetTest(unittest.TestCase):
+
+    def test_operations(self):
+        random = Random(0)
+        index = ContextIndex()
+        for first, second, third in zip(*[_random_sets(random, 30)] * 3):
+            a = BitContextSet(first, index)
+            b = BitContextSet(second, index)
+            c = BitContextSet(third, index)
+
+            self.assertEqual(a.get_contexts(), first)
+            self.assertEqual(len(a), len(first))
+            self.assertEqual(sorted(map(str, a)), sorted(map(str, first)))
+            self.assertEqual(a.intersection(b, c).get_contexts(), first & second & third)
+            self.assertEqual(a.difference(b, c).get_contexts(), first - second - third)
+            self.assertEqual(a.union(b).get_contexts(), first | second)
+            self.assertEqual(a.issubset(b), first <= second)
+            self.assertEqual(a.issuperset(b), first >= second)
+            self.assertEqual(a.issubset(a.union(b)), True)
+
+            # Lists of Contexts can stand in for other sets
+            self.assertEqual(a.intersection(list(second)), a.intersection(b))
+            self.assertEqual(a == b, first == second)
+            self.assertEqual(a == list(first), True)
+            for context in CONTEXTS:
+                self.assertEqual(context in a, context in first)
+
+            copy = BitContextSet.from_mask(a.get_mask(), index)
+            copy.intersection_update(b)
+            self.assertEqual(copy.get_contexts(), first & second)
+            copy.update(c)
+            self.assertEqual(copy.get_contexts(), (first & second) | third)
+            self.assertEqual(a.get_contexts(), first)
+
+    def test_hash(self):
+        index = ContextIndex()
+        a = BitContextSet(CONTEXTS[:4], index)
+        b = BitContextSet(reversed(CONTEXTS[:4]), index)
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(len(set([a, b, BitContextSet(CONTEXTS[1:4], index)])), 2)
+
+        b.add(CONTEXTS[5])
+        self.assertNotEqual(a, b)
+        a.set_contexts(CONTEXTS[:6])
+        self.assertTrue(a.issuperset(b))
+
+    def test_index(self):
+        index = ContextIndex()
+        contexts = BitContextSet(CONTEXTS[:3], index)
+        self.assertEqual(len(index), 3)
+
+        # Membership tests do not assign IDs
+        self.assertFalse(CONTEXTS[5] in contexts)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.find(CONTEXTS[5]), None)
+        self.assertEqual(index.get_contexts(), CONTEXTS[:3])
+        self.assertEqual(index.lookup(index.index(CONTEXTS[5])), CONTEXTS[5])
+
+        # Copies keep their contexts, and the default index is CONTEXTS
+        copy = pickle.loads(pickle.dumps(BitContextSet(CONTEXTS[2:5]), -1))
+        self.assertEqual(copy.get_contexts(), set(CONTEXTS[2:5]))
+        self.assertIs(ContextSet, BitContextSet)
+
+    def test_wrap(self):
+        contexts = BitContextSet(CONTEXTS[3:5])
+        sentences = SentenceSet([Sentence(["x"]), Sentence(["y"])])
+        expected = set([Sentence(["a", "x"]), Sentence(["a", "x", "b"]), Sentence(["a", "y"]),
+                        Sentence(["a", "y", "b"])])
+        self.assertEqual(set(contexts.wrap_set(sentences)), expected)
+        self.assertEqual(set(contexts.wrap(Sentence(["x"]))),
+                         set([Sentence(["a", "x"]), Sentence(["a", "x", "b"])]))
+
+
+class SubsetIndexTest(unittest.TestCase):
+
+    def test_lookups(self):
+        random = Random(1)
+        context_index = ContextIndex()
+        sets = _random_sets(random, 40)
+        queries = _random_sets(random, 40)
+
+        # Sets are registered under sparse keys, some in two parts
+        index = SubsetIndex()
+        keys = [3 * i + 1 for i in xrange(len(sets))]
+        for key, contexts in zip(keys, sets):
+            contexts = sorted(contexts, key=str)
+            index.add(key, BitContextSet(contexts[:2], context_index))
+            index.add(key, BitContextSet(contexts[2:], context_index))
+        self.assertEqual(len(index), len(sets))
+        self.assertEqual(index.get_keys(), _mask(keys))
+
+        for query in queries:
+            contexts = BitContextSet(query, context_index)
+            self.assertEqual(index.subsets_of(contexts),
+                             _mask(k for k, s in zip(keys, sets) if s <= query))
+            self.assertEqual(index.intersecting(contexts),
+                             _mask(k for k, s in zip(keys, sets) if s & query))
+
+            # Only the given keys are considered, and unknown keys are
+            # ignored
+            some = set(random.sample(keys, 10))
+            some_mask = _mask(some) | _mask([0, 2, 500])
+            self.assertEqual(index.subsets_of(contexts, some_mask),
+                             _mask(k for k, s in zip(keys, sets) if k in some and s <= query))
+            self.assertEqual(index.intersecting(contexts, some_mask),
+                             _mask(k for k, s in zip(keys, sets) if k in some and s & query))
+            union = set().union(*[s for k, s in zip(keys, sets) if k in some])
+            self.assertEqual(index.union_of(some_mask), context_index.to_mask(union))
+
+    def test_empty(self):
+        context_index = ContextIndex()
+        everything = BitContextSet(CONTEXTS, context_index)
+        index = SubsetIndex()
+        self.assertEqual(index.subsets_of(everything), 0)
+        self.assertEqual(index.union_of(_mask([0, 1])), 0)
+
+        # An empty set is a subset of anything, and intersects nothing
+        index.add(0, BitContextSet([], context_index))
+        index.add(1, BitContextSet(CONTEXTS[:1], context_index))
+        nothing = BitContextSet([], context_index)
+        self.assertEqual(index.subsets_of(nothing), _mask([0]))
+        self.assertEqual(index.subsets_of(everything), _mask([0, 1]))
+        self.assertEqual(index.intersecting(everything), _mask([1]))
+        self.assertEqual(index.intersecting(nothing), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+"""
+Checks the texts the learners read from.
+
+    python -m unittest test_texts
+"""
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from itertools import product
+
+from nltk.grammar import CFG
+from nltk.parse.generate import generate
+
+from oracles import GrammarText, SampledGrammarText, FileText, CorpusText
+from recognizers import EarleyRecognizer
+
+DYCK1 = CFG.fromstring("S -> S S | '(' S ')' | '(' ')'")
+
+
+def _dyck1(words):
+    depth = 0
+    for w in words:
+        depth += 1 if w == "(" else -1
+        if depth < 0:
+            return False
+    return len(words) > 0 and depth == 0
+
+
+LINES = ["a b", "", "b a a", "a b", "  c  ", "b a a", "a a b b", "c", "d e f", "a b"]
+
+
+class GrammarTextTest(unittest.TestCase):
+
+    def test_shortest_first(self):
+        # The grammar is ambiguous, but each string is listed once
+        strings = list(GrammarText(DYCK1, max_length=10))
+        expected = [w for n in xrange(1, 11) for w in product("()", repeat=n) if _dyck1(w)]
+        self.assertEqual(strings, expected)
+
+        text = GrammarText(DYCK1)
+        self.assertEqual([text.next() for _ in xrange(len(expected))], expected)
+
+    def test_finite(self):
+        grammar = CFG.fromstring("S -> A B | B A | A \n A -> 'a' | 'a' 'a' \n B -> 'b'")
+        strings = list(GrammarText(grammar))
+        self.assertEqual(strings, [("a",), ("a", "a"), ("a", "b"), ("b", "a"),
+                                   ("a", "a", "b"), ("b", "a", "a")])
+
+    def test_depth(self):
+        # The depth is still the second parameter, and limits the
+        # strings to those nltk generates to that depth
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            for depth in xrange(1, 6):
+                strings = list(GrammarText(DYCK1, depth))
+                expected = set(tuple(s) for s in generate(DYCK1, depth=depth))
+                self.assertEqual(strings, sorted(expected, key=lambda s: (len(s), s)))
+                self.assertEqual(list(GrammarText(DYCK1, depth=depth)), strings)
+                self.assertEqual(list(GrammarText(DYCK1, depth, 4)),
+                                 [s for s in strings if len(s) <= 4])
+        self.assertTrue(all(issubclass(w.category, DeprecationWarning) for w in caught))
+        self.assertEqual(len(caught), 15)
+
+    def test_resume(self):
+        text = GrammarText(DYCK1, max_length=8)
+        first = [text.next() for _ in xrange(5)]
+        copy = pickle.loads(pickle.dumps(text, -1))
+        self.assertEqual(first + list(copy), list(GrammarText(DYCK1, max_length=8)))
+
+
+class SampledGrammarTextTest(unittest.TestCase):
+
+    def test_strings(self):
+        recognizer = EarleyRecognizer(DYCK1)
+        for max_length in [2, 5, 10]:
+            strings = list(SampledGrammarText(DYCK1, max_length, seed=0))
+            self.assertTrue(len(strings) > 0)
+            self.assertEqual(len(strings), len(set(strings)))
+            for words in strings:
+                self.assertTrue(len(words) <= max_length, words)
+                self.assertTrue(recognizer.recognize(words), words)
+
+        # Short languages are sampled in full
+        expected = [w for n in xrange(1, 7) for w in product("()", repeat=n) if _dyck1(w)]
+        self.assertEqual(sorted(SampledGrammarText(DYCK1, 6, seed=0)), sorted(expected))
+
+    def test_seed(self):
+        def first(seed):
+            text = SampledGrammarText(DYCK1, 20, seed=seed)
+            return [text.next() for _ in xrange(20)]
+
+        self.assertEqual(first(1), first(1))
+        self.assertNotEqual(first(1), first(2))
+
+    def test_weights(self):
+        # 16 strings start with a, and 16 with b
+        grammar = CFG.fromstring("S -> A | B \n A -> 'a' C C C C \n B -> 'b' C C C C \n "
+                                 "C -> 'c' | 'd'")
+        to_a, to_b = [p for p in grammar.productions() if p.lhs() == grammar.start()]
+        for weights, word in [({to_a: 50.}, "a"), ({to_b: 50.}, "b"), ({to_a: 0.}, "b")]:
+            text = SampledGrammarText(grammar, 5, weights=weights, seed=0)
+            strings = [text.next() for _ in xrange(10)]
+            self.assertTrue(sum(s[0] == word for s in strings) >= 9, strings)
+
+        text = SampledGrammarText(grammar, 5, weights={to_a: 0.}, seed=0)
+        self.assertEqual(sorted(set(s[0] for s in text)), ["b"])
+
+    def test_max_tries(self):
+        grammar = CFG.fromstring("S -> 'a' | 'a' 'a' 'a'")
+        for max_tries in [1, 5, 50]:
+            text = SampledGrammarText(grammar, 2, seed=0, max_tries=max_tries)
+            sample = text._sample
+            calls = []
+
+            def counting():
+                calls.append(None)
+                return sample()
+
+            text._sample = counting
+            self.assertEqual(text.next(), ("a",))
+            self.assertEqual(len(calls), 1)
+
+            # Only strings seen before or too long are left
+            del calls[:]
+            self.assertRaises(StopIteration, text.next)
+            self.assertEqual(len(calls), max_tries)
+
+        self.assertEqual(list(SampledGrammarText(grammar, 0, seed=0)), [])
+
+
+class FileTextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = self.write("corpus.txt", LINES)
+        self.texts = []
+
+    def tearDown(self):
+        for text in self.texts:
+            text.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, lines, newline=False):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "wb") as f:
+            f.write("\n".join(lines) + ("\n" if newline else ""))
+        return filename
+
+    def open(self, cls, *args, **kwargs):
+        text = cls(*args, **kwargs)
+        self.texts.append(text)
+        return text
+
+    def test_read(self):
+        text = self.open(FileText, self.filename, skip_seen=False)
+        expected = [tuple(line.split()) for line in LINES if line.strip() != ""]
+        self.assertEqual(list(text), expected)
+
+        # Lines are only returned once, and blank lines are skipped
+        text = self.open(FileText, self.filename)
+        self.assertEqual(list(text), [("a", "b"), ("b", "a", "a"), ("c",), ("a", "a", "b", "b"),
+                                      ("d", "e", "f")])
+
+        text = self.open(FileText, self.write("empty.txt", []))
+        self.assertEqual(list(text), [])
+
+    def test_shards(self):
+        expected = [tuple(line.split()) for line in LINES if line.strip() != ""]
+        for newline in [False, True]:
+            filename = self.write("corpus.txt", LINES, newline)
+            for num_shards in [1, 2, 3, 7, 100]:
+                shards = [list(self.open(FileText, filename, shard=i, num_shards=num_shards,
+                                         skip_seen=False))
+                          for i in xrange(num_shards)]
+                self.assertEqual(sum(shards, []), expected)
+
+    def test_shared_seen(self):
+        # Shards sharing the digests of lines seen skip each other's
+        # lines
+        seen = set()
+        shards = [list(self.open(FileText, self.filename, shard=i, num_shards=3, seen=seen))
+                  for i in xrange(3)]
+        lines = sum(shards, [])
+        self.assertEqual(len(lines), len(set(lines)))
+        self.assertEqual(set(lines), set(tuple(line.split()) for line in LINES if line.strip()))
+
+    def test_resume(self):
+        text = self.open(FileText, self.filename)
+        for _ in xrange(2):
+            text.next()
+        copy = pickle.loads(pickle.dumps(text, -1))
+        self.texts.append(copy)
+        self.assertEqual(list(copy), list(text))
+
+        # Lines read before the offset are only skipped if the digests
+        # seen are passed back
+        text = self.open(FileText, self.filename)
+        first = [text.next() for _ in xrange(2)]
+        resumed = self.open(FileText, self.filename, offset=text.get_offset(),
+                            seen=set(text.get_seen()))
+        self.assertEqual(first + list(resumed), list(self.open(FileText, self.filename)))
+
+        resumed = self.open(FileText, self.filename, offset=text.get_offset())
+        self.assertEqual(list(resumed)[:2], [("a", "b"), ("c",)])
+
+    def test_corpus(self):
+        filenames = [self.write("first.txt", ["a b", "b c"]),
+                     self.write("second.txt", ["b c", "", "c d"], newline=True),
+                     self.write("third.txt", []),
+                     self.write("fourth.txt", ["a b", "d e"])]
+        expected = [("a", "b"), ("b", "c"), ("c", "d"), ("d", "e")]
+        self.assertEqual(list(self.open(CorpusText, filenames)), expected)
+
+        for num_read in xrange(len(expected) + 1):
+            text = self.open(CorpusText, filenames)
+            first = [text.next() for _ in xrange(num_read)]
+            copy = pickle.loads(pickle.dumps(text, -1))
+            self.texts.append(copy)
+            self.assertEqual(first + list(copy), expected)
+
+            resumed = self.open(CorpusText, filenames, offset=text.get_offset(),
+                                seen=set(text.get_seen()))
+            self.assertEqual(first + list(resumed), expected)
+
+        shards = [list(self.open(CorpusText, filenames, shard=i, num_shards=2, skip_seen=False))
+                  for i in xrange(2)]
+        self.assertEqual(sorted(sum(shards, [])), sorted([("a", "b"), ("b", "c"), ("b", "c"),
+                                                          ("c", "d"), ("a", "b"), ("d", "e")]))
+
+
+if __name__ == "__main__":
+    unittest.main()